@@ -0,0 +1,121 @@
+import hashlib
+import json
+
+from autocnet.utils.lru import LRUCache
+
+
+class CameraCache(LRUCache):
+    """
+    A least recently used cache of instantiated sensor models. Building a
+    sensor model from its serialized state is expensive and the same image
+    is often seen many times in a single process (e.g., a cluster worker
+    processing many measures), so the models are cached and shared between
+    all of the nodes that reference the same image.
+
+    Cameras instantiated from a serialized state are keyed by the hash of
+    the state (see state_key). Cameras of the images in a database are keyed
+    by the database and image id (see image_key) and stored with a digest of
+    the stored state, so that only the digest needs to be read from the
+    database to check that the cached camera is current.
+
+    The cache is bounded by an (estimated) memory budget, generally the
+    length of the serialized state of each camera. When adding a camera
+    would exceed the budget, the least recently used cameras are evicted.
+
+    See Also
+    --------
+    autocnet.utils.lru.LRUCache
+    """
+    def __init__(self, max_bytes=2**28):
+        super(CameraCache, self).__init__(max_bytes=max_bytes)
+
+    def get_versioned(self, key, digest):
+        """
+        Get a camera added with put_versioned if it was instantiated from
+        the state with the given digest.
+
+        Parameters
+        ----------
+        key : hashable
+              The cache key, e.g., from image_key
+
+        digest : str
+                 The digest of the current state
+
+        Returns
+        -------
+         : object
+           The cached camera or None if the key is not in the cache or the
+           cached camera is stale
+        """
+        with self._lock:
+            entry = self._get(key)
+            if entry is None or entry[0] != digest:
+                self.misses += 1
+                return
+            self.hits += 1
+            return entry[1]
+
+    def put_versioned(self, key, digest, camera, nbytes=0):
+        """
+        Add a camera along with the digest of the state it was instantiated
+        from.
+
+        Parameters
+        ----------
+        key : hashable
+              The cache key, e.g., from image_key
+
+        digest : str
+                 The digest of the state
+
+        camera : object
+                 The instantiated camera
+
+        nbytes : int
+                 The estimated size of the camera in bytes
+        """
+        self.put(key, (digest, camera), nbytes=nbytes)
+
+def state_key(state):
+    """
+    The cache key for a camera, a digest of its serialized state, e.g.,
+    the camera column of the Cameras table.
+
+    Parameters
+    ----------
+    state : str or bytes
+            The serialized model state
+
+    Returns
+    -------
+     : tuple
+       The cache key
+    """
+    if not isinstance(state, (str, bytes)):
+        state = json.dumps(state, sort_keys=True)
+    if isinstance(state, str):
+        state = state.encode()
+    return ('state', hashlib.sha1(state).hexdigest())
+
+def image_key(url, image_id):
+    """
+    The cache key for the camera of an image in a database.
+
+    Parameters
+    ----------
+    url : sqlalchemy.engine.URL or str
+          The URL of the database
+
+    image_id : int
+               The id of the image
+
+    Returns
+    -------
+     : tuple
+       The cache key
+    """
+    return ('image', str(url), image_id)
+
+# The process wide camera cache, keyed by state_key or image_key
+camera_cache = CameraCache()
@@ -0,0 +1,133 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import threading
+
+from csmapi import csmapi
+import numpy as np
+
+from autocnet.camera.cache import camera_cache, state_key
+
+
+_local = threading.local()
+
+
+def _camera_from_state(state):
+    """
+    Instantiate a sensor model from its serialized state (e.g., from the
+    Cameras table). The models are cached per process, keyed by the hash of
+    the state.
+    """
+    key = state_key(state)
+    camera = camera_cache.get(key)
+    if camera is None:
+        plugin = csmapi.Plugin.findPlugin('UsgsAstroPluginCSM')
+        camera = plugin.constructModelFromState(state)
+        camera_cache.put(key, camera, nbytes=len(state))
+    return camera
+
+
+def _image_to_ground(camera, samples, lines, height):
+    """
+    Project image coordinates to the ground (body fixed x, y, z) with a
+    single camera.
+    """
+    gnd = np.empty((len(samples), 3))
+    for i, (sample, line) in enumerate(zip(samples, lines)):
+        imagecoord = csmapi.ImageCoord(float(line), float(sample))
+        ground = camera.imageToGround(imagecoord, height)
+        gnd[i] = ground.x, ground.y, ground.z
+    return gnd
+
+
+def _project_chunk_from_state(state, samples, lines, height):
+    """
+    Worker for the process executor. The camera is instantiated from the
+    serialized state once per worker process.
+    """
+    return _image_to_ground(_camera_from_state(state), samples, lines, height)
+
+
+def _project_chunk_in_thread(camera, state, samples, lines, height):
+    """
+    Worker for the thread executor. Sensor models are not guaranteed to be
+    thread safe, so if the state is available each thread projects with its
+    own model.
+    """
+    if state is not None:
+        cameras = getattr(_local, 'cameras', None)
+        if cameras is None:
+            cameras = _local.cameras = {}
+        if hash(state) not in cameras:
+            plugin = csmapi.Plugin.findPlugin('UsgsAstroPluginCSM')
+            cameras[hash(state)] = plugin.constructModelFromState(state)
+        camera = cameras[hash(state)]
+    return _image_to_ground(camera, samples, lines, height)
+
+
+def image_to_ground(camera, samples, lines, height=0, executor='serial',
+                    max_workers=None, chunksize=10000, state=None):
+    """
+    Project many image coordinates to the ground using a CSM sensor model.
+    The coordinates are split into chunks that are projected serially, in a
+    thread pool, or in a process pool. Process workers instantiate the
+    sensor model from its serialized state once per process.
+
+    Parameters
+    ----------
+    camera : object
+             A CSM sensor model
+
+    samples : array_like
+              (n,) sample (x) coordinates
+
+    lines : array_like
+            (n,) line (y) coordinates
+
+    height : float
+             The height above the ellipsoid to project to. An elevation at
+             the ellipsoid is plenty accurate for most work.
+
+    executor : {'serial', 'thread', 'process'}
+               How to project the chunks
+
+    max_workers : int
+                  The maximum number of workers for the thread or process
+                  executors. If None, the executor default is used.
+
+    chunksize : int
+                The number of coordinates per chunk
+
+    state : str
+            The serialized state of the sensor model, e.g., from the Cameras
+            table. If None and a thread or process executor is used, the
+            state is taken from the camera.
+
+    Returns
+    -------
+    gnd : ndarray
+          (n, 3) body fixed x, y, z coordinates
+    """
+    samples = np.asarray(samples, dtype=np.float64)
+    lines = np.asarray(lines, dtype=np.float64)
+    if len(samples) != len(lines):
+        raise ValueError('samples and lines must be the same length.')
+
+    if executor == 'serial' or len(samples) <= chunksize:
+        return _image_to_ground(camera, samples, lines, height)
+    if executor not in ('thread', 'process'):
+        raise ValueError(f'{executor} is not a valid executor. Use serial, thread, or process.')
+
+    if state is None:
+        state = camera.getModelState()
+
+    starts = range(0, len(samples), chunksize)
+    if executor == 'thread':
+        pool = ThreadPoolExecutor(max_workers=max_workers)
+        submit = lambda s: pool.submit(_project_chunk_in_thread, camera, state,
+                                       samples[s:s+chunksize], lines[s:s+chunksize], height)
+    else:
+        pool = ProcessPoolExecutor(max_workers=max_workers)
+        submit = lambda s: pool.submit(_project_chunk_from_state, state,
+                                       samples[s:s+chunksize], lines[s:s+chunksize], height)
+    with pool:
+        futures = [submit(s) for s in starts]
+        return np.vstack([f.result() for f in futures])
@@ -0,0 +1,76 @@
+import pytest
+
+from autocnet.camera.cache import CameraCache, image_key, state_key
+
+@pytest.fixture
+def cache():
+    return CameraCache(max_bytes=100)
+
+def test_get_miss(cache):
+    assert cache.get(1) is None
+    assert cache.misses == 1
+    assert cache.hits == 0
+
+def test_put_get(cache):
+    camera = object()
+    cache.put(1, camera, nbytes=10)
+    assert cache.get(1) is camera
+    assert cache.hits == 1
+    assert cache.nbytes == 10
+    assert 1 in cache
+
+def test_lru_eviction(cache):
+    cache.put(1, 'a', nbytes=40)
+    cache.put(2, 'b', nbytes=40)
+    # Touch 1 so that 2 is the least recently used
+    cache.get(1)
+    cache.put(3, 'c', nbytes=40)
+    assert 2 not in cache
+    assert 1 in cache
+    assert 3 in cache
+    assert cache.nbytes == 80
+    assert cache.evictions == 1
+
+def test_put_too_large(cache):
+    cache.put(1, 'a', nbytes=101)
+    assert len(cache) == 0
+
+def test_replace(cache):
+    cache.put(1, 'a', nbytes=40)
+    cache.put(1, 'b', nbytes=30)
+    assert cache.get(1) == 'b'
+    assert cache.nbytes == 30
+
+def test_stats(cache):
+    cache.put(1, 'a', nbytes=10)
+    cache.get(1)
+    cache.get(2)
+    stats = cache.stats
+    assert stats['hits'] == 1
+    assert stats['misses'] == 1
+    assert stats['hit_rate'] == 0.5
+    assert stats['size'] == 1
+    assert stats['nbytes'] == 10
+
+def test_clear(cache):
+    cache.put(1, 'a', nbytes=10)
+    cache.get(1)
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
+    assert cache.hits == 0
+
+def test_state_key():
+    assert state_key('abc') == state_key(b'abc')
+    assert state_key('abc') != state_key('abd')
+    assert state_key({'a':1, 'b':2}) == state_key({'b':2, 'a':1})
+
+def test_versioned(cache):
+    camera = object()
+    cache.put_versioned(image_key('postgresql://db', 1), 'v1', camera, nbytes=10)
+    assert cache.get_versioned(image_key('postgresql://db', 1), 'v1') is camera
+    # The stored state has changed
+    assert cache.get_versioned(image_key('postgresql://db', 1), 'v2') is None
+    assert cache.get_versioned(image_key('postgresql://other', 1), 'v1') is None
+    assert cache.hits == 1
+    assert cache.misses == 2
@@ -0,0 +1,67 @@
+from collections import namedtuple
+from unittest.mock import patch, Mock
+
+import numpy as np
+import pytest
+
+from autocnet.camera import projection
+from autocnet.camera.cache import camera_cache
+
+ImageCoord = namedtuple('ImageCoord', ['line', 'samp'])
+EcefCoord = namedtuple('EcefCoord', ['x', 'y', 'z'])
+
+
+class FakeCamera(object):
+    """
+    A linear sensor model for testing
+    """
+    def __init__(self, state='state'):
+        self.state = state
+
+    def imageToGround(self, imagecoord, height):
+        return EcefCoord(2 * imagecoord.samp, 3 * imagecoord.line, height)
+
+    def getModelState(self):
+        return self.state
+
+
+@pytest.fixture
+def coords():
+    rs = np.random.RandomState(42)
+    return rs.uniform(0, 1000, size=100), rs.uniform(0, 1000, size=100)
+
+@pytest.fixture
+def plugin():
+    plugin = Mock()
+    plugin.constructModelFromState.side_effect = lambda state: FakeCamera(state)
+    with patch('autocnet.camera.projection.csmapi.ImageCoord', ImageCoord, create=True), \
+         patch('autocnet.camera.projection.csmapi.Plugin.findPlugin', return_value=plugin, create=True):
+        yield plugin
+    camera_cache.clear()
+
+def expected(samples, lines, height=0):
+    return np.column_stack((2 * samples, 3 * lines, np.full(len(samples), height)))
+
+def test_image_to_ground_serial(plugin, coords):
+    samples, lines = coords
+    gnd = projection.image_to_ground(FakeCamera(), samples, lines, height=10)
+    np.testing.assert_allclose(gnd, expected(samples, lines, 10))
+    assert plugin.constructModelFromState.call_count == 0
+
+@pytest.mark.parametrize("executor", ['thread', 'process'])
+def test_image_to_ground_executor(plugin, coords, executor):
+    samples, lines = coords
+    gnd = projection.image_to_ground(FakeCamera(), samples, lines, executor=executor,
+                                     max_workers=2, chunksize=30)
+    np.testing.assert_allclose(gnd, expected(samples, lines))
+
+def test_image_to_ground_invalid_executor(plugin, coords):
+    samples, lines = coords
+    with pytest.raises(ValueError):
+        projection.image_to_ground(FakeCamera(), samples, lines, executor='foo', chunksize=10)
+
+def test_camera_from_state_is_cached(plugin):
+    first = projection._camera_from_state('abc')
+    second = projection._camera_from_state('abc')
+    assert first is second
+    assert plugin.constructModelFromState.call_count == 1
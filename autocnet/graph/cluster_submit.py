@@ -2,9 +2,11 @@
 
 import argparse
 import copy
+import hashlib
 import os
 import json
 import sys
+import time
 import warnings
 
 from redis import StrictRedis
@@ -13,8 +15,8 @@ from autocnet.graph.network import NetworkCandidateGraph
 from autocnet.graph.node import NetworkNode
 from autocnet.graph.edge import NetworkEdge
 from autocnet.io.db.model import Points, Measures, Overlay
-from autocnet.utils.utils import import_func
-from autocnet.utils.serializers import JsonEncoder, object_hook
+from autocnet.utils.utils import import_func, walltime_to_seconds
+from autocnet.utils.serializers import JsonEncoder, object_hook, config_hash
 
 
 def parse_args():  # pragma: no cover
@@ -23,9 +25,71 @@ def parse_args():  # pragma: no cover
     parser.add_argument('-p', '--port', help='The port for used by redis.')
     parser.add_argument('processing_queue', help='The name of the processing queue to draw messages from.')
     parser.add_argument('working_queue', help='The name of the queue to push messages to while they process.')
+    parser.add_argument('-n', '--max_messages', type=int, default=1,
+                        help='The maximum number of messages to process before exiting. Pass 0 to process until the queue is empty.')
+    parser.add_argument('-t', '--time_budget', type=float, default=None,
+                        help='The number of seconds this worker may spend processing messages. No new message is started if it is not expected to finish within the budget.')
+    parser.add_argument('-a', '--max_attempts', type=int, default=3,
+                        help='The number of times an expired message is attempted before it is moved to the dead letter list of the working queue.')
 
     return parser.parse_args()
 
+# NetworkCandidateGraphs (and their DB engines, DEM handles, and redis
+# connections) keyed by a hash of the config used to create them. A long lived
+# worker reuses these between messages.
+_ncg_cache = {}
+
+# Configurations that messages reference by key, keyed by the redis key.
+_config_cache = {}
+
+def get_config(queue, key):
+    """
+    Get a configuration dict that was pushed to redis by the NetworkCandidateGraph
+    and is referenced by messages. Configurations are cached, so redis is only
+    queried the first time a key is seen.
+
+    Parameters
+    ----------
+    queue : object
+            PyRedis queue
+
+    key : str
+          The redis key the configuration is stored under
+
+    Returns
+    -------
+     : dict
+       The configuration
+    """
+    if key not in _config_cache:
+        config = queue.get(key)
+        if config is None:
+            raise KeyError(f'Unable to find the configuration {key} in redis.')
+        _config_cache[key] = json.loads(config, object_hook=object_hook)
+    return _config_cache[key]
+
+def get_ncg(config):
+    """
+    Get a NetworkCandidateGraph configured with the given config, reusing
+    a previously created graph if one exists for the same config.
+
+    Parameters
+    ----------
+    config : dict
+             The configuration dict used to set up the graph
+
+    Returns
+    -------
+    ncg : obj
+          An autocnet.graph.network.NetworkCandidateGraph
+    """
+    key = config_hash(config)
+    if key not in _ncg_cache:
+        ncg = NetworkCandidateGraph()
+        ncg.config_from_dict(config)
+        _ncg_cache[key] = ncg
+    return _ncg_cache[key]
+
 def _instantiate_obj(msg, ncg):
     """
     Instantiate either a NetworkNode or a NetworkEdge that is the 
@@ -58,7 +122,7 @@ def _instantiate_row(msg, ncg):
         session.expunge(res) # Disconnect the object from the session
     return res
 
-def process(msg):
+def process(msg, queue=None):
     """
     Given a message, instantiate the necessary processing objects and 
     apply some generic function or method.
@@ -66,10 +130,18 @@ def process(msg):
     Parameters
     ----------
     msg : dict
-          The message that parametrizes the job.
+          The message that parametrizes the job. The message either
+          contains the 'config' or a 'config_key' that references a
+          configuration stored in redis.
+
+    queue : object
+            PyRedis queue used to resolve a 'config_key'
     """
-    ncg = NetworkCandidateGraph()
-    ncg.config_from_dict(msg['config'])
+    if 'config' in msg:
+        config = msg['config']
+    else:
+        config = get_config(queue, msg['config_key'])
+    ncg = get_ncg(config)
     if msg['along'] in ['node', 'edge']:
         obj = _instantiate_obj(msg, ncg)
     elif msg['along'] in ['points', 'measures', 'overlaps', 'images']:
@@ -146,42 +218,351 @@ def finalize_message_from_work_queue(queue, queue_name, remove_key):
     # The operation completed. Remove this message from the working queue.  
     queue.lrem(queue_name, 0, remove_key)
 
+def _in_flight_keys(queue_name):
+    """
+    The names of the redis hash (message id -> message) and sorted set
+    (message id -> deadline) that track in-flight messages for a working queue.
+    """
+    return f'{queue_name}:messages', f'{queue_name}:deadlines'
+
+def _attempt_keys(queue_name):
+    """
+    The names of the redis hash (message id -> number of attempts) and the
+    dead letter list of messages that exhausted their attempts for a working
+    queue.
+    """
+    return f'{queue_name}:attempts', f'{queue_name}:dead'
+
+def get_message_id(msg, msgdict):
+    """
+    Get the unique id for a message. Messages pushed by the NetworkCandidateGraph
+    carry a 'message_id'. For other messages, the id is a hash of the message.
+
+    Parameters
+    ----------
+    msg : str
+          The serialized message
+
+    msgdict : dict
+              The deserialized message
+
+    Returns
+    -------
+     : str
+       The message id
+    """
+    msgid = msgdict.get('message_id') if isinstance(msgdict, dict) else None
+    if msgid is None:
+        if isinstance(msg, str):
+            msg = msg.encode()
+        msgid = hashlib.sha1(msg).hexdigest()
+    return msgid
+
+def track_message(queue, queue_name, msg, msgid, walltime='01:00:00'):
+    """
+    Move a message that was just pushed onto a working queue into the in-flight
+    hash, record the deadline by which it must be acknowledged, and count the
+    attempt. After this call the message can be acknowledged in constant time
+    using its id.
+
+    Parameters
+    ----------
+    queue : object
+            PyRedis queue
+
+    queue_name : str
+                 The name of the working queue the message was pushed to
+
+    msg : str
+          The serialized message
+
+    msgid : str
+            The unique message id
+
+    walltime : str
+               The amount of time the message is allowed to process, in
+               the slurm walltime format
+
+    Returns
+    -------
+     : bool
+       True if the message is now tracked. False if the message was no
+       longer on the working list because requeue_untracked_messages
+       already pushed it back onto the processing queue, in which case the
+       caller must not process it.
+    """
+    messages, deadlines = _in_flight_keys(queue_name)
+    attempts, _ = _attempt_keys(queue_name)
+    deadline = time.time() + walltime_to_seconds(walltime)
+    pipe = queue.pipeline()
+    pipe.hset(messages, msgid, msg)
+    pipe.zadd(deadlines, {msgid:deadline})
+    pipe.hincrby(attempts, msgid, 1)
+    # The message was just pushed onto the head of the working list by rpoplpush,
+    # so removing the first occurrence only needs to scan the head of the list.
+    pipe.lrem(queue_name, 1, msg)
+    *_, removed = pipe.execute()
+    if removed:
+        return True
+
+    # The reaper claimed the message between the rpoplpush and the tracking
+    pipe = queue.pipeline()
+    pipe.hdel(messages, msgid)
+    pipe.zrem(deadlines, msgid)
+    pipe.hincrby(attempts, msgid, -1)
+    pipe.execute()
+    return False
+
+def acknowledge_message(queue, queue_name, msgid):
+    """
+    Remove an in-flight message from a working queue in constant time.
+
+    Parameters
+    ----------
+    queue : object
+            PyRedis queue
+
+    queue_name : str
+                 The name of the working queue
+
+    msgid : str
+            The unique message id
+
+    Returns
+    -------
+     : bool
+       True if the message was in-flight, False if it had already been
+       acknowledged or requeued
+    """
+    messages, deadlines = _in_flight_keys(queue_name)
+    attempts, _ = _attempt_keys(queue_name)
+    pipe = queue.pipeline()
+    pipe.hdel(messages, msgid)
+    pipe.zrem(deadlines, msgid)
+    pipe.hdel(attempts, msgid)
+    removed, _, _ = pipe.execute()
+    return bool(removed)
+
+def requeue_expired_messages(queue, queue_name, processing_queue, now=None, max_attempts=3):
+    """
+    Push in-flight messages whose walltime has passed back onto the processing
+    queue. These are messages whose worker died (e.g., killed by slurm) before
+    acknowledging them, or whose processing failed.
+
+    A message that has already been attempted max_attempts times is pushed
+    onto the dead letter list of the working queue ('<queue_name>:dead')
+    instead, so that a message that always fails (or kills its worker) is
+    not retried forever.
+
+    Parameters
+    ----------
+    queue : object
+            PyRedis queue
+
+    queue_name : str
+                 The name of the working queue
+
+    processing_queue : str
+                       The name of the queue to push expired messages back to
+
+    now : float
+          The current time in seconds since the epoch. Default: time.time()
+
+    max_attempts : int
+                   The number of attempts after which an expired message is
+                   moved to the dead letter list. If None, messages are
+                   always requeued.
+
+    Returns
+    -------
+    nrequeued : int
+                The number of messages that were requeued
+    """
+    if now is None:
+        now = time.time()
+    messages, deadlines = _in_flight_keys(queue_name)
+    attempts, dead = _attempt_keys(queue_name)
+
+    nrequeued = 0
+    for msgid in queue.zrangebyscore(deadlines, '-inf', now):
+        msg = queue.hget(messages, msgid)
+        # hdel is atomic, so only one caller claims each expired message
+        if msg is not None and queue.hdel(messages, msgid):
+            nattempts = int(queue.hget(attempts, msgid) or 0)
+            if max_attempts is not None and nattempts >= max_attempts:
+                warnings.warn(f'Message {msgid.decode() if isinstance(msgid, bytes) else msgid} '
+                              f'expired after {nattempts} attempts and was moved to {dead}.')
+                pipe = queue.pipeline()
+                pipe.rpush(dead, msg)
+                pipe.hdel(attempts, msgid)
+                pipe.execute()
+            else:
+                queue.rpush(processing_queue, msg)
+                nrequeued += 1
+        queue.zrem(deadlines, msgid)
+    return nrequeued
+
+def requeue_untracked_messages(queue, queue_name, processing_queue, grace=60, now=None):
+    """
+    Push messages that are on the working list, but are not tracked, back
+    onto the processing queue. The rpoplpush that moves a message onto the
+    working list and the tracking of the message are separate round trips,
+    so a worker that dies between the two leaves the message on the working
+    list where requeue_expired_messages can not see it.
+
+    A message is only requeued once it has been seen untracked for at least
+    grace seconds. The first time each untracked message is seen is kept in
+    the '<queue_name>:untracked' hash between calls. Both this function and
+    track_message remove the message from the working list with an atomic
+    lrem, so if a live worker is still tracking the message exactly one of
+    them claims it.
+
+    Parameters
+    ----------
+    queue : object
+            PyRedis queue
+
+    queue_name : str
+                 The name of the working queue
+
+    processing_queue : str
+                       The name of the queue to push untracked messages back to
+
+    grace : float
+            The number of seconds a message must be untracked before it is
+            requeued
+
+    now : float
+          The current time in seconds since the epoch. Default: time.time()
+
+    Returns
+    -------
+    nrequeued : int
+                The number of messages that were requeued
+    """
+    if now is None:
+        now = time.time()
+    untracked = f'{queue_name}:untracked'
+    seen = {k.decode() if isinstance(k, bytes) else k: float(v)
+            for k, v in queue.hgetall(untracked).items()}
+
+    nrequeued = 0
+    still_untracked = {}
+    for msg in set(queue.lrange(queue_name, 0, -1)):
+        key = hashlib.sha1(msg.encode() if isinstance(msg, str) else msg).hexdigest()
+        first_seen = seen.get(key, now)
+        if now - first_seen >= grace and queue.lrem(queue_name, 1, msg):
+            queue.rpush(processing_queue, msg)
+            nrequeued += 1
+        else:
+            still_untracked[key] = first_seen
+
+    pipe = queue.pipeline()
+    pipe.delete(untracked)
+    if still_untracked:
+        pipe.hset(untracked, mapping=still_untracked)
+    pipe.execute()
+    return nrequeued
+
 def manage_messages(args, queue):
     """
     This function manages pulling a message from a redis list, atomically pushing 
     the message to another redis list, launching a generic processing job, 
     and finalizing the message by removing it from the intermediary redis list.
 
+    While a message is processing it is tracked, by id, in a redis hash with a
+    deadline derived from the message walltime. Messages whose deadline has
+    passed, and messages left on the working queue without being tracked, are
+    pushed back onto the processing queue before any new messages are pulled.
+
+    Messages are processed until the processing queue is empty, max_messages
+    have been processed, or the time_budget would be exceeded by starting
+    another message. If the worker stops because of the time_budget while
+    messages are still queued, a warning reports them so that more workers
+    can be submitted (e.g., NetworkCandidateGraph.apply with reapply=True).
+    The NetworkCandidateGraph used to process the messages is reused between
+    messages that share a configuration.
+
+    A message that raises is reported and left in-flight, so that it is
+    requeued once its deadline passes, and the worker continues with the
+    next message. After max_attempts a message is moved to the dead letter
+    list of the working queue instead of being requeued.
+
     This function is an easily testable main for the cluster_submit CLI.
 
     Parameters
     ----------
     args : dict
-           A dictionary with queue names that are parsed from the CLI
+           A dictionary with queue names that are parsed from the CLI. The
+           optional max_messages (default 1; 0 for unlimited) and time_budget
+           (seconds; default None for unlimited) keys control how many
+           messages are processed. The optional max_attempts key (default 3)
+           is passed to requeue_expired_messages.
 
     queue : obj
             A py-Redis queue object
 
+    Returns
+    -------
+    nprocessed : int
+                 The number of messages processed, including the messages
+                 that failed
     """
-    # Pop the message from the left queue and push to the right queue; atomic operation
-    msg = transfer_message_to_work_queue(queue, 
-                                         args['processing_queue'],
-                                         args['working_queue'])
-
-    if msg is None:
-        warnings.warn('Expected to process a cluster job, but the message queue is empty.')
-        return
-
-    # The key to remove from the working queue is the message. Essentially, find this element
-    # in the list where the element is the JSON representation of the message. Maybe swap to a hash?
-    remove_key = msg
-
-    # Apply the algorithm
-    response = process(msg)
-    # Should go to a logger someday!
-    print(response)
-
-    finalize_message_from_work_queue(queue, args['working_queue'], remove_key)
+    max_messages = args.get('max_messages', 1)
+    time_budget = args.get('time_budget', None)
+
+    # Give work abandoned by dead workers back to the processing queue
+    requeue_expired_messages(queue, args['working_queue'], args['processing_queue'],
+                             max_attempts=args.get('max_attempts', 3))
+    requeue_untracked_messages(queue, args['working_queue'], args['processing_queue'])
+
+    start = time.time()
+    nprocessed = 0
+    while not max_messages or nprocessed < max_messages:
+        # Do not start a new message if the average message would not finish in the time budget
+        if time_budget is not None and nprocessed > 0:
+            elapsed = time.time() - start
+            if elapsed + elapsed / nprocessed > time_budget:
+                remaining = queue.llen(args['processing_queue'])
+                if remaining:
+                    warnings.warn(f'Stopping after {nprocessed} messages to stay within the time budget. '
+                                  f'{remaining} messages remain on {args["processing_queue"]}; '
+                                  'submit more workers to process them, e.g., with NetworkCandidateGraph.apply(..., reapply=True).')
+                break
+
+        # Pop the message from the left queue and push to the right queue; atomic operation
+        msg = transfer_message_to_work_queue(queue,
+                                             args['processing_queue'],
+                                             args['working_queue'])
+
+        if msg is None:
+            if nprocessed == 0:
+                warnings.warn('Expected to process a cluster job, but the message queue is empty.')
+            break
+
+        # Track the message by id so that it can be acknowledged in constant time
+        msgdict = json.loads(msg, object_hook=object_hook)
+        msgid = get_message_id(msg, msgdict)
+        walltime = msgdict.get('walltime', '01:00:00') if isinstance(msgdict, dict) else '01:00:00'
+        if not track_message(queue, args['working_queue'], msg, msgid, walltime=walltime):
+            # Requeued by another worker's sweep; it will be pulled again
+            continue
+
+        # Apply the algorithm. A failed message is left in-flight so that it is
+        # requeued once its walltime passes and the worker moves on to the
+        # other messages of its job.
+        nprocessed += 1
+        try:
+            response = process(msgdict, queue)
+        except Exception as e:
+            warnings.warn(f'Processing message {msgid} failed and it was left on {args["working_queue"]} '
+                          f'to be requeued -> {e!r}')
+            continue
+        # Should go to a logger someday!
+        print(response)
+
+        acknowledge_message(queue, args['working_queue'], msgid)
+    return nprocessed
 
 def main():  # pragma: no cover
     args = vars(parse_args())
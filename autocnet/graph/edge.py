@@ -1,4 +1,5 @@
 from collections import defaultdict, MutableMapping, Counter
+from contextlib import contextmanager
 from functools import wraps, singledispatch
 import json
 import warnings
@@ -10,6 +11,7 @@ from scipy.spatial.distance import cdist
 from shapely.geometry import Point
 import sqlalchemy
 
+from autocnet.camera import projection
 from autocnet.graph.node import Node
 from autocnet.utils import utils
 from autocnet.matcher import cpu_outlier_detector as od
@@ -27,7 +29,6 @@ from autocnet.io.db.model import Images, Keypoints, Matches,\
 from autocnet.io.db.wrappers import DbDataFrame
 
 from plio.io.io_gdal import GeoDataset
-from csmapi import csmapi
 
 class Edge(dict, MutableMapping):
     """
@@ -221,9 +222,15 @@ class Edge(dict, MutableMapping):
         self.matches['destination_x'] = dkps.values[:,0]
         self.matches['destination_y'] = dkps.values[:,1]
 
-    def project_matches(self, semimajor, semiminor, on='source', srid=None):
+    def project_matches(self, semimajor, semiminor, on='source', srid=None, **kwargs):
         """
         Project matches.
+
+        Parameters
+        ----------
+        kwargs : dict
+                 Passed to autocnet.camera.projection.image_to_ground, e.g.,
+                 executor, max_workers, and chunksize
         """
         try:
             coords = self.matches[['{}_y'.format(on),'{}_x'.format(on)]].values
@@ -239,12 +246,8 @@ class Edge(dict, MutableMapping):
 
         matches = self.matches
 
-        gnd = np.empty((len(coords), 3))
         # Project the points to the surface and reproject into latlon space
-        for i in range(gnd.shape[0]):
-            ic = csmapi.ImageCoord(coords[i][0], coords[i][1])
-            ground = camera.imageToGround(ic, 0)
-            gnd[i] = [ground.x, ground.y, ground.z]
+        gnd = projection.image_to_ground(camera, coords[:,1], coords[:,0], **kwargs)
         lon_og, lat_og, alt = reproject(gnd.T, semimajor, semiminor,
                                     'geocent', 'latlon')
         lon, lat = og2oc(lon_og, lat_og, semimajor, semiminor)
@@ -728,6 +731,19 @@ class Edge(dict, MutableMapping):
         dkps = matches[['destination_x', 'destination_y']]
         return matches
 
+def buffered_operation(func):
+    """
+    Decorator that runs a NetworkEdge method inside of the edge's write
+    behind buffer, so that the matches, costs, and masks are read from the
+    database at most once and written back once when the method returns.
+    """
+    @wraps(func)
+    def wrapper(self, *args, **kwargs):
+        with self.buffered():
+            return func(self, *args, **kwargs)
+    return wrapper
+
+
 class NetworkEdge(Edge):
 
     default_msg = {'sidx':None,
@@ -736,9 +752,82 @@ class NetworkEdge(Edge):
                     'param_step':0,
                     'success':False}
 
+    # The DB backed dataframes that are buffered, in the order that they are written
+    buffered_frames = ('matches', 'costs', 'masks')
+    _frame_cache = None
+
     def __init__(self, *args, **kwargs):
         super(NetworkEdge, self).__init__(*args, **kwargs)
         self.job_status = defaultdict(dict)
+        self._frame_cache = None
+        self._dirty_frames = set()
+
+    @contextmanager
+    def buffered(self):
+        """
+        A context manager that buffers the matches, costs, and masks of the
+        edge. Inside of the context, each dataframe is read from the database
+        the first time that it is accessed and changes are kept in memory.
+        On exit, the changed dataframes are written back to the database in
+        bulk. If an exception is raised, the changes are discarded. Nested
+        contexts share the outermost buffer.
+
+        Examples
+        --------
+        >>> with edge.buffered():
+        ...     edge.compute_fundamental_matrix()
+        ...     edge.compute_homography()
+        """
+        if self._frame_cache is not None:
+            yield self
+            return
+        self._frame_cache = {}
+        self._dirty_frames = set()
+        try:
+            yield self
+            self.flush()
+        finally:
+            self._frame_cache = None
+            self._dirty_frames = set()
+
+    def flush(self):
+        """
+        Write the buffered changes to the matches, costs, and masks to the
+        database. The written dataframes are reread on their next access.
+        """
+        if self._frame_cache is None:
+            return
+        writers = {'matches':self._write_matches,
+                   'costs':self._write_costs,
+                   'masks':self._write_masks}
+        for name in self.buffered_frames:
+            if name in self._dirty_frames:
+                writers[name](self._frame_cache.pop(name))
+                self._dirty_frames.discard(name)
+
+    def _get_frame(self, name, reader):
+        """
+        Get a DB backed dataframe, from the buffer if buffering.
+        """
+        if self._frame_cache is None:
+            return reader()
+        if name not in self._frame_cache:
+            self._frame_cache[name] = reader()
+        return self._frame_cache[name]
+
+    def _set_frame(self, name, v, writer):
+        """
+        Set a DB backed dataframe, in the buffer if buffering.
+        """
+        if self._frame_cache is None:
+            writer(v)
+            return
+        if not isinstance(v, DbDataFrame) or v.parent is not self:
+            index_name = v.index.name
+            v = DbDataFrame(pd.DataFrame(v), parent=self, name=name)
+            v.index.name = index_name
+        self._frame_cache[name] = v
+        self._dirty_frames.add(name)
 
     def _from_db(self, table_obj):
         """
@@ -757,6 +846,7 @@ class NetworkEdge(Edge):
             session.expunge_all()
         return res
 
+    @buffered_operation
     def compute_homography(self, method='ransac', maskname='homography', **kwargs):
         """
         Estimate the homography and reprojective error on this edge of the graph.
@@ -786,6 +876,7 @@ class NetworkEdge(Edge):
 
         self.masks[maskname] = hmask
 
+    @buffered_operation
     def compute_fundamental_matrix(self, method='ransac', maskname='fundamental', **kwargs):
         """
         Estimate the fundamental matrix (F) using the correspondences tagged to this
@@ -849,8 +940,27 @@ class NetworkEdge(Edge):
     def parent(self, parent):
         self._parent = parent
 
+    # Edge operations that repeatedly read and write the matches, costs, and masks
+    add_coordinates_to_matches = buffered_operation(Edge.add_coordinates_to_matches)
+    clean = buffered_operation(Edge.clean)
+    compute_fundamental_error = buffered_operation(Edge.compute_fundamental_error)
+    compute_weights = buffered_operation(Edge.compute_weights)
+    overlap_check = buffered_operation(Edge.overlap_check)
+    project_matches = buffered_operation(Edge.project_matches)
+    ratio_check = buffered_operation(Edge.ratio_check)
+    subpixel_register = buffered_operation(Edge.subpixel_register)
+    suppress = buffered_operation(Edge.suppress)
+    symmetry_check = buffered_operation(Edge.symmetry_check)
+
     @property
     def masks(self):
+        return self._get_frame('masks', self._read_masks)
+
+    @masks.setter
+    def masks(self, v):
+        self._set_frame('masks', v, self._write_masks)
+
+    def _read_masks(self):
         with self.parent.session_scope() as session:
             res = session.query(Edges.masks).\
                                             filter(Edges.source == self.source['node_id']).\
@@ -865,8 +975,7 @@ class NetworkEdge(Edge):
         df.index.name = 'match_id'
         return DbDataFrame(df, parent=self, name='masks')
 
-    @masks.setter
-    def masks(self, v):
+    def _write_masks(self, v):
 
         def dict_check(input):
             for k, v in input.items():
@@ -892,6 +1001,13 @@ class NetworkEdge(Edge):
 
     @property
     def costs(self):
+        return self._get_frame('costs', self._read_costs)
+
+    @costs.setter
+    def costs(self, v):
+        self._set_frame('costs', v, self._write_costs)
+
+    def _read_costs(self):
         # these are np.float coming out, sqlalchemy needs ints
         ids = list(map(int, self.matches.index.values))
         with self.parent.session_scope() as session:
@@ -907,42 +1023,49 @@ class NetworkEdge(Edge):
         return DbDataFrame(df, parent=self, name='costs')
 
 
-    @costs.setter
-    def costs(self, v):
+    def _write_costs(self, v):
+        df = pd.DataFrame(v)
+        ids = [int(i) for i in df.index]
         to_db_add = []
-        # Get the query obj
+        to_db_update = []
         with self.parent.session_scope() as session:
-            q = session.query(Costs)
-            # Need the new instance here to avoid __setattr__ issues
-            df = pd.DataFrame(v)
-            for idx, row in df.iterrows():
+            # A single query for the existing costs rather than one per row
+            existing = {}
+            if ids:
+                existing = {res.match_id:res._cost for res in session.query(Costs).filter(Costs.match_id.in_(ids))}
+            for idx, row in zip(ids, df.to_dict('records')):
                 # Now invert the expanded dict back into a single JSONB column for storage
-                res = q.filter(Costs.match_id == idx).first()
-                if res:
+                if idx in existing:
                     #update the JSON blob
-                    costs_new_or_updated = row.to_dict()
-                    for k, v in costs_new_or_updated.items():
+                    costs = dict(existing[idx] or {})
+                    for k, v in row.items():
                         if v is None:
                             continue
-                        elif np.isnan(v):
+                        elif isinstance(v, float) and np.isnan(v):
                             v = None
-                        res._cost[k] = v
-                    sqlalchemy.orm.attributes.flag_modified(res, '_cost')
-                    session.add(res)
+                        costs[k] = v
+                    to_db_update.append({'match_id':idx, '_cost':costs})
                 else:
-                    row = row.to_dict()
                     costs = row.pop('_costs', {})
                     for k, v in row.items():
-                        if np.isnan(v):
+                        if isinstance(v, float) and np.isnan(v):
                             v = None
                         costs[k] = v
-                    cost = Costs(match_id=idx, _cost=costs)
-                    to_db_add.append(cost)
+                    to_db_add.append(Costs(match_id=idx, _cost=costs))
             if to_db_add:
                 session.bulk_save_objects(to_db_add)
+            if to_db_update:
+                session.bulk_update_mappings(Costs, to_db_update)
 
     @property
     def matches(self):
+        return self._get_frame('matches', self._read_matches)
+
+    @matches.setter
+    def matches(self, v):
+        self._set_frame('matches', v, self._write_matches)
+
+    def _read_matches(self):
         with self.parent.session_scope() as session:
             q = session.query(Matches)
             qf = q.filter(Matches.source == self.source['node_id'],
@@ -952,49 +1075,38 @@ class NetworkEdge(Edge):
             df.index.name = 'id'
         return DbDataFrame(df,  parent=self, name='matches')
 
-    @matches.setter
-    def matches(self, v):
-        to_db_add = []
-        to_db_update = []
+    def _write_matches(self, v):
         df = pd.DataFrame(v)
         df.index.name = v.index.name
-        # Get the query obj
+        # Determine if each row is an update or the addition of a new row
+        if 'id' in df.columns:
+            ids = df['id']
+        elif df.index.name == 'id':
+            ids = pd.Series(df.index, index=df.index)
+        else:
+            ids = pd.Series(np.nan, index=df.index)
+
+        to_db_add = []
+        to_db_update = []
         with self.parent.session_scope() as session:
-            q = session.query(Matches)
-            for idx, row in df.iterrows():
-                # Determine if this is an update or the addition of a new row
-                if hasattr(row, 'id'):
-                    res = q.filter(Matches.id == row.id).first()
-                    match_id = row.id
-                elif v.index.name == 'id':
-                    res = q.filter(Matches.id == row.name).first()
-                    match_id = row.name
-                else:
-                    res = None
-                if res:
+            # A single query for the existing matches rather than one per row
+            candidates = [int(i) for i in ids.dropna().unique()]
+            existing = set()
+            if candidates:
+                existing = {res[0] for res in session.query(Matches.id).filter(Matches.id.in_(candidates))}
+            is_update = ids.isin(existing).values
+
+            columns = [c for c in df.columns if hasattr(Matches, c)]
+            for update, match_id, row in zip(is_update, ids.values, df.to_dict('records')):
+                if update:
                     # update
-                    mapping = {}
-                    mapping['id'] = match_id
-                    for index in row.index:
-                        row_val = row[index]
-                        if isinstance(row_val, (np.int,)):
-                            row_val = int(row_val)
-                        elif isinstance(row_val, (np.float,)):
-                            row_val = float(row_val)
-                        # This should be uncommented if the matches
-                        # df is refactored to be a geodataframe
-                        #elif isinstance(row_val, WKBElement):
-                        #    continue
-                        mapping[index] = row_val
+                    mapping = {k:(v.item() if isinstance(v, np.generic) else v) for k, v in row.items()}
+                    mapping['id'] = int(match_id)
                     to_db_update.append(mapping)
                 else:
-                    match = Matches()
                     # Dynamically iterate over the columns and if the match has an
                     # attribute with the column name, set it.
-                    for c in df.columns:
-                        if hasattr(match, c):
-                            setattr(match, c, row[c])
-                    to_db_add.append(match)
+                    to_db_add.append(Matches(**{c:row[c] for c in columns}))
             if to_db_add:
                 session.bulk_save_objects(to_db_add)
             if to_db_update:
@@ -1002,6 +1114,9 @@ class NetworkEdge(Edge):
 
     @matches.deleter
     def matches(self):
+        if self._frame_cache is not None:
+            self._frame_cache.pop('matches', None)
+            self._dirty_frames.discard('matches')
         with self.parent.session_scope() as session:
             session.query(Matches).filter(Matches.source == self.source['node_id'], Matches.destination == self.destination['node_id']).delete()
 
@@ -1,4 +1,5 @@
 from collections import defaultdict, OrderedDict
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import contextmanager
 import itertools
 import json
@@ -6,6 +7,7 @@ import math
 import os
 from shutil import copyfile
 from time import gmtime, strftime, time
+import uuid
 import warnings
 from itertools import combinations
 
@@ -16,6 +18,8 @@ import numpy as np
 from redis import StrictRedis
 import shapely
 import scipy.special
+from scipy import sparse
+from scipy.sparse import csgraph
 
 import geoalchemy2
 from sqlalchemy.orm.decl_api import DeclarativeMeta
@@ -29,7 +33,6 @@ from plio.io.io_controlnetwork import to_isis, from_isis
 from plio.io import io_hdf, io_json
 from plio.utils import utils as io_utils
 from plio.io.io_gdal import GeoDataset
-from plio.io.isis_serial_number import generate_serial_number
 from plio.io import io_controlnetwork as cnet
 
 
@@ -47,6 +50,8 @@ from autocnet.io.db.model import (Images, Keypoints, Matches, Cameras, Points,
                                   Base, Overlay, Edges, Costs, Measures, CandidateGroundPoints,
                                   JsonEncoder, try_db_creation)
 from autocnet.io.db.connection import new_connection, Parent
+from autocnet.io.metadata import metadata_cache
+from autocnet.matcher import cpu_matcher
 from autocnet.matcher import subpixel
 from autocnet.matcher import cross_instrument_matcher as cim
 from autocnet.vis.graph_view import plot_graph, cluster_plot
@@ -54,6 +59,8 @@ from autocnet.control import control
 from autocnet.spatial.overlap import compute_overlaps_sql
 from autocnet.spatial.isis import point_info
 from autocnet.transformation.spatial import reproject, og2oc
+from autocnet.utils.serializers import config_hash
+from autocnet.utils.utils import walltime_to_seconds, seconds_to_walltime
 
 #np.warnings.filterwarnings('ignore')
 
@@ -64,6 +71,292 @@ MAXSIZE = {0: None,
            8: 12500,
            12: 15310}
 
+# The attributes that edge and node methods mutate. When a function is applied
+# in a process pool, only these (and the dict items) are returned to the parent.
+EDGE_STATE_ATTRIBUTES = ('_matches', '_masks', '_costs', '_weights', 'subpixel_matches')
+NODE_STATE_ATTRIBUTES = ('_keypoints', '_descriptors')
+
+# The attributes that are not sent to a process pool. The nodes of an edge are
+# sent once per chunk and referenced by index. Open GDAL datasets and cameras
+# are rebuilt lazily by the worker, e.g., by Node.geodata.
+EDGE_TRANSIENT_ATTRIBUTES = ('source', 'destination')
+NODE_TRANSIENT_ATTRIBUTES = ('_geodata', '_camera')
+
+def _apply_to_chunk(function, objs, args=(), kwargs={}):
+    """
+    Apply a function to a chunk of nodes or edges. This is the unit of work
+    submitted to a thread pool by CandidateGraph.apply and
+    CandidateGraph.apply_func_to_edges.
+
+    Parameters
+    ----------
+    function : callable or str
+               A function that accepts the object as the first argument or
+               the name of a method on the object
+
+    objs : list
+           of Node or Edge objects
+
+    args : iterable
+           Positional arguments for the function
+
+    kwargs : dict
+             Keyword arguments for the function
+
+    Returns
+    -------
+    res : list
+          of return values, in the order of objs
+    """
+    res = []
+    for obj in objs:
+        if isinstance(function, str):
+            res.append(getattr(obj, function)(*args, **kwargs))
+        else:
+            res.append(function(obj, *args, **kwargs))
+    return res
+
+def _pack(obj, exclude):
+    state = {k:v for k, v in obj.__dict__.items() if k not in exclude}
+    return type(obj), dict(obj), state
+
+def _unpack(cls, items, state):
+    obj = cls.__new__(cls)
+    dict.update(obj, items)
+    obj.__dict__.update(state)
+    return obj
+
+def _pack_chunk(objs):
+    """
+    Reduce a chunk of nodes or edges to the state that is sent to a process
+    pool. Each node is packed once, without its transient attributes, and
+    the edges reference their source and destination by the index of the
+    packed node.
+
+    Parameters
+    ----------
+    objs : list
+           of Node or Edge objects
+
+    Returns
+    -------
+    nodes : list
+            of the Node objects in the chunk
+
+    packed_nodes : list
+                   of (class, dict items, attributes) for each node
+
+    packed_objs : list
+                  of (packed edge or None, index of the node or the
+                  (source, destination) references of the edge)
+    """
+    nodes = []
+    index = {}
+    def node_index(n):
+        if not isinstance(n, Node):
+            # e.g., an edge between node ids
+            return (False, n)
+        if id(n) not in index:
+            index[id(n)] = len(nodes)
+            nodes.append(n)
+        return (True, index[id(n)])
+
+    packed_objs = []
+    for obj in objs:
+        if getattr(obj, 'parent', None) is not None:
+            raise ValueError('{} is attached to a NetworkCandidateGraph. Objects with a database connection '
+                             "can not be sent to a process pool, use executor='thread'.".format(obj))
+        if isinstance(obj, Edge):
+            packed_objs.append((_pack(obj, EDGE_TRANSIENT_ATTRIBUTES),
+                                (node_index(obj.source), node_index(obj.destination))))
+        else:
+            packed_objs.append((None, node_index(obj)[1]))
+
+    for n in nodes:
+        if getattr(n, 'parent', None) is not None:
+            raise ValueError('{} is attached to a NetworkCandidateGraph. Objects with a database connection '
+                             "can not be sent to a process pool, use executor='thread'.".format(n))
+    packed_nodes = [_pack(n, NODE_TRANSIENT_ATTRIBUTES) for n in nodes]
+    return nodes, packed_nodes, packed_objs
+
+def _apply_to_packed_chunk(function, packed_nodes, packed_objs, args=(), kwargs={},
+                           edge_attributes=EDGE_STATE_ATTRIBUTES, node_attributes=NODE_STATE_ATTRIBUTES):
+    """
+    Rebuild a chunk of nodes and edges packed by _pack_chunk and apply a
+    function to them. This is the unit of work submitted to a process pool.
+
+    Parameters
+    ----------
+    function : callable or str
+               A function that accepts the object as the first argument or
+               the name of a method on the object
+
+    packed_nodes : list
+                   of packed nodes
+
+    packed_objs : list
+                  of packed edges or node references
+
+    args : iterable
+           Positional arguments for the function
+
+    kwargs : dict
+             Keyword arguments for the function
+
+    edge_attributes : iterable
+                      The edge attributes that are returned to the parent
+
+    node_attributes : iterable
+                      The node attributes that are returned to the parent
+
+    Returns
+    -------
+    res : list
+          of (return value, attribute state, dict items) tuples, in the
+          order of packed_objs
+
+    node_res : dict
+               of node index to (attribute state, dict items) for the
+               nodes that were modified
+    """
+    nodes = [_unpack(*n) for n in packed_nodes]
+    originals = [({a:n.__dict__.get(a) for a in node_attributes}, dict(n)) for n in nodes]
+
+    def resolve(ref):
+        is_node, value = ref
+        return nodes[value] if is_node else value
+
+    res = []
+    for packed, ref in packed_objs:
+        if packed is None:
+            obj = nodes[ref]
+        else:
+            obj = _unpack(*packed)
+            source, destination = resolve(ref[0]), resolve(ref[1])
+            obj.source = source
+            obj.destination = destination
+
+        if isinstance(function, str):
+            ret = getattr(obj, function)(*args, **kwargs)
+        else:
+            ret = function(obj, *args, **kwargs)
+
+        if packed is None:
+            res.append((ret, None, None))
+            continue
+        if obj.source is not source or obj.destination is not destination:
+            raise ValueError('The source or destination of {} was replaced. This can not be returned '
+                             "from a process pool, use executor='thread'.".format(obj))
+        state = {a:obj.__dict__[a] for a in edge_attributes if a in obj.__dict__}
+        res.append((ret, state, dict(obj)))
+
+    node_res = {}
+    for i, (n, (attrs, items)) in enumerate(zip(nodes, originals)):
+        state = {a:n.__dict__[a] for a in node_attributes
+                 if a in n.__dict__ and n.__dict__[a] is not attrs[a]}
+        new_items = dict(n)
+        if state or new_items.keys() != items.keys() or any(new_items[k] is not items[k] for k in items):
+            node_res[i] = (state, new_items)
+    return res, node_res
+
+def _apply_with_executor(function, objs, args=(), kwargs={}, executor='serial',
+                         max_workers=None, chunksize=None, edge_attributes=EDGE_STATE_ATTRIBUTES,
+                         node_attributes=NODE_STATE_ATTRIBUTES):
+    """
+    Apply a function to a list of nodes or edges serially, in a thread pool,
+    or in a process pool.
+
+    Parameters
+    ----------
+    function : callable or str
+               A function that accepts the object as the first argument or
+               the name of a method on the object
+
+    objs : list
+           of Node or Edge objects
+
+    args : iterable
+           Positional arguments for the function
+
+    kwargs : dict
+             Keyword arguments for the function
+
+    executor : {'serial', 'thread', 'process'}
+               How to execute the function. Threads and the serial executor
+               mutate the objects in place. Processes operate on copies that
+               are rebuilt from the state of the objects, without their open
+               datasets and cameras. The nodes of the edges are sent once per
+               chunk. The state in edge_attributes and node_attributes (and
+               the dict items) is returned and set on the parent objects.
+               The function must be picklable to use processes and the
+               objects can not be attached to a NetworkCandidateGraph.
+
+    max_workers : int
+                  The number of workers. Default: os.cpu_count()
+
+    chunksize : int
+                The number of objects submitted to a worker at a time.
+                Default: the objects are split into four chunks per worker.
+
+    edge_attributes : iterable
+                      The edge attributes to return from a process pool
+
+    node_attributes : iterable
+                      The node attributes to return from a process pool. If
+                      a node is modified in more than one chunk, an
+                      exception is raised.
+
+    Returns
+    -------
+    res : list
+          of return values, in the order of objs
+    """
+    if executor == 'serial' or len(objs) == 0:
+        return _apply_to_chunk(function, objs, args, kwargs)
+
+    if executor not in ('thread', 'process'):
+        raise ValueError("executor must be one of 'serial', 'thread', or 'process', not {}".format(executor))
+
+    if max_workers is None:
+        max_workers = os.cpu_count() or 1
+    if chunksize is None:
+        chunksize = max(1, math.ceil(len(objs) / (max_workers * 4)))
+    chunks = [objs[i:i+chunksize] for i in range(0, len(objs), chunksize)]
+
+    if executor == 'thread':
+        with ThreadPoolExecutor(max_workers=max_workers) as ex:
+            futures = [ex.submit(_apply_to_chunk, function, chunk, args, kwargs) for chunk in chunks]
+            # Collect in submission order so that the results match objs
+            return [r for f in futures for r in f.result()]
+
+    packed = [_pack_chunk(chunk) for chunk in chunks]
+    with ProcessPoolExecutor(max_workers=max_workers) as ex:
+        futures = [ex.submit(_apply_to_packed_chunk, function, packed_nodes, packed_objs,
+                             args, kwargs, edge_attributes, node_attributes)
+                   for _, packed_nodes, packed_objs in packed]
+        chunk_results = [f.result() for f in futures]
+
+    # Check that each node was modified in at most one chunk before any of
+    # the parent objects are updated
+    modified = {}
+    for (nodes, _, _), (_, node_res) in zip(packed, chunk_results):
+        for i in node_res:
+            if id(nodes[i]) in modified:
+                raise ValueError('{} was modified by more than one worker. Apply the function to the nodes '
+                                 "or use executor='thread'.".format(nodes[i]))
+            modified[id(nodes[i])] = True
+
+    res = []
+    for chunk, (nodes, _, _), (results, node_res) in zip(chunks, packed, chunk_results):
+        for i, (state, items) in node_res.items():
+            nodes[i].__dict__.update(state)
+            nodes[i].update(items)
+        for obj, (ret, state, items) in zip(chunk, results):
+            if state is not None:
+                obj.__dict__.update(state)
+                obj.update(items)
+            res.append(ret)
+    return res
 
 class CandidateGraph(nx.Graph):
     """
@@ -474,15 +767,44 @@ class CandidateGraph(nx.Graph):
             else:
                 n.load_features(in_path, **kwargs)
 
-    def match(self, *args, **kwargs):
+    def match(self, *args, cache_indices=False, max_index_bytes=2**30, **kwargs):
         """
         For all connected edges in the graph, apply feature matching
 
+        Parameters
+        ----------
+        cache_indices : bool
+                        If True, train the FLANN index for each node once
+                        and query all of the node's neighbors against it.
+                        Edges are visited grouped by node so that the
+                        trained indices are reused. Nodes whose keypoints
+                        are subset to an edge's MBR are trained per edge.
+                        Default: False
+
+        max_index_bytes : int
+                          The memory budget, in bytes of descriptors, for the
+                          trained indices held when cache_indices is True.
+                          The least recently used indices are evicted first.
+
+        executor : {'serial', 'thread', 'process'}
+                   How to execute the matching when cache_indices is False.
+                   Matching with cached indices is serial.
+
         See Also
         ----------
         autocnet.graph.edge.Edge.match
+        autocnet.matcher.cpu_matcher.FlannIndexCache
         """
-        self.apply_func_to_edges('match', *args, **kwargs)
+        if not cache_indices:
+            self.apply_func_to_edges('match', *args, **kwargs)
+            return
+
+        index_cache = cpu_matcher.FlannIndexCache(max_bytes=max_index_bytes)
+        try:
+            for edge in cpu_matcher.edges_by_node(self):
+                edge.match(*args, index_cache=index_cache, **kwargs)
+        finally:
+            index_cache.clear()
 
     def decompose_and_match(self, *args, **kwargs):
         """
@@ -565,7 +887,8 @@ class CandidateGraph(nx.Graph):
         mst = nx.minimum_spanning_tree(self)
         return self.create_edge_subgraph(mst.edges())
 
-    def apply_func_to_edges(self, function, nodes=[], *args, **kwargs):
+    def apply_func_to_edges(self, function, nodes=[], *args, executor='serial',
+                            max_workers=None, chunksize=None, **kwargs):
         """
         Iterates over edges using an optional mask and and applies the given function.
         If func is not an attribute of Edge, raises AttributeError
@@ -577,24 +900,39 @@ class CandidateGraph(nx.Graph):
 
         graph_mask_keys : list
                           of keys in graph_masks
+
+        executor : {'serial', 'thread', 'process'}
+                   How to execute the function over the edges. When using
+                   processes, only the edge state (matches, masks, costs,
+                   weights, subpixel matches, and the dict items) and the
+                   keypoints and descriptors of the nodes are returned to
+                   the parent. Default: 'serial'
+
+        max_workers : int
+                      The number of workers for the thread or process pool.
+                      Default: os.cpu_count()
+
+        chunksize : int
+                    The number of edges submitted to a worker at a time
         """
-        return_lis = []
         if callable(function):
             function = function.__name__
 
+        edges = []
         for s, d, edge in self.edges.data('data'):
-            try:
-                func = getattr(edge, function)
-            except:
+            if not hasattr(edge, function):
                 raise AttributeError(function, ' is not an attribute of Edge')
-            else:
-                ret = func(*args, **kwargs)
-                return_lis.append(ret)
+            edges.append(edge)
+
+        return_lis = _apply_with_executor(function, edges, args=args, kwargs=kwargs,
+                                          executor=executor, max_workers=max_workers,
+                                          chunksize=chunksize)
 
         if any(return_lis):
             return return_lis
 
-    def apply(self, function, on='edge', out=None, args=(), **kwargs):
+    def apply(self, function, on='edge', out=None, args=(), executor='serial',
+              max_workers=None, chunksize=None, **kwargs):
         """
         Applys a function to every node or edge, returns collected return
         values. If applying a functions to nodes, then all ignored nodes
@@ -616,6 +954,21 @@ class CandidateGraph(nx.Graph):
         args : iterable
                Some iterable of positional arguments for function.
 
+        executor : {'serial', 'thread', 'process'}
+                   How to execute the function. When using processes, the
+                   function must be picklable and only the node or edge
+                   state is returned to the parent. Nodes that are modified
+                   through more than one chunk of edges raise an exception.
+                   Default: 'serial'
+
+        max_workers : int
+                      The number of workers for the thread or process pool.
+                      Default: os.cpu_count()
+
+        chunksize : int
+                    The number of nodes or edges submitted to a worker at a
+                    time
+
         kwargs : dict
                  keyword args to pass into function.
         """
@@ -633,15 +986,16 @@ class CandidateGraph(nx.Graph):
         if not callable(function):
             raise TypeError('{} is not callable.'.format(function))
 
-        res = []
         obj = 1
         # We just want to the object, not the indices, so slice appropriately
         if options[on] == self.edges_iter:
             obj = 2
-        for elem in options[on](data=True):
-            if getattr(elem[obj], 'ignore', False):
-                continue
-            res.append(function(elem[obj], *args, **kwargs))
+        objs = [elem[obj] for elem in options[on](data=True)
+                if not getattr(elem[obj], 'ignore', False)]
+
+        res = _apply_with_executor(function, objs, args=args, kwargs=kwargs,
+                                   executor=executor, max_workers=max_workers,
+                                   chunksize=chunksize)
 
         if out:
             out = res
@@ -778,7 +1132,7 @@ class CandidateGraph(nx.Graph):
         """
         serials = {}
         for n, node in self.nodes.data('data'):
-            serials[n] = generate_serial_number(node['image_path'])
+            serials[n] = metadata_cache.serial(node['image_path'])
         return serials
 
     @property
@@ -1166,10 +1520,16 @@ class CandidateGraph(nx.Graph):
             else:
                 yield s, d
 
-    def generate_control_network(self, clean_keys=[], mask=None):
+    def generate_control_network(self, clean_keys=[], mask=None, merge_edges=False):
         """
         Generates a fresh control network from edge matches.
 
+        Each end of a match is a measure that is identified by its (image,
+        partner image, keypoint) or, if merge_edges is True, by its (image,
+        keypoint). The correspondences are merged into points by finding the
+        connected components of the graph of measures, so the points do not
+        depend on the order in which the edges and matches are visited.
+
         parameters
         ----------
         clean_keys : list
@@ -1177,65 +1537,79 @@ class CandidateGraph(nx.Graph):
 
         mask
 
-
+        merge_edges : bool
+                      If True, the measures of a keypoint on all of the edges
+                      of an image are merged into a single measure, so that
+                      points can span more than two images. If False
+                      (default), points are formed on each edge independently.
         """
-        def add_measure(lis, key, edge, match_idx, fields, point_id=None):
-            """
-            Create a new measure that is coincident to a given point.  This method does not
-            create the point if is missing.  When a measure is added to the graph, an associated
-            row is added to the measures dataframe.
-
-            Parameters
-            ----------
-            key : hashable
-                      Some hashable id.  In the case of an autocnet graph object the
-                      id should be in the form (image_id, match_id)
-
-            point_id : hashable
-                       The point to link the node to.  This is most likely an integer, but
-                       any hashable should work.
-            """
-            if key in self.measure_to_point.keys():
-                return
-            if point_id == None:
-                point_id = self._point_id
-            self.measure_to_point[key] = point_id
-            # The node_id is a composite key (image_id, correspondence_id), so just grab the image
-            image_id = int(key[0])
-            match_id = int(key[1])
-            lis.append([point_id, image_id, match_id, edge, int(match_idx), *fields, 0, 0, np.inf])
-            self._measure_id += 1
-
-        # TODO: get rid of these wack variables
         self.measure_to_point = {}
         self._measure_id = 0
-        self.point_id = 0
-
-        matches = self.get_matches(clean_keys)
-        cnet_lis = []
-        for match in matches:
-            for row in match.to_records():
-                edge = (row.source_image, row.destination_image)
-                source_key = (row.source_image, row.destination_image, row.source_idx)
-                source_fields = [row.source_x, row.source_y]
-                destin_key = (row.destination_image, row.source_image, row.destination_idx)
-                destin_fields = [row.destination_x, row.destination_y]
-                if self.measure_to_point.get(source_key, None) is not None:
-                    tempid = self.measure_to_point[source_key]
-                    add_measure(cnet_lis, destin_key, edge, row[0],
-                                    destin_fields, point_id=tempid)
-                elif self.measure_to_point.get(destin_key, None) is not None:
-                    tempid = self.measure_to_point[destin_key]
-                    add_measure(cnet_lis, source_key, edge, row[0],
-                                    source_fields, point_id=tempid)
-                else:
-                    add_measure(cnet_lis, source_key, edge, row[0],  source_fields)
-                    add_measure(cnet_lis, destin_key, edge, row[0],  destin_fields)
-                    self._point_id += 1
+        self._point_id = 0
 
-        self.controlnetwork = pd.DataFrame(cnet_lis, columns=self.measures_keys)
+        matches = [match for match in self.get_matches(clean_keys) if len(match)]
+        if not matches:
+            self.controlnetwork = pd.DataFrame(columns=self.measures_keys).astype(self.cnet_dtypes)
+            self.controlnetwork.index.name = 'measure_id'
+            return
+        matches = pd.concat(matches)
+        nmatches = len(matches)
+
+        # Interleave the source and destination ends of the matches so that
+        # the measures are ordered by the match that they first appear in
+        def interleave(source, destination, dtype):
+            arr = np.empty(2 * nmatches, dtype=dtype)
+            arr[0::2] = source
+            arr[1::2] = destination
+            return arr
+
+        image = interleave(matches.source_image.values, matches.destination_image.values, np.int64)
+        partner = interleave(matches.destination_image.values, matches.source_image.values, np.int64)
+        keypoint = interleave(matches.source_idx.values, matches.destination_idx.values, np.int64)
+        x = interleave(matches.source_x.values, matches.destination_x.values, np.float64)
+        y = interleave(matches.source_y.values, matches.destination_y.values, np.float64)
+
+        if merge_edges:
+            keys = np.column_stack((image, keypoint))
+        else:
+            keys = np.column_stack((image, partner, keypoint))
+        _, first, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+        inverse = inverse.ravel()
+        nmeasures = len(first)
+
+        # Each match connects two measures, points are the connected components
+        adjacency = sparse.coo_matrix((np.ones(nmatches, dtype=np.int8), (inverse[0::2], inverse[1::2])),
+                                      shape=(nmeasures, nmeasures))
+        _, labels = csgraph.connected_components(adjacency, directed=False)
+
+        # The first occurrence of each measure is kept and the points are
+        # numbered in the order that they first appear
+        occurrence = np.sort(first)
+        component = labels[inverse[occurrence]]
+        uniq, first_component = np.unique(component, return_index=True)
+        rank = np.empty(labels.max() + 1, dtype=np.int64)
+        rank[uniq[np.argsort(first_component)]] = np.arange(len(uniq))
+        point_id = rank[component]
+
+        row = occurrence // 2
+        source_image = matches.source_image.values[row].astype(np.int64)
+        destination_image = matches.destination_image.values[row].astype(np.int64)
+        self.controlnetwork = pd.DataFrame({'point_id':point_id,
+                                            'image_index':image[occurrence],
+                                            'keypoint_index':keypoint[occurrence],
+                                            'edge':list(zip(source_image.tolist(), destination_image.tolist())),
+                                            'match_idx':matches.index.values[row].astype(np.int64),
+                                            'x':x[occurrence],
+                                            'y':y[occurrence],
+                                            'x_off':0,
+                                            'y_off':0,
+                                            'corr':np.inf}, columns=self.measures_keys)
         self.controlnetwork.index.name = 'measure_id'
 
+        self.measure_to_point = dict(zip(map(tuple, keys[occurrence].tolist()), point_id.tolist()))
+        self._measure_id = len(self.controlnetwork)
+        self._point_id = len(uniq)
+
     def remove_measure(self, idx):
         self.controlnetwork = self.controlnetwork.drop(
             self.controlnetwork.index[idx])
@@ -1250,15 +1624,12 @@ class CandidateGraph(nx.Graph):
         Returns
         -------
         : pd.Series
+          True for the points that are not valid, indexed by point_id
         """
-
-        def func(g):
-            # One and only one measure constraint
-            if g.image_index.duplicated().any():
-                return True
-            else: return False
-
-        return self.controlnetwork.groupby('point_id').apply(func)
+        cn = self.controlnetwork
+        # One and only one measure constraint
+        duplicated = cn.duplicated(['point_id', 'image_index'])
+        return duplicated.groupby(cn['point_id']).any()
 
     def clean_singles(self):
         """
@@ -1266,7 +1637,8 @@ class CandidateGraph(nx.Graph):
         at least two measures.  This is automatically called before writing
         as functions such as subpixel matching can result in orphaned measures.
         """
-        return self.controlnetwork.groupby('point_id').apply(lambda g: g if len(g) > 1 else None)
+        cn = self.controlnetwork
+        return cn[cn.groupby('point_id')['point_id'].transform('size').values > 1]
 
     def to_isis(self, outname, flistpath=None, target="Mars"):  # pragma: no cover
         """
@@ -1274,7 +1646,7 @@ class CandidateGraph(nx.Graph):
         """
         df = self.controlnetwork
 
-        serials = [generate_serial_number(self.nodes[id_]["data"]["image_path"]) for id_ in df["image_index"]]
+        serials = [metadata_cache.serial(self.nodes[id_]["data"]["image_path"]) for id_ in df["image_index"]]
 
         #create columns in the dataframe; zeros ensure plio (/protobuf) will
         #ignore unless populated with alternate values
@@ -1480,9 +1852,39 @@ class NetworkCandidateGraph(CandidateGraph):
         The `redis_queue` object is a redis-py StrictRedis object with API
         documented at: https://redis-py.readthedocs.io/en/latest/#redis.StrictRedis
         """
-        queues = [self.processing_queue, self.completed_queue, self.working_queue]
+        queues = [self.processing_queue, self.completed_queue, self.working_queue,
+                  f'{self.working_queue}:messages', f'{self.working_queue}:deadlines',
+                  f'{self.working_queue}:attempts', f'{self.working_queue}:dead',
+                  f'{self.working_queue}:untracked']
         for q in queues:
             self.redis_queue.delete(q)
+        for key in self.redis_queue.scan_iter(f'{self.processing_queue}:config:*'):
+            self.redis_queue.delete(key)
+
+    def requeue_expired_messages(self, max_attempts=3):
+        """
+        Push messages that have been in-flight on the working queue for longer
+        than their walltime, or that were left on the working queue without
+        being tracked, back onto the processing queue. These are messages
+        whose cluster job was cancelled or killed before finishing. Messages
+        that have been attempted max_attempts times are moved to the
+        '<working_queue>:dead' list instead.
+
+        Parameters
+        ----------
+        max_attempts : int
+                       The number of attempts after which an expired message
+                       is no longer requeued
+
+        Returns
+        -------
+         : int
+           The number of messages requeued
+        """
+        from autocnet.graph.cluster_submit import requeue_expired_messages, requeue_untracked_messages
+        nrequeued = requeue_expired_messages(self.redis_queue, self.working_queue, self.processing_queue,
+                                             max_attempts=max_attempts)
+        return nrequeued + requeue_untracked_messages(self.redis_queue, self.working_queue, self.processing_queue)
 
     def _execute_sql(self, sql):
         """
@@ -1501,38 +1903,83 @@ class NetworkCandidateGraph(CandidateGraph):
         conn.execute(sql)
         conn.close()
 
+    def _push_config(self):
+        """
+        Push the configuration to redis once, under a key derived from the hash
+        of its content, so that messages can reference the configuration
+        instead of each carrying a copy.
+
+        Returns
+        -------
+        key : str
+              The redis key the configuration is stored under
+        """
+        key = f'{self.processing_queue}:config:{config_hash(self.config)}'
+        self.redis_queue.set(key, json.dumps(self.config, cls=JsonEncoder))
+        return key
+
+    def _push_messages(self, messages, batchsize=1000):
+        """
+        Serialize and push messages onto the processing queue using pipelined
+        batches to avoid a round trip to redis per message.
+
+        Parameters
+        ----------
+        messages : iterable
+                   Of message dicts
+
+        batchsize : int
+                    The number of messages to push per pipeline execution
+
+        Returns
+        -------
+        nmessages : int
+                    The number of messages pushed
+        """
+        pipe = self.redis_queue.pipeline(transaction=False)
+        nmessages = 0
+        for msg in messages:
+            pipe.rpush(self.processing_queue, json.dumps(msg, cls=JsonEncoder))
+            nmessages += 1
+            if nmessages % batchsize == 0:
+                pipe.execute()
+        pipe.execute()
+        return nmessages
+
     def _push_obj_messages(self, onobj, function, walltime, args, kwargs):
         """
         Push messages to the redis queue for objects e.g., Nodes and Edges
         """
+        config_key = self._push_config()
 
-        for job_counter, elem in enumerate(onobj.data('data')):
-            if getattr(elem[-1], 'ignore', False):
-                continue
-            # Determine if we are working with an edge or a node
-            if len(elem) > 2:
-                id = (elem[2].source['node_id'],
-                    elem[2].destination['node_id'])
-                image_path = (elem[2].source['image_path'],
-                            elem[2].destination['image_path'])
-                along = 'edge'
-            else:
-                id = (elem[0])
-                image_path = elem[1]['image_path']
-                along = 'node'
-
-            msg = {'id':id,
-                   'along':along,
-                    'func':function,
-                    'args':args,
-                    'kwargs':kwargs,
-                    'walltime':walltime,
-                    'image_path':image_path,
-                    'param_step':1,
-                    'config':self.config}
-
-            self.redis_queue.rpush(self.processing_queue, json.dumps(msg, cls=JsonEncoder))
-        return job_counter + 1
+        def messages():
+            for elem in onobj.data('data'):
+                if getattr(elem[-1], 'ignore', False):
+                    continue
+                # Determine if we are working with an edge or a node
+                if len(elem) > 2:
+                    id = (elem[2].source['node_id'],
+                        elem[2].destination['node_id'])
+                    image_path = (elem[2].source['image_path'],
+                                elem[2].destination['image_path'])
+                    along = 'edge'
+                else:
+                    id = (elem[0])
+                    image_path = elem[1]['image_path']
+                    along = 'node'
+
+                yield {'id':id,
+                       'message_id':uuid.uuid4().hex,
+                       'along':along,
+                       'func':function,
+                       'args':args,
+                       'kwargs':kwargs,
+                       'walltime':walltime,
+                       'image_path':image_path,
+                       'param_step':1,
+                       'config_key':config_key}
+
+        return self._push_messages(messages())
 
     def _push_row_messages(self, query_obj, on, function, walltime, filters, query_string, args, kwargs):
         """
@@ -1541,6 +1988,8 @@ class NetworkCandidateGraph(CandidateGraph):
         if filters and query_string:
             warnings.warn('Use of filters and query_string are mutually exclusive.')
 
+        config_key = self._push_config()
+
         with self.session_scope() as session:
             # Support either an SQL query string, or a simple dict based query
             if query_string:
@@ -1557,30 +2006,26 @@ class NetworkCandidateGraph(CandidateGraph):
 
             if len(res) == 0:
                 raise ValueError('Query returned zero results.')
-            for row in res:
-                msg = {'along':on,
-                        'id':row.id,
-                        'func':function,
-                        'args':args,
-                        'kwargs':kwargs,
-                        'walltime':walltime}
-                msg['config'] = self.config  # Hacky for now, just passs the whole config dict
-                self.redis_queue.rpush(self.processing_queue,
-                                    json.dumps(msg, cls=JsonEncoder))
+            self._push_messages({'along':on,
+                                 'id':row.id,
+                                 'message_id':uuid.uuid4().hex,
+                                 'func':function,
+                                 'args':args,
+                                 'kwargs':kwargs,
+                                 'walltime':walltime,
+                                 'config_key':config_key} for row in res)
             assert len(res) == self.queue_length
         return len(res)
 
     def _push_iterable_message(self, iterable, function, walltime, args, kwargs):
-        for job_counter, item in enumerate(iterable):
-            msg = {'along':item,
-                    'func':function,
-                    'args':args,
-                    'kwargs':kwargs,
-                    'walltime':walltime}
-            msg['config'] = self.config
-            self.redis_queue.rpush(self.processing_queue,
-                                   json.dumps(msg, cls=JsonEncoder))
-        return job_counter + 1
+        config_key = self._push_config()
+        return self._push_messages({'along':item,
+                                    'message_id':uuid.uuid4().hex,
+                                    'func':function,
+                                    'args':args,
+                                    'kwargs':kwargs,
+                                    'walltime':walltime,
+                                    'config_key':config_key} for item in iterable)
 
     def apply(self,
             function,
@@ -1596,6 +2041,7 @@ class NetworkCandidateGraph(CandidateGraph):
             queue=None,
             redis_queue='processing_queue',
             exclude=None,
+            messages_per_job=1,
             **kwargs):
         """
         A mirror of the apply function from the standard CandidateGraph object. This implementation
@@ -1665,6 +2111,15 @@ class NetworkCandidateGraph(CandidateGraph):
                       The redis queue to push messages to that are then pulled by the
                       cluster job this call launches. Options are: 'processing_queue' (default)
                       or 'working_queue'
+
+        messages_per_job : int
+                           The maximum number of messages each cluster job processes before
+                           exiting (default 1). With more than one message per job, fewer jobs
+                           are submitted, the walltime of each job is messages_per_job times the
+                           (per message) walltime, and each job stops pulling messages before it
+                           would exceed its walltime. Messages left on the queue by jobs that
+                           run out of time can be processed with reapply=True.
+
         Returns
         -------
         job_str : str
@@ -1739,6 +2194,15 @@ class NetworkCandidateGraph(CandidateGraph):
         isissetup = f'export ISISROOT={isisroot} && export ISISDATA={isisdata}'
         condasetup = f'conda activate {condaenv}'
         job = f'acn_submit -r={rhost} -p={rport} {processing_queue} {self.working_queue}'
+        job_walltime = walltime
+        if messages_per_job > 1:
+            # Long lived workers get the walltime of all of their messages;
+            # leave some headroom for the job startup in the time budget
+            job_seconds = messages_per_job * walltime_to_seconds(walltime)
+            job_walltime = seconds_to_walltime(job_seconds)
+            time_budget = 0.9 * job_seconds
+            job += f' -n={messages_per_job} -t={time_budget}'
+            job_counter = math.ceil(job_counter / messages_per_job)
         command = f'{condasetup} && {isissetup} && {job}'
 
         if queue == None:
@@ -1747,7 +2211,7 @@ class NetworkCandidateGraph(CandidateGraph):
         submitter = Slurm(command,
                      job_name='AutoCNet',
                      mem_per_cpu=self.config['cluster']['processing_memory'],
-                     time=walltime,
+                     time=job_walltime,
                      partition=queue,
                      output=log_dir+f'/autocnet.{function}-%j')
         job_str = submitter.submit(array='1-{}%{}'.format(job_counter,arraychunk), 
@@ -1864,9 +2328,8 @@ class NetworkCandidateGraph(CandidateGraph):
                        For example, autocnet_14 becomes 14.
         """
         isis_network = cnet.from_isis(path)
-        io_controlnetwork.update_from_jigsaw(isis_network, 
-                                             ncg.measures, 
-                                             ncg.connection, 
+        io_controlnetwork.update_from_jigsaw(isis_network,
+                                             connection=self.engine,
                                              pointid_func=pointid_func)
 
     @classmethod
@@ -2508,6 +2971,23 @@ class NetworkCandidateGraph(CandidateGraph):
     def subpixel_register_point(self, pointid, **kwargs):
         subpixel.subpixel_register_point(self.Session, pointid, **kwargs)
 
+    def subpixel_register_points_batch(self, pointids=None, **kwargs):
+        """
+        Subpixel register the measures of many points, grouped by image pair,
+        with a single bulk update of the measures. See
+        autocnet.matcher.subpixel.subpixel_register_points_batch.
+
+        Parameters
+        ----------
+        pointids : iterable
+                   of point identifiers to register. If None, all of the points
+                   are registered.
+        """
+        if pointids is None:
+            with self.session_scope() as session:
+                pointids = [pid for pid, in session.query(Points.id)]
+        return subpixel.subpixel_register_points_batch(pointids, ncg=self, **kwargs)
+
     def subpixel_regiter_mearure(self, measureid, **kwargs):
         subpixel.subpixel_register_measure(self.Session, measureid, **kwargs)
 
@@ -8,13 +8,17 @@ import numpy as np
 import pandas as pd
 
 from plio.io.io_gdal import GeoDataset
-from plio.io.isis_serial_number import generate_serial_number
 from skimage.transform import resize
 import shapely
 from knoten.csm import generate_latlon_footprint, generate_vrt, create_camera, generate_boundary
+from sqlalchemy.sql import func
 
 from autocnet.matcher import cpu_extractor as fe
 from autocnet.matcher import cpu_outlier_detector as od
+from autocnet.camera import projection
+from autocnet.camera.cache import camera_cache, image_key
+from autocnet.io.metadata import metadata_cache
+from autocnet.io.tiles import tile_cache
 from autocnet.cg import cg
 from autocnet.io.db.model import Images, Keypoints, Matches, Cameras,  Base, Overlay, Edges, Costs, Points, Measures
 from autocnet.io.db.connection import Parent
@@ -176,7 +180,8 @@ class Node(dict, MutableMapping):
     def footprint(self):
         if not getattr(self, '_footprint', None):
             try:
-                self._footprint = shapely.wkt.loads(self.geodata.footprint.GetGeometryRef(0).ExportToWkt())
+                self._footprint = shapely.wkt.loads(metadata_cache.footprint(self['image_path'],
+                                                                             geodata=self.geodata))
             except:
                 return None
         return self._footprint
@@ -190,7 +195,7 @@ class Node(dict, MutableMapping):
         """
         if not hasattr(self, '_isis_serial'):
             try:
-                self._isis_serial = generate_serial_number(self['image_path'])
+                self._isis_serial = metadata_cache.serial(self['image_path'])
             except:
                 self._isis_serial = None
         return self._isis_serial
@@ -241,7 +246,8 @@ class Node(dict, MutableMapping):
 
     def get_array(self, band=1, **kwargs):
         """
-        Get a band as a 32-bit numpy array
+        Get a band as a 32-bit numpy array. Windowed reads, i.e., with
+        pixels passed, are read through the shared tile cache.
 
         Parameters
         ----------
@@ -249,7 +255,7 @@ class Node(dict, MutableMapping):
                The band to read, default 1
         """
 
-        array = self.geodata.read_array(band=band, **kwargs)
+        array = tile_cache.read_array(self.geodata, band=band, **kwargs)
         return array
 
     def get_keypoints(self, index=None):
@@ -399,22 +405,41 @@ class Node(dict, MutableMapping):
         if len(self.keypoints) > 0:
             return True
 
-    def project_keypoints(self):
+    def project_keypoints(self, overwrite=False, **kwargs):
+        """
+        Project the keypoints to the ground, adding the body fixed xm, ym,
+        and zm columns to the keypoints. For network nodes, the keypoints
+        (with the projected coordinates) are written back to the keypoint
+        HDF file, so subsequent calls do not need to reproject.
+
+        Parameters
+        ----------
+        overwrite : bool
+                    If True, reproject keypoints that have already been projected
+
+        kwargs : dict
+                 Passed to autocnet.camera.projection.image_to_ground, e.g.,
+                 executor, max_workers, and chunksize
+
+        Returns
+        -------
+         : bool
+           True if the keypoints are projected
+        """
+        keypoints = self.keypoints
+        projected = ['xm', 'ym', 'zm']
+        if not overwrite and set(projected).issubset(keypoints.columns):
+            return True
+
         if self.camera is None:
             # Without a camera, it is not possible to project
             warnings.warn('Unable to project points, no camera available.')
             return False
-        # Project the sift keypoints to the ground
-        def func(row, args):
-            camera = args[0]
-            imagecoord = csmapi.ImageCoord(float(row[1]), float(row[0]))
-            # An elevation at the ellipsoid is plenty accurate for this work
-            gnd = getattr(camera, 'imageToGround')(imagecoord, 0)
-            return [gnd.x, gnd.y, gnd.z]
-        feats = self.keypoints[['x', 'y']].values
-        gnd = np.apply_along_axis(func, 1, feats, args=(self.camera, ))
-        gnd = pd.DataFrame(gnd, columns=['xm', 'ym', 'zm'], index=self.keypoints.index)
-        self.keypoints = pd.concat([self.keypoints, gnd], axis=1)
+        # Project the sift keypoints to the ground. An elevation at the
+        # ellipsoid is plenty accurate for this work
+        gnd = projection.image_to_ground(self.camera, keypoints['x'].values, keypoints['y'].values, **kwargs)
+        gnd = pd.DataFrame(gnd, columns=projected, index=keypoints.index)
+        self.keypoints = pd.concat([keypoints.drop(columns=projected, errors='ignore'), gnd], axis=1)
 
         return True
 
@@ -592,7 +617,6 @@ class NetworkNode(Node):
 
     @keypoints.setter
     def keypoints(self, kps):
-        session = Session()
         io_keypoints.to_hdf(self.keypoint_file, keypoints=kps)
 
 
@@ -657,16 +681,33 @@ class NetworkNode(Node):
     @property
     def camera(self):
         """
-        Get the camera object from the database.
+        Get the camera object from the database. Instantiated cameras are
+        shared across all of the nodes in the process via the camera cache.
+
+        Only a digest of the stored state is read to check for a cached
+        camera. The state is read and deserialized on a miss, or if the
+        stored state has changed since the camera was cached.
+
+        See Also
+        --------
+        autocnet.camera.cache.CameraCache
         """
         # TODO: This should use knoten once it is stable.
         import csmapi
-        if not getattr(self, '_camera', None):
-            res = self._from_db(Cameras)
-            plugin = csmapi.Plugin.findPlugin('UsgsAstroPluginCSM')
-            if res is not None:
-                self._camera = plugin.constructModelFromState(res.camera)
-        return self._camera
+        if not getattr(self, '_camera', None) and 'node_id' in self.keys():
+            with self.parent.session_scope() as session:
+                key = image_key(session.get_bind().url, self['node_id'])
+                res = session.query(func.md5(Cameras.camera))\
+                             .filter(Cameras.image_id == self['node_id']).first()
+                if res is not None:
+                    self._camera = camera_cache.get_versioned(key, res[0])
+                    if self._camera is None:
+                        state, digest = session.query(Cameras.camera, func.md5(Cameras.camera))\
+                                               .filter(Cameras.image_id == self['node_id']).one()
+                        plugin = csmapi.Plugin.findPlugin('UsgsAstroPluginCSM')
+                        self._camera = plugin.constructModelFromState(state)
+                        camera_cache.put_versioned(key, digest, self._camera, nbytes=len(state))
+        return getattr(self, '_camera', None)
 
     @property
     def footprint(self):
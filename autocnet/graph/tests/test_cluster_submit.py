@@ -1,5 +1,6 @@
 import json
-from unittest.mock import patch
+import time
+from unittest.mock import patch, PropertyMock
 
 import fakeredis
 import numpy as np
@@ -9,6 +10,7 @@ from autocnet.utils.serializers import JsonEncoder, object_hook
 from autocnet.graph import cluster_submit
 from autocnet.graph.node import NetworkNode
 from autocnet.graph.edge import NetworkEdge
+from autocnet.graph.network import NetworkCandidateGraph
 from autocnet.io.db.model import Points
 
 
@@ -64,6 +66,231 @@ def test_manage_complex_messages(args, queue, complex_message, mocker, capfd):
     # Check that the messages are finalizing
     assert queue.llen(args['working_queue']) == 0
 
+def test_manage_messages_drains_queue(args, queue, simple_message, mocker, capfd):
+    for i in range(5):
+        queue.rpush(args['processing_queue'], simple_message)
+    args['max_messages'] = 0
+
+    response_msg = {'success':True, 'results':'Things were good.'}
+    mocker.patch('autocnet.graph.cluster_submit.process', return_value=response_msg)
+
+    nprocessed = cluster_submit.manage_messages(args, queue)
+
+    assert nprocessed == 5
+    assert cluster_submit.process.call_count == 5
+    # Messages are decoded before processing
+    assert cluster_submit.process.call_args[0][0] == json.loads(simple_message)
+    assert queue.llen(args['processing_queue']) == 0
+    assert queue.llen(args['working_queue']) == 0
+
+def test_manage_messages_max_messages(args, queue, simple_message, mocker, capfd):
+    for i in range(5):
+        queue.rpush(args['processing_queue'], simple_message)
+    args['max_messages'] = 3
+
+    mocker.patch('autocnet.graph.cluster_submit.process', return_value={})
+
+    assert cluster_submit.manage_messages(args, queue) == 3
+    assert queue.llen(args['processing_queue']) == 2
+    assert queue.llen(args['working_queue']) == 0
+
+def test_manage_messages_time_budget(args, queue, simple_message, mocker, capfd):
+    for i in range(5):
+        queue.rpush(args['processing_queue'], simple_message)
+    args['max_messages'] = 0
+    args['time_budget'] = 25
+    # Each message takes 10 seconds, so a third message would exceed the budget
+    clock = [0]
+    def process(msg, queue=None):
+        clock[0] += 10
+        return {}
+    mock_time = mocker.patch('autocnet.graph.cluster_submit.time')
+    mock_time.time.side_effect = lambda: clock[0]
+    mocker.patch('autocnet.graph.cluster_submit.process', side_effect=process)
+
+    # The messages left on the queue are reported
+    with pytest.warns(UserWarning, match='3 messages remain'):
+        assert cluster_submit.manage_messages(args, queue) == 2
+    assert queue.llen(args['processing_queue']) == 3
+    assert queue.llen(args['working_queue']) == 0
+
+def test_manage_messages_failure_leaves_message_in_working_queue(args, queue, simple_message, mocker):
+    queue.rpush(args['processing_queue'], simple_message)
+    mocker.patch('autocnet.graph.cluster_submit.process', side_effect=RuntimeError)
+
+    with pytest.warns(UserWarning, match='failed'):
+        cluster_submit.manage_messages(args, queue)
+    # The message is still in-flight so that it can be requeued
+    assert queue.hlen(args['working_queue'] + ':messages') == 1
+    assert queue.zcard(args['working_queue'] + ':deadlines') == 1
+    assert queue.llen(args['working_queue']) == 0
+
+def test_manage_messages_continues_after_failure(args, queue, mocker, capfd):
+    for i in range(3):
+        queue.rpush(args['processing_queue'], json.dumps({'message_id':str(i)}))
+    def process(msgdict, queue):
+        if msgdict['message_id'] == '1':
+            raise RuntimeError('bad message')
+        return msgdict['message_id']
+    mocker.patch('autocnet.graph.cluster_submit.process', side_effect=process)
+
+    with pytest.warns(UserWarning, match='message 1 failed'):
+        assert cluster_submit.manage_messages(dict(args, max_messages=0), queue) == 3
+    # The other messages of the job are processed and acknowledged
+    out, _ = capfd.readouterr()
+    assert sorted(out.split()) == ['0', '2']
+    assert queue.llen(args['processing_queue']) == 0
+    assert queue.hkeys(args['working_queue'] + ':messages') == [b'1']
+
+def test_track_and_acknowledge_message(args, queue, simple_message):
+    queue.rpush(args['processing_queue'], simple_message)
+    msg = cluster_submit.transfer_message_to_work_queue(queue, args['processing_queue'], args['working_queue'])
+    msgid = cluster_submit.get_message_id(msg, json.loads(msg))
+    cluster_submit.track_message(queue, args['working_queue'], msg, msgid, walltime='00:10')
+
+    assert queue.llen(args['working_queue']) == 0
+    assert queue.hget(args['working_queue'] + ':messages', msgid) == msg
+    assert queue.zscore(args['working_queue'] + ':deadlines', msgid) > 0
+
+    assert cluster_submit.acknowledge_message(queue, args['working_queue'], msgid)
+    assert queue.hlen(args['working_queue'] + ':messages') == 0
+    assert queue.zcard(args['working_queue'] + ':deadlines') == 0
+    # A second ack is a no-op
+    assert not cluster_submit.acknowledge_message(queue, args['working_queue'], msgid)
+
+@pytest.mark.parametrize("msgdict, expected", [({'message_id':'abc'}, 'abc'),
+                                               ({'foo':'bar'}, None)])
+def test_get_message_id(msgdict, expected):
+    msg = json.dumps(msgdict)
+    msgid = cluster_submit.get_message_id(msg, msgdict)
+    if expected is None:
+        # Messages without an id are identified by their content
+        assert msgid == cluster_submit.get_message_id(msg.encode(), msgdict)
+    else:
+        assert msgid == expected
+
+def test_requeue_expired_messages(args, queue):
+    for i, walltime in enumerate(['00:01', '01:00:00']):
+        msg = json.dumps({'message_id':str(i)})
+        queue.rpush(args['working_queue'], msg)
+        cluster_submit.track_message(queue, args['working_queue'], msg, str(i), walltime=walltime)
+
+    # Nothing has expired yet
+    assert cluster_submit.requeue_expired_messages(queue, args['working_queue'], args['processing_queue']) == 0
+
+    nrequeued = cluster_submit.requeue_expired_messages(queue, args['working_queue'],
+                                                        args['processing_queue'], now=time.time() + 120)
+    assert nrequeued == 1
+    assert json.loads(queue.lpop(args['processing_queue'])) == {'message_id':'0'}
+    assert queue.hexists(args['working_queue'] + ':messages', '1')
+    assert not queue.hexists(args['working_queue'] + ':messages', '0')
+
+def test_requeue_expired_messages_dead_letter(args, queue):
+    msg = json.dumps({'message_id':'bad'})
+    for attempt in range(3):
+        queue.rpush(args['working_queue'], msg)
+        cluster_submit.track_message(queue, args['working_queue'], msg, 'bad', walltime='00:00')
+        assert int(queue.hget(args['working_queue'] + ':attempts', 'bad')) == attempt + 1
+        nrequeued = cluster_submit.requeue_expired_messages(queue, args['working_queue'], args['processing_queue'],
+                                                            now=time.time() + 1, max_attempts=3)
+        if attempt < 2:
+            assert nrequeued == 1
+            assert queue.rpoplpush(args['processing_queue'], args['working_queue']) == msg.encode()
+            queue.lrem(args['working_queue'], 1, msg)
+
+    # The third expiry moves the message to the dead letter list
+    assert nrequeued == 0
+    assert queue.llen(args['processing_queue']) == 0
+    assert queue.lrange(args['working_queue'] + ':dead', 0, -1) == [msg.encode()]
+    assert not queue.hexists(args['working_queue'] + ':attempts', 'bad')
+
+def test_acknowledge_message_clears_attempts(args, queue):
+    msg = json.dumps({'message_id':'0'})
+    queue.rpush(args['working_queue'], msg)
+    cluster_submit.track_message(queue, args['working_queue'], msg, '0')
+    cluster_submit.acknowledge_message(queue, args['working_queue'], '0')
+    assert queue.hlen(args['working_queue'] + ':attempts') == 0
+
+def test_requeue_untracked_messages(args, queue):
+    # A worker died between the rpoplpush and tracking the message
+    msg = json.dumps({'message_id':'orphan'})
+    queue.rpush(args['working_queue'], msg)
+
+    now = time.time()
+    assert cluster_submit.requeue_untracked_messages(queue, args['working_queue'], args['processing_queue'],
+                                                     grace=60, now=now) == 0
+    assert queue.hlen(args['working_queue'] + ':untracked') == 1
+    assert cluster_submit.requeue_untracked_messages(queue, args['working_queue'], args['processing_queue'],
+                                                     grace=60, now=now + 61) == 1
+    assert queue.llen(args['working_queue']) == 0
+    assert queue.lrange(args['processing_queue'], 0, -1) == [msg.encode()]
+    assert queue.hlen(args['working_queue'] + ':untracked') == 0
+
+def test_track_message_after_untracked_requeue(args, queue):
+    queue.rpush(args['processing_queue'], json.dumps({'message_id':'slow'}))
+    msg = cluster_submit.transfer_message_to_work_queue(queue, args['processing_queue'], args['working_queue'])
+    # The sweep claims the message before the worker tracks it
+    assert cluster_submit.requeue_untracked_messages(queue, args['working_queue'], args['processing_queue'],
+                                                     grace=0) == 1
+
+    assert not cluster_submit.track_message(queue, args['working_queue'], msg, 'slow')
+    assert queue.hlen(args['working_queue'] + ':messages') == 0
+    assert queue.zcard(args['working_queue'] + ':deadlines') == 0
+    assert int(queue.hget(args['working_queue'] + ':attempts', 'slow')) == 0
+    assert queue.llen(args['processing_queue']) == 1
+
+def test_manage_messages_requeues_expired(args, queue, mocker):
+    msg = json.dumps({'message_id':'expired'})
+    queue.rpush(args['working_queue'], msg)
+    cluster_submit.track_message(queue, args['working_queue'], msg, 'expired', walltime='00:00')
+    mocker.patch('autocnet.graph.cluster_submit.process', return_value={})
+
+    assert cluster_submit.manage_messages(args, queue) == 1
+    cluster_submit.process.assert_called_once_with({'message_id':'expired'}, queue)
+    assert queue.hlen(args['working_queue'] + ':messages') == 0
+
+def test_get_ncg_reuses_graph(mocker):
+    mocker.patch('autocnet.graph.network.NetworkCandidateGraph.config_from_dict')
+    cluster_submit._ncg_cache.clear()
+
+    ncg = cluster_submit.get_ncg({'a':1, 'b':{'c':2}})
+    assert cluster_submit.get_ncg({'b':{'c':2}, 'a':1}) is ncg
+    assert cluster_submit.get_ncg({'a':2}) is not ncg
+    assert len(cluster_submit._ncg_cache) == 2
+    cluster_submit._ncg_cache.clear()
+
+def test_config_by_reference(args, queue, mocker):
+    ncg = NetworkCandidateGraph()
+    ncg.redis_queue = queue
+    ncg.processing_queue = args['processing_queue']
+    ncg.config = {'database':{'name':'foo'}, 'redis':{'host':'localhost'}}
+
+    njobs = ncg._push_iterable_message([1, 2, 3], _do_nothing, '00:10:00', (), {})
+    assert njobs == 3
+    assert queue.llen(args['processing_queue']) == 3
+
+    # The config is stored once and referenced by the messages
+    msgs = [json.loads(m, object_hook=object_hook) for m in queue.lrange(args['processing_queue'], 0, -1)]
+    assert all('config' not in m for m in msgs)
+    assert len({m['config_key'] for m in msgs}) == 1
+    assert len({m['message_id'] for m in msgs}) == 3
+
+    cluster_submit._config_cache.clear()
+    cluster_submit._ncg_cache.clear()
+    config_from_dict = mocker.patch('autocnet.graph.network.NetworkCandidateGraph.config_from_dict')
+    mocker.patch('autocnet.graph.network.NetworkCandidateGraph.Session', return_value=True)
+    for m in msgs:
+        assert cluster_submit.process(m, queue)['results'] == True
+    # The config is resolved once and the graph reused for every message
+    config_from_dict.assert_called_once_with(ncg.config)
+    assert list(cluster_submit._config_cache.values()) == [ncg.config]
+    cluster_submit._config_cache.clear()
+    cluster_submit._ncg_cache.clear()
+
+def test_get_config_missing(queue):
+    with pytest.raises(KeyError):
+        cluster_submit.get_config(queue, 'processing:config:missing')
+
 def test_transfer_message_to_work_queue(args, queue, simple_message):
     queue.rpush(args['processing_queue'], simple_message)
     cluster_submit.transfer_message_to_work_queue(queue, args['processing_queue'], args['working_queue'])
@@ -183,4 +410,28 @@ def test_instantiate_row(msg, expected, mocker):
     mock_ncg.session_scope.return_value.__enter__.return_value.query.return_value.filter.return_value.one.return_value = expected()
 
     obj = cluster_submit._instantiate_row(msg, mock_ncg)
-    assert isinstance(obj, expected)
\ No newline at end of file
+    assert isinstance(obj, expected)
+
+@pytest.mark.parametrize("messages_per_job, njobs, time, budget", [(1, 10, '01:30:00', None),
+                                                                  (4, 3, '06:00:00', '-t=19440.0'),
+                                                                  (20, 1, '1-06:00:00', '-t=97200.0')])
+def test_apply_messages_per_job(messages_per_job, njobs, time, budget):
+    ncg = NetworkCandidateGraph()
+    ncg.config = {'redis':{'host':'localhost', 'port':6379},
+                  'env':{'conda':'autocnet', 'ISISROOT':'/isis', 'ISISDATA':'/isisdata'},
+                  'cluster':{'cluster_log_dir':'/logs', 'queue':'shared', 'processing_memory':4000}}
+    ncg.processing_queue = 'processing'
+    ncg.working_queue = 'working'
+    with patch.object(NetworkCandidateGraph, 'queue_length', new_callable=PropertyMock, return_value=10), \
+         patch('autocnet.graph.network.Slurm') as slurm:
+        ncg.apply('func', reapply=True, walltime='01:30:00', messages_per_job=messages_per_job)
+
+    command = slurm.call_args[0][0]
+    # The job walltime covers all of the messages that the job may process
+    assert slurm.call_args[1]['time'] == time
+    assert slurm.return_value.submit.call_args[1]['array'] == f'1-{njobs}%25'
+    if budget is None:
+        assert '-t=' not in command
+    else:
+        assert budget in command
+        assert f'-n={messages_per_job}' in command
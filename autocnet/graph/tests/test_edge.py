@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import Mock, MagicMock
+from unittest.mock import Mock, MagicMock, patch
 import pytest
 
 import ogr
@@ -11,6 +11,8 @@ from shapely.geometry import Polygon as Poly
 from autocnet.matcher import cpu_outlier_detector as od
 from autocnet.examples import get_path
 from autocnet.graph.network import CandidateGraph
+from autocnet.io.db.model import Costs, Matches
+from autocnet.io.db.wrappers import DbDataFrame
 from autocnet.utils.utils import array_to_poly
 
 from .. import edge
@@ -344,4 +346,87 @@ class TestEdge(unittest.TestCase):
             d = node.Node(node_id=1)
 
             e = edge.Edge(s, d)
-            e.matches = ['a', 'b', 'c']
\ No newline at end of file
+            e.matches = ['a', 'b', 'c']
+
+@pytest.fixture
+def network_edge():
+    e = edge.NetworkEdge(source=Mock(node.Node), destination=Mock(node.Node))
+    session = MagicMock()
+    e.parent = MagicMock()
+    e.parent.session_scope.return_value.__enter__.return_value = session
+    return e, session
+
+def test_network_edge_buffered(network_edge):
+    e, _ = network_edge
+    df = DbDataFrame(pd.DataFrame({'source_idx':[0, 1]}), parent=e, name='matches')
+    with patch.object(edge.NetworkEdge, '_read_matches', return_value=df) as read, \
+         patch.object(edge.NetworkEdge, '_write_matches') as write:
+        with e.buffered():
+            assert e.matches is e.matches
+            e.matches['destination_idx'] = [3, 4]
+            with e.buffered():
+                e.matches = e.matches[e.matches.source_idx > 0]
+            assert write.call_count == 0
+        assert read.call_count == 1
+        assert write.call_count == 1
+        written = write.call_args[0][0]
+        assert written.destination_idx.tolist() == [4]
+
+        # Outside of the buffer, reads go directly to the DB
+        e.matches
+        e.matches
+        assert read.call_count == 3
+
+def test_network_edge_flush(network_edge):
+    e, _ = network_edge
+    masks = DbDataFrame(pd.DataFrame({'ratio':[True]}), parent=e, name='masks')
+    with patch.object(edge.NetworkEdge, '_read_masks', return_value=masks) as read, \
+         patch.object(edge.NetworkEdge, '_write_masks') as write:
+        with e.buffered():
+            e.masks['fundamental'] = [False]
+            e.flush()
+            assert write.call_count == 1
+            # Flushed frames are reread
+            e.masks
+            assert read.call_count == 2
+        assert write.call_count == 1
+
+def test_network_edge_buffer_discarded_on_error(network_edge):
+    e, _ = network_edge
+    df = DbDataFrame(pd.DataFrame({'source_idx':[0, 1]}), parent=e, name='matches')
+    with patch.object(edge.NetworkEdge, '_read_matches', return_value=df), \
+         patch.object(edge.NetworkEdge, '_write_matches') as write:
+        with pytest.raises(ValueError):
+            with e.buffered():
+                e.matches = e.matches.iloc[:1]
+                raise ValueError
+    assert write.call_count == 0
+    assert e._frame_cache is None
+
+def test_network_edge_write_matches(network_edge):
+    e, session = network_edge
+    session.query.return_value.filter.return_value = [(1,), (2,)]
+    df = pd.DataFrame({'source':[0, 0, 0], 'destination':[1, 1, 1],
+                       'source_idx':[5, 6, 7]}, index=pd.Index([1, 2, 3], name='id'))
+    e._write_matches(df)
+    assert session.query.call_count == 1
+
+    updates = session.bulk_update_mappings.call_args[0]
+    assert updates[0] is Matches
+    assert [u['id'] for u in updates[1]] == [1, 2]
+    assert updates[1][1]['source_idx'] == 6
+
+    added = session.bulk_save_objects.call_args[0][0]
+    assert len(added) == 1
+    assert added[0].source_idx == 7
+
+def test_network_edge_write_costs(network_edge):
+    e, session = network_edge
+    session.query.return_value.filter.return_value = [Costs(match_id=1, _cost={'a':1.0})]
+    df = pd.DataFrame({'b':[2.0, np.nan]}, index=[1, 2])
+    e._write_costs(df)
+    assert session.query.call_count == 1
+    session.bulk_update_mappings.assert_called_once_with(Costs, [{'match_id':1, '_cost':{'a':1.0, 'b':2.0}}])
+    added = session.bulk_save_objects.call_args[0][0]
+    assert added[0].match_id == 2
+    assert added[0]._cost == {'b':None}
@@ -332,6 +332,67 @@ def test_generate_control_network(candidategraph):
     for i, g in cn.groupby('point_id'):
         assert len(g) == 2
 
+def _cnet_matches():
+    # Source keypoint 0 in image 0 matches two keypoints in image 1 (k=2)
+    # and keypoint 5 in image 2
+    def frame(rows, index):
+        df = pd.DataFrame(rows, columns=['source_image', 'source_idx',
+                                         'destination_image', 'destination_idx'], index=index)
+        for prefix in ['source', 'destination']:
+            df[prefix + '_x'] = df[prefix + '_idx'] * 10.0
+            df[prefix + '_y'] = df[prefix + '_idx'] * 20.0
+        return df
+    return [frame([[0, 0, 1, 0], [0, 0, 1, 1], [0, 1, 1, 2]], [10, 11, 12]),
+            frame([[0, 0, 2, 5]], [20])]
+
+def _cnet_points(cn, merge_edges=False):
+    keys = ['image_index', 'keypoint_index'] if merge_edges else ['image_index', 'edge', 'keypoint_index']
+    return sorted(sorted(map(tuple, g[keys].values.tolist())) for _, g in cn.groupby('point_id'))
+
+@pytest.mark.parametrize("merge_edges, npoints", [(False, 3), (True, 2)])
+def test_generate_control_network_components(merge_edges, npoints):
+    cg = network.CandidateGraph()
+    matches = _cnet_matches()
+    with patch.object(network.CandidateGraph, 'get_matches', return_value=matches):
+        cg.generate_control_network(merge_edges=merge_edges)
+    cn = cg.controlnetwork
+    assert list(cn.columns) == cg.measures_keys
+    assert cn.point_id.nunique() == npoints
+    assert cn.point_id.drop_duplicates().tolist() == list(range(npoints))
+    assert len(cg.measure_to_point) == len(cn)
+
+    first = cn.iloc[0]
+    assert (first.image_index, first.keypoint_index, first.edge, first.match_idx) == (0, 0, (0, 1), 10)
+    assert (first.x, first.y) == (0.0, 0.0)
+
+    if merge_edges:
+        point = cn[cn.point_id == 0]
+        assert sorted(zip(point.image_index, point.keypoint_index)) == [(0, 0), (1, 0), (1, 1), (2, 5)]
+
+    # Image 1 is in the first point twice
+    invalid = cg.validate_points()
+    assert invalid.tolist() == [True] + [False] * (npoints - 1)
+
+    # The points do not depend on the order of the edges or the matches
+    expected = _cnet_points(cn, merge_edges)
+    shuffled = [m.iloc[::-1] for m in matches[::-1]]
+    with patch.object(network.CandidateGraph, 'get_matches', return_value=shuffled):
+        cg.generate_control_network(merge_edges=merge_edges)
+    assert _cnet_points(cg.controlnetwork, merge_edges) == expected
+
+def test_generate_control_network_no_matches():
+    cg = network.CandidateGraph()
+    with patch.object(network.CandidateGraph, 'get_matches', return_value=[]):
+        cg.generate_control_network()
+    assert len(cg.controlnetwork) == 0
+    assert list(cg.controlnetwork.columns) == cg.measures_keys
+
+def test_clean_singles():
+    cg = network.CandidateGraph()
+    cg.controlnetwork = pd.DataFrame({'point_id':[0, 0, 1, 2, 2, 2],
+                                      'image_index':[0, 1, 0, 0, 1, 2]})
+    assert cg.clean_singles().point_id.tolist() == [0, 0, 2, 2, 2]
+
 def test_set_maxsize(graph):
     maxsizes = network.MAXSIZE
     assert(graph.maxsize == maxsizes[0])
@@ -376,6 +437,80 @@ def test_apply(graph):
         assert len(matches) == 3
     assert len(matches) == len(graph.edges)
 
+def set_fake_matches(e):
+    e.matches = pd.DataFrame(['fake', 'fake', 'fake'])
+    e['fundamental_matrix'] = np.eye(3)
+    return len(e.matches)
+
+@pytest.mark.parametrize("executor", ['thread', 'process'])
+def test_apply_executor(graph, executor):
+    results = graph.apply(set_fake_matches, executor=executor, max_workers=2, chunksize=1)
+    assert results == [3] * len(graph.edges)
+
+    # The mutated edge state is set on the parent graph's edges
+    for s, d, e in graph.edges.data('data'):
+        assert len(e.matches) == 3
+        np.testing.assert_array_equal(e['fundamental_matrix'], np.eye(3))
+
+@pytest.fixture()
+def handle_graph():
+    # Nodes with an unpicklable open dataset handle, like a GDAL dataset
+    import threading
+    g = network.CandidateGraph()
+    nodes = [node.Node(image_name=str(i), node_id=i) for i in range(3)]
+    for n in nodes:
+        n._geodata = threading.Lock()
+    for s, d in [(0, 1), (0, 2)]:
+        g.add_edge(s, d, data=edge.Edge(nodes[s], nodes[d]))
+    for i, n in enumerate(nodes):
+        g.nodes[i]['data'] = n
+    return g
+
+def set_destination_keypoints(e):
+    e.destination.keypoints = pd.DataFrame({'x':[e.destination['node_id']]})
+    e.matches = pd.DataFrame({'source_idx':[0]})
+    return '_geodata' in e.destination.__dict__
+
+def set_source_keypoints(e):
+    e.source.keypoints = pd.DataFrame({'x':[0]})
+
+def replace_source(e):
+    e.source = node.Node(node_id=5)
+
+def test_apply_process_rebuilds_nodes(handle_graph):
+    results = handle_graph.apply(set_destination_keypoints, executor='process', max_workers=2, chunksize=1)
+    # The handles are not sent to the workers
+    assert results == [False, False]
+    for s, d, e in handle_graph.edges.data('data'):
+        assert len(e.matches) == 1
+        # The node modified through the edge is updated and is still the graph's node
+        assert e.destination is handle_graph.nodes[d]['data']
+        assert e.destination.keypoints.x.tolist() == [d]
+        assert '_geodata' in e.destination.__dict__
+
+@pytest.mark.parametrize("func", [set_source_keypoints, replace_source])
+def test_apply_process_rejects_lost_node_changes(handle_graph, func):
+    # Node 0 is the source of both edges, which are in different chunks
+    with pytest.raises(ValueError):
+        handle_graph.apply(func, executor='process', max_workers=2, chunksize=1)
+    assert handle_graph.nodes[0]['data'].keypoints.empty
+
+def test_apply_process_rejects_network_objects(handle_graph):
+    handle_graph.nodes[1]['data'].parent = MagicMock()
+    with pytest.raises(ValueError):
+        handle_graph.apply(set_destination_keypoints, executor='process')
+
+def test_apply_func_to_edges_executor(graph):
+    return_value = pd.DataFrame(np.arange(36).reshape(6,6), columns=['a', 'b', 'c', 'source_idx', 'destination_idx', 'distance'])
+    with patch('autocnet.graph.edge.Edge.matches', new_callable=PropertyMock, return_value=return_value):
+        graph.apply_func_to_edges("symmetry_check", executor='thread', max_workers=2)
+        for s, d, e in graph.edges.data('data'):
+            assert 'symmetry' in e.masks
+
+def test_apply_invalid_executor(graph):
+    with pytest.raises(ValueError):
+        graph.apply(set_fake_matches, executor='gpu')
+
 def test_apply_on_nodes(graph):
     def set_test_attribute(n):
         n.test_attribute = 1
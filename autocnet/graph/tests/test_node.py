@@ -9,12 +9,14 @@ import numpy as np
 import pandas as pd
 import pytest
 from shapely.geometry import LinearRing
+import sqlalchemy
 
 
 from autocnet.examples import get_path
 from plio.io.io_gdal import GeoDataset
 
-from autocnet.graph.node import Node
+from autocnet.camera.cache import camera_cache
+from autocnet.graph.node import Node, NetworkNode
 
 sys.path.insert(0, os.path.abspath('..'))
 
@@ -191,3 +193,95 @@ class TestNode(object):
             kpc = node.get_raw_keypoint_coordinates(-1)
             assert kpc.shape == (2,)
         
+
+
+@pytest.fixture
+def camera_parent():
+    """
+    A parent with an in-memory cameras table. sqlite does not have md5, so
+    it is registered as a function on each connection.
+    """
+    import contextlib
+    import hashlib
+    import sqlalchemy
+    from sqlalchemy import orm
+    from autocnet.io.db.model import Cameras
+
+    engine = sqlalchemy.create_engine('sqlite://')
+    @sqlalchemy.event.listens_for(engine, 'connect')
+    def add_md5(dbapi_connection, connection_record):
+        dbapi_connection.create_function('md5', 1, lambda s: hashlib.md5(s.encode()).hexdigest())
+    Cameras.__table__.create(engine)
+    Session = orm.sessionmaker(bind=engine)
+
+    @contextlib.contextmanager
+    def session_scope():
+        session = Session()
+        try:
+            yield session
+            session.commit()
+        finally:
+            session.close()
+    return Mock(session_scope=session_scope)
+
+def test_network_node_camera_cache(camera_parent):
+    from autocnet.io.db.model import Cameras
+    camera_cache.clear()
+    with camera_parent.session_scope() as session:
+        session.add_all([Cameras(image_id=1, camera='serialized state'),
+                         Cameras(image_id=2, camera='other state')])
+    plugin = Mock()
+    plugin.constructModelFromState.side_effect = lambda state: object()
+
+    def camera(image_id):
+        node = NetworkNode(node_id=image_id)
+        node.parent = camera_parent
+        return node.camera
+
+    with patch('csmapi.Plugin.findPlugin', return_value=plugin):
+        first = camera(1)
+        second = camera(1)
+        other = camera(2)
+        assert camera(3) is None
+
+        # Rewriting the state through the ORM invalidates the cached camera
+        with camera_parent.session_scope() as session:
+            session.query(Cameras).filter(Cameras.image_id == 1).one().camera = 'new state'
+        assert len(camera_cache) == 1
+        rewritten = camera(1)
+
+        # A rewrite that bypasses the ORM is caught by the digest
+        with camera_parent.session_scope() as session:
+            session.execute(sqlalchemy.text("UPDATE cameras SET camera = '\"raw state\"' WHERE image_id = 2"))
+        raw = camera(2)
+
+    assert first is second
+    assert other is not first
+    assert rewritten is not first
+    assert raw is not other
+    assert [c[0][0] for c in plugin.constructModelFromState.call_args_list] == \
+        ['serialized state', 'other state', 'new state', 'raw state']
+    assert camera_cache.hits == 1
+    camera_cache.clear()
+
+
+def test_project_keypoints():
+    node = Node()
+    node.keypoints = pd.DataFrame({'x':[1., 2.], 'y':[3., 4.]})
+    node.camera = Mock()
+    gnd = np.array([[1., 2., 3.], [4., 5., 6.]])
+    with patch('autocnet.camera.projection.image_to_ground', return_value=gnd) as i2g:
+        assert node.project_keypoints(executor='thread') == True
+        # Already projected keypoints are not reprojected
+        assert node.project_keypoints() == True
+    assert i2g.call_count == 1
+    assert i2g.call_args[1]['executor'] == 'thread'
+    np.testing.assert_array_equal(i2g.call_args[0][1], [1., 2.])
+    np.testing.assert_array_equal(i2g.call_args[0][2], [3., 4.])
+    np.testing.assert_array_equal(node.keypoints[['xm', 'ym', 'zm']].values, gnd)
+
+def test_project_keypoints_without_camera():
+    node = Node()
+    node.keypoints = pd.DataFrame({'x':[1.], 'y':[3.]})
+    with pytest.warns(UserWarning):
+        assert node.project_keypoints() == False
@@ -1,5 +1,6 @@
 from csv import (writer as csv_writer, QUOTE_MINIMAL)
 from io import StringIO
+import warnings
 
 import pandas as pd
 import numpy as np
@@ -8,11 +9,191 @@ from plio.io import io_controlnetwork as cnet
 from autocnet.io.db.model import Measures
 
 
-def db_to_df(engine, sql = """
+def copy_rows(cursor, table, columns, rows):
+    """
+    Write rows into a table using a COPY FROM call with a CSV string buffer.
+    None values are written as NULL.
+
+    Parameters
+    ----------
+    cursor : object
+             A DBAPI (psycopg2) cursor
+
+    table : str
+            The name of the table to write to
+
+    columns : iterable
+              The names of the columns in the rows
+
+    rows : iterable
+           of tuples to write
+
+    Returns
+    -------
+     : int
+       The number of rows written
+    """
+    s_buf = StringIO()
+    writer = csv_writer(s_buf, quoting=QUOTE_MINIMAL)
+    writer.writerows(rows)
+    s_buf.seek(0)
+
+    columns = ', '.join('"{}"'.format(k) for k in columns)
+    sql_query = 'COPY %s (%s) FROM STDIN WITH CSV' % (table, columns)
+    cursor.copy_expert(sql=sql_query, file=s_buf)
+    return cursor.rowcount
+
+
+class MeasureUpdateSink(object):
+    """
+    A buffer of measure updates (e.g., subpixel registration results) that
+    are written to the database in bulk. On flush, the buffered rows are
+    COPY'd into a temporary table and applied with a single UPDATE ... FROM.
+    The statement level point validation trigger then recomputes the
+    pointIgnore flag once for each affected point.
+
+    Updates are keyed by the measure id; adding an update for a measure that
+    is already buffered merges the values. Values that are None are left
+    unchanged in the database.
+
+    The sink can be used as a context manager, in which case it is flushed
+    on exit.
+
+    Attributes
+    ----------
+    ncg : object
+          The NetworkCandidateGraph with the DB session
+
+    max_rows : int
+               The number of buffered measures at which the buffer is
+               automatically flushed. If None, the buffer is only flushed
+               explicitly.
+    """
+    # Model attribute name to (column name, column type)
+    columns = {'sample':('sample', 'double precision'),
+               'line':('line', 'double precision'),
+               'weight':('weight', 'double precision'),
+               'template_metric':('templateMetric', 'double precision'),
+               'template_shift':('templateShift', 'double precision'),
+               'phase_error':('phaseError', 'double precision'),
+               'phase_diff':('phaseDiff', 'double precision'),
+               'phase_shift':('phaseShift', 'double precision'),
+               'ignore':('measureIgnore', 'boolean'),
+               'choosername':('ChooserName', 'varchar')}
+
+    def __init__(self, ncg, max_rows=100000):
+        self.ncg = ncg
+        self.max_rows = max_rows
+        self._rows = {}
+        self.nflushed = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        else:
+            self.clear()
+
+    @property
+    def rows(self):
+        """
+        A dict of the buffered updates, measure id to dict of values
+        """
+        return self._rows
+
+    def add(self, measureid, **values):
+        """
+        Buffer an update to a measure.
+
+        Parameters
+        ----------
+        measureid : int
+                    The id of the measure to update
+
+        values : dict
+                 Of Measures attribute names (e.g., sample, line, weight,
+                 template_metric, template_shift, ignore, choosername)
+                 and the new values
+        """
+        unknown = set(values) - set(self.columns)
+        if unknown:
+            raise KeyError(f'Unable to bulk update the measure attribute(s): {sorted(unknown)}')
+        self._rows.setdefault(measureid, {}).update(values)
+        if self.max_rows and len(self._rows) >= self.max_rows:
+            self.flush()
+
+    def clear(self):
+        """
+        Discard the buffered updates.
+        """
+        self._rows = {}
+
+    def flush(self, session=None):
+        """
+        Write the buffered updates to the database.
+
+        Parameters
+        ----------
+        session : object
+                  An SQLAlchemy session to write the updates with, e.g., so that
+                  the updates are part of an existing transaction. If None,
+                  a new session is created and committed.
+
+        Returns
+        -------
+         : int
+           The number of measures updated
+        """
+        if not self._rows:
+            return 0
+        if session is None:
+            with self.ncg.session_scope() as session:
+                return self.flush(session=session)
+
+        rows, self._rows = self._rows, {}
+        attrs = list(self.columns)
+        records = [(measureid, *[values.get(a) for a in attrs]) for measureid, values in rows.items()]
+        colnames = [self.columns[a][0] for a in attrs]
+
+        cursor = session.connection().connection.cursor()
+        cursor.execute('CREATE TEMPORARY TABLE IF NOT EXISTS measure_updates (id integer PRIMARY KEY, {}) ON COMMIT DROP;'.format(
+                       ', '.join(f'"{c}" {t}' for c, t in self.columns.values())))
+        cursor.execute('TRUNCATE measure_updates;')
+        copy_rows(cursor, 'measure_updates', ['id'] + colnames, records)
+
+        # The statement level trigger on the measures recomputes the validity
+        # of the affected points once for the whole update
+        cursor.execute('UPDATE measures SET {} FROM measure_updates AS u WHERE measures.id = u.id;'.format(
+                       ', '.join(f'"{c}" = COALESCE(u."{c}", measures."{c}")' for c in colnames)))
+        nupdated = cursor.rowcount
+        self.nflushed += len(records)
+        return nupdated
+
+
+# Images that are in fewer than 3 active points are pre-filtered in a CTE. The
+# ground point coordinates are extracted in the database, so the geometries
+# do not need to be decoded.
+CONTROLNETWORK_SQL = """
+WITH valid_images AS
+    (SELECT measures."imageid"
+    FROM measures
+    INNER JOIN points ON measures."pointid" = points."id"
+    WHERE measures."measureIgnore" = False and measures."measureJigsawRejected" = False AND points."pointIgnore" = False
+    GROUP BY measures."imageid"
+    HAVING COUNT(DISTINCT measures."pointid") >= 3)
 SELECT measures."pointid",
         points."pointType",
-        points."apriori",
-        points."adjusted",
+        CASE WHEN points."pointType" IN (3, 4) THEN COALESCE(ST_X(points."apriori"), 0) ELSE 0 END AS "aprioriX",
+        CASE WHEN points."pointType" IN (3, 4) THEN COALESCE(ST_Y(points."apriori"), 0) ELSE 0 END AS "aprioriY",
+        CASE WHEN points."pointType" IN (3, 4) THEN COALESCE(ST_Z(points."apriori"), 0) ELSE 0 END AS "aprioriZ",
+        CASE WHEN points."pointType" IN (3, 4) THEN COALESCE(ST_X(points."adjusted"), 0) ELSE 0 END AS "adjustedX",
+        CASE WHEN points."pointType" IN (3, 4) THEN COALESCE(ST_Y(points."adjusted"), 0) ELSE 0 END AS "adjustedY",
+        CASE WHEN points."pointType" IN (3, 4) THEN COALESCE(ST_Z(points."adjusted"), 0) ELSE 0 END AS "adjustedZ",
         points."pointIgnore",
         points."referenceIndex",
         points."identifier",
@@ -28,87 +209,142 @@ SELECT measures."pointid",
         measures."apriorisample"
 FROM measures
 INNER JOIN points ON measures."pointid" = points."id"
+INNER JOIN valid_images ON measures."imageid" = valid_images."imageid"
 WHERE
     points."pointIgnore" = False AND
     measures."measureIgnore" = FALSE AND
-    measures."measureJigsawRejected" = FALSE AND
-    measures."imageid" NOT IN
-        (SELECT measures."imageid"
-        FROM measures
-        INNER JOIN points ON measures."pointid" = points."id"
-        WHERE measures."measureIgnore" = False and measures."measureJigsawRejected" = False AND points."pointIgnore" = False
-        GROUP BY measures."imageid"
-        HAVING COUNT(DISTINCT measures."pointid")  < 3)
+    measures."measureJigsawRejected" = FALSE
 ORDER BY measures."pointid", measures."id";
-"""):
+"""
+
+
+def _format_cnet_chunk(df):
+    """
+    Format a chunk of the rows read from the database into the columns
+    that plio expects.
+
+    Parameters
+    ----------
+    df : pd.DataFrame
+         The rows from the database
+
+    Returns
+    -------
+    df : pd.DataFrame
+         The formatted rows
+    """
+    # measures.id DB column was read in to ensure the proper ordering of DF
+    # so the correct measure is written as reference
+    del df['id']
+    df.rename(columns = {'pointid': 'id',
+                         'pointType': 'pointtype',
+                         'measureType': 'measuretype'}, inplace=True)
+    df['id'] = [f'{identifier}_{pointid}' for identifier, pointid in zip(df['identifier'].values, df['id'].values)]
+
+    #create columns in the dataframe; zeros ensure plio (/protobuf) will
+    #ignore unless populated with alternate values
+    ground = df['pointtype'].isin([3, 4]).values
+    for geom_column in ['apriori', 'adjusted']:
+        columns = [f'{geom_column}{c}' for c in 'XYZ']
+        if all(c in df.columns for c in columns):
+            # Extracted in the database
+            continue
+        coords = np.zeros((len(df), 3))
+        #only populate the new columns for ground points. Otherwise, isis will
+        #recalculate the control point lat/lon from control measures which where
+        #"massaged" by the phase and template matcher.
+        if geom_column in df.columns:
+            geoms = df[geom_column].values
+            for i in np.flatnonzero(ground):
+                if geoms[i]:
+                    geom = swkb.loads(geoms[i], hex=True)
+                    coords[i] = geom.x, geom.y, geom.z
+        for i, c in enumerate(columns):
+            df[c] = coords[:,i]
+    df['aprioriCovar'] = [[] for _ in range(len(df))]
+    return df
+
+
+def db_to_df_chunks(engine, sql=CONTROLNETWORK_SQL, chunksize=100000):
+    """
+    Generate the rows of an ISIS compliant control network from the
+    points/measures in an autocnet database in chunks. The rows are streamed
+    from the database (using a server side cursor), so at most chunksize rows
+    are held in memory at once.
+
+    Parameters
+    ----------
+    engine : object
+             An SQLAlchemy engine
+
+    sql : str
+          The sql query to execute in the database.
+
+    chunksize : int
+                The number of rows per chunk
+
+    Yields
+    ------
+     : pd.DataFrame
+       A chunk of the control network
+    """
+    with engine.connect() as connection:
+        connection = connection.execution_options(stream_results=True)
+        for chunk in pd.read_sql(sql, connection, chunksize=chunksize):
+            yield _format_cnet_chunk(chunk)
+
+
+def db_to_df(engine, sql=CONTROLNETWORK_SQL, chunksize=None):
         """
         Given a set of points/measures in an autocnet database, generate an ISIS
         compliant control network.
+
         Parameters
         ----------
-        path : str
-               The full path to the output network.
-        flistpath : str
-                    (Optional) the path to the output filelist. By default
-                    the outout filelist path is genrated programatically
-                    as the provided path with the extension replaced with .lis.
-                    For example, out.net would have an associated out.lis file.
+        engine : object
+                 An SQLAlchemy engine
+
         sql : str
               The sql query to execute in the database.
+
+        chunksize : int
+                    If not None, the rows are streamed from the database and
+                    formatted in chunks of this size. Otherwise, all of the rows
+                    are read at once.
+
+        Returns
+        -------
+        df : pd.DataFrame
+             The control network
+
+        See Also
+        --------
+        db_to_df_chunks
         """
-        df = pd.read_sql(sql, engine)
-
-        # measures.id DB column was read in to ensure the proper ordering of DF
-        # so the correct measure is written as reference
-        del df['id']
-        df.rename(columns = {'pointid': 'id',
-                             'pointType': 'pointtype',
-                             'measureType': 'measuretype'}, inplace=True)
-        df['id'] = df.apply(lambda row: f"{row['identifier']}_{row['id']}", axis=1)
-
-        #create columns in the dataframe; zeros ensure plio (/protobuf) will
-        #ignore unless populated with alternate values
-        df['aprioriX'] = 0
-        df['aprioriY'] = 0
-        df['aprioriZ'] = 0
-        df['adjustedX'] = 0
-        df['adjustedY'] = 0
-        df['adjustedZ'] = 0
-        df['aprioriCovar'] = [[] for _ in range(len(df))]
+        if chunksize:
+            chunks = list(db_to_df_chunks(engine, sql=sql, chunksize=chunksize))
+            if not chunks:
+                return _format_cnet_chunk(pd.read_sql(sql, engine))
+            return pd.concat(chunks, ignore_index=True)
 
-        #only populate the new columns for ground points. Otherwise, isis will
-        #recalculate the control point lat/lon from control measures which where
-        #"massaged" by the phase and template matcher.
-        for i, row in df.iterrows():
-            if row['pointtype'] == 3 or row['pointtype'] == 4:
-                if row['apriori']:
-                    apriori_geom = swkb.loads(row['apriori'], hex=True)
-                    row['aprioriX'] = apriori_geom.x
-                    row['aprioriY'] = apriori_geom.y
-                    row['aprioriZ'] = apriori_geom.z
-                if row['adjusted']:
-                    adjusted_geom = swkb.loads(row['adjusted'], hex=True)
-                    row['adjustedX'] = adjusted_geom.x
-                    row['adjustedY'] = adjusted_geom.y
-                    row['adjustedZ'] = adjusted_geom.z
-                df.iloc[i] = row
-
-        return df
-
-
-def update_from_jigsaw(cnet, measures, connection, pointid_func=None):
+        return _format_cnet_chunk(pd.read_sql(sql, engine))
+
+
+def update_from_jigsaw(cnet, measures=None, connection=None, pointid_func=None, chunksize=100000):
     """
     Updates a database fields: liner, sampler, measureJigsawRejected,
-    samplesigma, and linesigma using an ISIS control network.
-    
-    This function uses the pandas update function with overwrite=True. Therefore, 
-    this function will overwrite NaN and non-NaN entries.
+    samplesigma, and linesigma using an ISIS control network. The residual
+    is recomputed from the updated components.
 
-    In order to be efficient, this func creates an in-memory control network
-    and then writes to the database using a string buffer and a COPY FROM call.
-    
-    Note: If using this func and looking at the updates table in pgadmin, it
-    is necessary to refresh the pgadmin table of contents for the schema.
+    As with the pandas update function, NaN entries in the control network
+    do not overwrite the existing values.
+
+    In order to be efficient, only the jigsaw columns of the control network
+    are written, in chunks, to a temporary staging table using a string
+    buffer and a COPY FROM call. The measures are then updated in place, keyed
+    by (pointid, serialnumber), with a single UPDATE ... FROM. Memory use is
+    bounded by the chunksize and the indices, constraints, and triggers on
+    the measures table are preserved.
 
     Parameters
     ----------
@@ -116,10 +352,12 @@ def update_from_jigsaw(cnet, measures, connection, pointid_func=None):
            plio.io.io_control_network loaded dataframe
 
     measures : pd.DataFrame
-               of measures from a database table. 
+               Unused. The measures are updated in place in the database.
     
     connection : object
-                 An SQLAlchemy DB connection object
+                 An SQLAlchemy engine or connection object. If an engine, the
+                 update is committed. If a connection, the update is part of
+                 the connection's transaction.
 
     poitid_func : callable
                   A callable function that is used to split the id string in
@@ -127,64 +365,77 @@ def update_from_jigsaw(cnet, measures, connection, pointid_func=None):
                   will have a user specified identifier with the numeric pointid as 
                   the final element, e.g., autocnet_1. This func needs to get the
                   numeric ID back. This callable is used to unmunge the id.
-    """
 
-    def copy_from_method(table, conn, keys, data_iter, pre_truncate=False, fatal_failure=False):
-        """
-        Custom method for pandas.DataFrame.to_sql that will use COPY FROM
-        From: https://stackoverflow.com/questions/24084710/to-sql-sqlalchemy-copy-from-postgresql-engine
-        
-        This is follows the API specified by pandas.
-        """
+    chunksize : int
+                The number of control network rows to write per COPY
 
-        dbapi_conn = conn.connection
+    Returns
+    -------
+     : int
+       The number of measures updated
+    """
+    if measures is not None:
+        warnings.warn('The measures argument is unused; the measures are updated in place in the database.',
+                      DeprecationWarning)
+
+    # Control network column name to (measures column name, column type)
+    columns = {'sampleResidual':('sampler', 'double precision'),
+               'lineResidual':('liner', 'double precision'),
+               'measureJigsawRejected':('measureJigsawRejected', 'boolean'),
+               'samplesigma':('samplesigma', 'double precision'),
+               'linesigma':('linesigma', 'double precision')}
+
+    owns_connection = hasattr(connection, 'raw_connection')
+    dbapi_conn = connection.raw_connection() if owns_connection else connection.connection
+    try:
         cur = dbapi_conn.cursor()
-
-        s_buf = StringIO()
-        writer = csv_writer(s_buf, quoting=QUOTE_MINIMAL)
-        writer.writerows(data_iter)
-        s_buf.seek(0)
-
-        columns = ', '.join('"{}"'.format(k) for k in keys)
-        table_name = '{}.{}'.format(
-            table.schema, table.name) if table.schema else table.name
-
-        sql_query = 'COPY %s (%s) FROM STDIN WITH CSV' % (table_name, columns)
-        cur.copy_expert(sql=sql_query, file=s_buf)
-        return cur.rowcount
-
-    # Get the PID back from the id.
-    if pointid_func:
-        cnet['pointid'] = cnet['id'].apply(pointid_func)
-    else:
-        cnet['pointid'] = cnet['id']
-    cnet = cnet.rename(columns={'sampleResidual':'sampler',
-                            'lineResidual':'liner'})
-
-    # Homogenize the indices
-    measures.set_index(['pointid', 'serialnumber'], inplace=True)
-    cnet.set_index(['pointid', 'serialnumber'], inplace=True)
-
-    # Update the current meaasures using the data from the input network
-    measures.update(cnet[['sampler', 'liner', 'measureJigsawRejected', 'samplesigma', 'linesigma']])
-    measures.reset_index(inplace=True)
-    
-    # Compute the residual from the components
-    measures['residual'] = np.sqrt(measures['liner'] ** 2 + measures['sampler'] ** 2)
-
-    # Execute an SQL COPY from a CSV buffer into the DB
-    measures.to_sql('measures_tmp', connection, schema='public', if_exists='replace', index=False, method=copy_from_method)
-
-    # Drop the old measures table and then rename the tmp measures table to be the 'new' measures table
-    connection.execute('DROP TABLE measures;')
-    connection.execute('ALTER TABLE measures_tmp RENAME TO measures;')
+        cur.execute('CREATE TEMPORARY TABLE IF NOT EXISTS jigsaw_updates (pointid integer, serialnumber varchar, {});'.format(
+                    ', '.join(f'"{c}" {t}' for c, t in columns.values())))
+        cur.execute('TRUNCATE jigsaw_updates;')
+
+        staged = ['pointid', 'serialnumber'] + [c for c, _ in columns.values()]
+        for start in range(0, len(cnet), chunksize):
+            chunk = cnet.iloc[start:start+chunksize]
+            # Get the PID back from the id.
+            if pointid_func:
+                pointids = chunk['id'].apply(pointid_func)
+            else:
+                pointids = chunk['id']
+            updates = pd.DataFrame({'pointid':pointids.values,
+                                    'serialnumber':chunk['serialnumber'].values})
+            for name, (column, _) in columns.items():
+                updates[column] = chunk[name].values
+            # NaN are written as NULL so that they do not overwrite the existing values
+            updates = updates.astype(object).where(updates.notnull(), None)
+            copy_rows(cur, 'jigsaw_updates', staged, updates.itertuples(index=False, name=None))
+        cur.execute('ANALYZE jigsaw_updates;')
+
+        assignments = [f'"{c}" = COALESCE(u."{c}", measures."{c}")' for c, _ in columns.values()]
+        assignments.append('residual = sqrt(power(COALESCE(u.liner, measures.liner), 2) + '
+                           'power(COALESCE(u.sampler, measures.sampler), 2))')
+        cur.execute("""UPDATE measures SET {}
+FROM jigsaw_updates AS u
+WHERE measures.pointid = u.pointid AND measures.serialnumber = u.serialnumber;""".format(', '.join(assignments)))
+        nupdated = cur.rowcount
+        cur.execute('DROP TABLE jigsaw_updates;')
+        if owns_connection:
+            dbapi_conn.commit()
+    except:
+        if owns_connection:
+            dbapi_conn.rollback()
+        raise
+    finally:
+        if owns_connection:
+            dbapi_conn.close()
+    return nupdated
 
 # This is not a permanent placement for this function
 # TO DO: create a new module for parsing/cleaning points from a controlnetwork
 from scipy.stats import zscore
 from plio.io.io_gdal import GeoDataset
 from autocnet.io.db.model import Images
-import pvl
+from autocnet.io.metadata import metadata_cache
+from autocnet.io.tiles import tile_cache
 def null_measure_ignore(point, size_x, size_y, valid_tol, verbose=False, ncg=None, **kwargs):
 
     if not ncg.Session:
@@ -196,6 +447,7 @@ def null_measure_ignore(point, size_x, size_y, valid_tol, verbose=False, ncg=Non
             "Real" : "float64"}
 
     resultlog = []
+    sink = MeasureUpdateSink(ncg, max_rows=None)
     with ncg.session_scope() as session:
         pid = point.id
         print('point id: ', pid)
@@ -217,18 +469,17 @@ def null_measure_ignore(point, size_x, size_y, valid_tol, verbose=False, ncg=Non
             stop_y = int(center_y + size_y)
 
             pixels = list(map(int, [start_x, start_y, stop_x-start_x, stop_y-start_y]))
-            dtype = isis2np_types[pvl.load(cube.file_name)["IsisCube"]["Core"]["Pixels"]["Type"]]
-            arr = cube.read_array(pixels=pixels, dtype=dtype)
+            dtype = isis2np_types[metadata_cache.pixel_type(cube.file_name)]
+            arr = tile_cache.read_array(cube, pixels=pixels, dtype=dtype)
 
             z = zscore(arr, axis=0)
             nn= sum(sum(np.isnan(z)))
             percent_valid = (1 - nn/z.size)*100
             if percent_valid < valid_tol:
-                session.query(Measures).\
-                        filter(Measures.pointid==pid, Measures.id==measure.id).\
-                        update({'ignore': True})
+                sink.add(measure.id, ignore=True)
                 currentlog['status'] = 'Ignored'
 
             resultlog.append(currentlog)
+        sink.flush(session=session)
     return resultlog
 
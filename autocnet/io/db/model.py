@@ -18,6 +18,7 @@ from geoalchemy2.shape import from_shape, to_shape
 import osgeo
 import shapely
 from shapely.geometry import Point
+from autocnet.camera.cache import camera_cache, image_key, state_key
 from autocnet.transformation.spatial import reproject, og2oc
 from autocnet.utils.serializers import JsonEncoder
 
@@ -181,6 +182,23 @@ class Cameras(BaseMixin, Base):
     camera = Column(Json())
     camtype = Column(String)
 
+# Drop the instantiated cameras of a rewritten or deleted state from the
+# process wide cache
+@event.listens_for(Cameras, 'after_update')
+def _uncache_updated_camera(mapper, connection, target):
+    attrs = sqlalchemy.inspect(target).attrs
+    for state in attrs.camera.history.deleted:
+        if state is not None:
+            camera_cache.invalidate(state_key(state))
+    for image_id in set(attrs.image_id.history.deleted) | {target.image_id}:
+        camera_cache.invalidate(image_key(connection.engine.url, image_id))
+
+@event.listens_for(Cameras, 'after_delete')
+def _uncache_deleted_camera(mapper, connection, target):
+    if target.camera is not None:
+        camera_cache.invalidate(state_key(target.camera))
+    camera_cache.invalidate(image_key(connection.engine.url, target.image_id))
+
 class Images(BaseMixin, Base):
     __tablename__ = 'images'
     latitudinal_srid = -1
@@ -0,0 +1,177 @@
+from collections import defaultdict
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+from sqlalchemy import text
+
+from autocnet.io.db.model import Images, CandidateGroundPoints
+
+# The points are passed as arrays and unnested so that any number of points
+# are looked up in a single query using the GiST index on the table geometry
+POINTS_CTE = """WITH pts AS (
+    SELECT p.idx - 1 AS point_index, ST_SetSRID(ST_Point(p.lon, p.lat), :srid) AS geom
+    FROM unnest(CAST(:lons AS double precision[]), CAST(:lats AS double precision[]))
+         WITH ORDINALITY AS p(lon, lat, idx))
+"""
+
+IMAGES_AT_POINTS_SQL = POINTS_CTE + """SELECT pts.point_index, {columns}
+FROM pts JOIN images ON ST_Intersects(images.geom, pts.geom)
+{where}ORDER BY pts.point_index, images.id"""
+
+POINTS_NEAR_SQL = POINTS_CTE + """SELECT pts.point_index
+FROM pts WHERE EXISTS (SELECT 1 FROM {table} WHERE ST_DWithin({table}.geom, pts.geom, :threshold))"""
+
+
+def _as_coordinates(lons, lats):
+    lons = [float(x) for x in lons]
+    lats = [float(y) for y in lats]
+    if len(lons) != len(lats):
+        raise ValueError('lons and lats must be the same length.')
+    return lons, lats
+
+def images_at_points(session, lons, lats, srid=None, columns=('id', 'path', 'serial'), ignored=True):
+    """
+    Find the images that intersect each of a set of ground points with a
+    single query.
+
+    Parameters
+    ----------
+    session : sqlalchemy.orm.Session
+              A session connected to the database
+
+    lons : iterable
+           of longitudes
+
+    lats : iterable
+           of latitudes
+
+    srid : int
+           The srid of the points. If None, the latitudinal srid of the
+           Images table is used.
+
+    columns : iterable
+              The columns of the images table to return
+
+    ignored : bool
+              If False, ignored images are not returned
+
+    Returns
+    -------
+    images : pd.DataFrame
+             with a row for each (point, image) intersection, a point_index
+             column with the position of the point in lons/lats, and the
+             requested image columns
+    """
+    lons, lats = _as_coordinates(lons, lats)
+    columns = list(columns)
+    for c in columns:
+        if c not in Images.__table__.columns:
+            raise KeyError(f'{c} is not a column of the images table.')
+    if srid is None:
+        srid = Images.latitudinal_srid
+
+    if not lons:
+        return pd.DataFrame(columns=['point_index'] + columns)
+
+    sql = IMAGES_AT_POINTS_SQL.format(columns=', '.join(f'images.{c}' for c in columns),
+                                      where='' if ignored else 'WHERE images.ignore IS NOT TRUE\n')
+    return pd.read_sql(text(sql), session.connection(), params={'lons':lons, 'lats':lats, 'srid':srid})
+
+def points_near_existing(session, lons, lats, threshold, table=CandidateGroundPoints, srid=None):
+    """
+    Determine which of a set of ground points are within a threshold of
+    a geometry in a table with a single query.
+
+    Parameters
+    ----------
+    session : sqlalchemy.orm.Session
+              A session connected to the database
+
+    lons : iterable
+           of longitudes
+
+    lats : iterable
+           of latitudes
+
+    threshold : float
+                The distance, in the units of the srid, that a point must be
+                from all of the existing geometries
+
+    table : object
+            The declarative model of the table to check against
+
+    srid : int
+           The srid of the points. If None, the latitudinal srid of the
+           table is used.
+
+    Returns
+    -------
+    near : ndarray
+           boolean array that is True for the points that are within the
+           threshold of an existing geometry
+    """
+    lons, lats = _as_coordinates(lons, lats)
+    if srid is None:
+        srid = table.latitudinal_srid
+
+    near = np.zeros(len(lons), dtype=bool)
+    if not lons:
+        return near
+
+    sql = POINTS_NEAR_SQL.format(table=table.__tablename__)
+    res = session.execute(text(sql), {'lons':lons, 'lats':lats, 'srid':srid, 'threshold':threshold})
+    near[[int(r[0]) for r in res]] = True
+    return near
+
+def dedupe_points(session, lons, lats, threshold, table=CandidateGroundPoints, srid=None):
+    """
+    Select the ground points that can be added to a table without being
+    within a threshold of an existing geometry or of another selected
+    point. This gives the same result as checking and adding the points one
+    at a time, in order, but with a single query.
+
+    Parameters
+    ----------
+    session : sqlalchemy.orm.Session
+              A session connected to the database
+
+    lons : iterable
+           of longitudes
+
+    lats : iterable
+           of latitudes
+
+    threshold : float
+                The minimum distance, in the units of the srid, between points
+
+    table : object
+            The declarative model of the table to check against
+
+    srid : int
+           The srid of the points. If None, the latitudinal srid of the
+           table is used.
+
+    Returns
+    -------
+    keep : ndarray
+           boolean array that is True for the points to keep
+
+    See Also
+    --------
+    autocnet.io.db.spatial.points_near_existing
+    """
+    keep = ~points_near_existing(session, lons, lats, threshold, table=table, srid=srid)
+    if len(keep) < 2:
+        return keep
+
+    # Duplicates within the candidates are found locally. Like ST_DWithin
+    # on a geometry, the distance is planar in the units of the srid.
+    tree = cKDTree(np.column_stack(_as_coordinates(lons, lats)))
+    earlier = defaultdict(list)
+    for i, j in tree.query_pairs(threshold):
+        earlier[max(i, j)].append(min(i, j))
+    for i in sorted(earlier):
+        if keep[i] and any(keep[j] for j in earlier[i]):
+            keep[i] = False
+    return keep
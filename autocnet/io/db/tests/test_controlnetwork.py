@@ -1,9 +1,14 @@
 import sys
+from unittest.mock import patch, MagicMock
 
+import numpy as np
 import pandas as pd
 import pytest
 from autocnet.io.db import model
-from autocnet.io.db.controlnetwork import db_to_df, update_from_jigsaw
+from shapely.geometry import Point
+import shapely.wkb as swkb
+
+from autocnet.io.db.controlnetwork import db_to_df, update_from_jigsaw, MeasureUpdateSink, _format_cnet_chunk
 
 if sys.platform.startswith("darwin"):
     pytest.skip("skipping DB tests for MacOS", allow_module_level=True)
@@ -17,11 +22,32 @@ def test_to_isis(session, db_controlnetwork):
     assert df.iloc[0]['measuretype'] == 3
     assert df.iloc[0]['aprioriCovar'] == []
 
+def test_to_isis_chunked(session, db_controlnetwork):
+    df = db_to_df(session.get_bind())
+    chunked = db_to_df(session.get_bind(), chunksize=4)
+    pd.testing.assert_frame_equal(chunked, df)
+
+def test_format_cnet_chunk_decodes_geometries():
+    # Custom SQL that returns the geometries rather than the coordinates
+    df = pd.DataFrame({'pointid':[1, 1, 2],
+                       'pointType':[2, 2, 3],
+                       'apriori':[swkb.dumps(Point(1, 2, 3), hex=True)] * 2 + [swkb.dumps(Point(4, 5, 6), hex=True)],
+                       'adjusted':[None, None, None],
+                       'identifier':['autocnet', 'autocnet', 'ground'],
+                       'id':[10, 11, 12],
+                       'measureType':[3, 3, 3]})
+    df = _format_cnet_chunk(df)
+    assert df['id'].tolist() == ['autocnet_1', 'autocnet_1', 'ground_2']
+    # Only ground points are populated
+    assert df['aprioriX'].tolist() == [0, 0, 4]
+    assert df['aprioriZ'].tolist() == [0, 0, 6]
+    assert df['adjustedY'].tolist() == [0, 0, 0]
+    assert df['pointtype'].tolist() == [2, 2, 3]
+    assert df['aprioriCovar'].tolist() == [[], [], []]
+
 
 def test_update_from_jigsaw(session, db_controlnetwork,):
     connection = session.get_bind()
-
-    existing_measures = pd.read_sql_table('measures', con=connection)
     session.close()
 
     # This is an intentionally truncated representation so that many unused columns are not repeated.
@@ -34,11 +60,108 @@ def test_update_from_jigsaw(session, db_controlnetwork,):
          (0.25, -34, 2, 'Random1:123', False, 0.5, 0.5)
          ],
         columns=['sampleResidual', 'lineResidual', 'id', 'serialnumber','measureJigsawRejected', 'samplesigma', 'linesigma'])
-    update_from_jigsaw(isis_cnet, existing_measures, connection)
+    assert update_from_jigsaw(isis_cnet, connection=connection) == 6
 
-    updated_measures = pd.read_sql_table('measures', con=connection)
+    # The measures are updated in place, so the row order is not preserved
+    updated_measures = pd.read_sql_table('measures', con=connection).sort_values('id').reset_index(drop=True)
     session.close()
     assert (updated_measures['sampler'] == pd.Series([0.1, 0.2, -0.5, 8, 2.2, 0.25])).all()
     assert (updated_measures['liner'] == pd.Series([0.1, 0.2, -0.5, -11, 1.1, -34])).all()
     assert (updated_measures['samplesigma'] == pd.Series([0.0, 1.1, -0.2, 1.0, 1.0, 0.5])).all()
-    assert (updated_measures['linesigma'] == pd.Series([0.0, 1.0, 0.0, 0.0, 0.0, 0.5])).all()
\ No newline at end of file
+    assert (updated_measures['linesigma'] == pd.Series([0.0, 1.0, 0.0, 0.0, 0.0, 0.5])).all()
+    assert updated_measures['residual'].values == pytest.approx(np.hypot(updated_measures['sampler'], updated_measures['liner']))
+
+    # The table is not rewritten, so the point validation trigger is still in place
+    with connection.connect() as conn:
+        triggers = conn.execute("SELECT tgname FROM pg_trigger WHERE tgrelid = 'measures'::regclass").fetchall()
+    assert 'active_measure_changes' in [t[0] for t in triggers]
+
+
+def test_update_from_jigsaw_chunked():
+    # Without a database, check that the cnet is staged in chunks with NaN as NULL
+    connection = MagicMock(spec=['connection'])
+    cursor = connection.connection.cursor.return_value
+    cursor.rowcount = 3
+    isis_cnet = pd.DataFrame(
+        [(0.1, 0.1, 'autocnet_0', 'Random0:123', False, 0.0, 0.0),
+         (np.nan, 0.2, 'autocnet_0', 'Random1:123', False, 1.1, 1.0),
+         (-0.5, -0.5, 'autocnet_1', 'Random0:123', True, -0.2, 0.0)],
+        columns=['sampleResidual', 'lineResidual', 'id', 'serialnumber','measureJigsawRejected', 'samplesigma', 'linesigma'])
+    assert update_from_jigsaw(isis_cnet, connection=connection,
+                              pointid_func=lambda x: int(x.split('_')[-1]), chunksize=2) == 3
+
+    assert cursor.copy_expert.call_count == 2
+    rows = [line for c in cursor.copy_expert.call_args_list for line in c[1]['file'].getvalue().splitlines()]
+    assert rows == ['0,Random0:123,0.1,0.1,False,0.0,0.0',
+                    '0,Random1:123,,0.2,False,1.1,1.0',
+                    '1,Random0:123,-0.5,-0.5,True,-0.2,0.0']
+    statements = [c[0][0] for c in cursor.execute.call_args_list]
+    assert len([s for s in statements if s.startswith('UPDATE measures')]) == 1
+    # The caller owns the connection
+    assert connection.connection.commit.call_count == 0
+
+
+def test_measure_update_sink_merges_updates():
+    sink = MeasureUpdateSink(None, max_rows=None)
+    sink.add(1, sample=1.5, line=2.5)
+    sink.add(1, ignore=True)
+    sink.add(2, weight=0.1)
+    assert len(sink) == 2
+    assert sink.rows[1] == {'sample':1.5, 'line':2.5, 'ignore':True}
+    with pytest.raises(KeyError):
+        sink.add(3, apriorisample=1)
+
+def test_measure_update_sink_flushes_at_max_rows():
+    sink = MeasureUpdateSink(None, max_rows=2)
+    with patch.object(MeasureUpdateSink, 'flush') as flush:
+        sink.add(1, ignore=True)
+        assert flush.call_count == 0
+        sink.add(2, ignore=True)
+        assert flush.call_count == 1
+
+def test_measure_update_sink_flush():
+    session = MagicMock()
+    cursor = session.connection.return_value.connection.cursor.return_value
+    cursor.rowcount = 2
+    sink = MeasureUpdateSink(None)
+    sink.add(1, sample=1.5, line=2.5, choosername='foo')
+    sink.add(2, ignore=True)
+    assert sink.flush(session=session) == 2
+    assert len(sink) == 0
+
+    # One COPY of the rows and a single UPDATE of the measures. The points are
+    # left to the trigger on the measures table.
+    assert cursor.copy_expert.call_count == 1
+    copied = cursor.copy_expert.call_args[1]['file'].getvalue().splitlines()
+    assert copied[0].startswith('1,1.5,2.5,')
+    assert copied[0].endswith(',foo')
+    assert copied[1].startswith('2,,,')
+    statements = [c[0][0] for c in cursor.execute.call_args_list]
+    updates = [s for s in statements if s.startswith('UPDATE')]
+    assert len(updates) == 1
+    assert updates[0].startswith('UPDATE measures')
+    assert not any(s.startswith('SET') for s in statements)
+
+    # An empty sink does not touch the database
+    assert sink.flush(session=session) == 0
+    assert cursor.copy_expert.call_count == 1
+
+def test_measure_update_sink_db(ncg, db_controlnetwork):
+    with MeasureUpdateSink(ncg) as sink:
+        sink.add(0, ignore=True)
+        sink.add(2, sample=10.5, line=11.5, weight=0.5, choosername='sink')
+
+    with ncg.session_scope() as session:
+        m0 = session.query(model.Measures).filter(model.Measures.id == 0).one()
+        assert m0.ignore == True
+        assert m0.sample == 0
+        m2 = session.query(model.Measures).filter(model.Measures.id == 2).one()
+        assert m2.sample == 10.5
+        assert m2.line == 11.5
+        assert m2.weight == 0.5
+        assert m2.choosername == 'sink'
+        assert m2.ignore == False
+
+        # Point 0 is left with a single active measure
+        assert session.query(model.Points).filter(model.Points.id == 0).one().ignore == True
+        assert session.query(model.Points).filter(model.Points.id == 1).one().ignore == False
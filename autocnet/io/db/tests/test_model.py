@@ -51,6 +51,33 @@ def test_create_camera_unique_constraint(session):
     with pytest.raises(sqlalchemy.exc.IntegrityError):
         model.Cameras.create(session, **data)
 
+def test_camera_write_invalidates_cache():
+    from unittest.mock import Mock
+    from sqlalchemy.orm.attributes import set_committed_value
+    from autocnet.camera.cache import camera_cache, image_key, state_key
+    camera_cache.clear()
+    connection = Mock()
+    connection.engine.url = 'postgresql://db'
+    camera_cache.put(state_key('old'), object())
+    camera_cache.put(state_key('new'), object())
+    camera_cache.put_versioned(image_key('postgresql://db', 1), 'digest', object())
+    camera_cache.put_versioned(image_key('postgresql://other', 1), 'digest', object())
+
+    c = model.Cameras()
+    set_committed_value(c, 'camera', 'old')
+    set_committed_value(c, 'image_id', 1)
+    c.camera = 'new'
+    model._uncache_updated_camera(None, connection, c)
+    assert state_key('old') not in camera_cache
+    assert state_key('new') in camera_cache
+    assert image_key('postgresql://db', 1) not in camera_cache
+    # The same image id in another database is not affected
+    assert image_key('postgresql://other', 1) in camera_cache
+
+    model._uncache_deleted_camera(None, connection, c)
+    assert len(camera_cache) == 1
+    camera_cache.clear()
+
 def test_images_exists(tables):
     assert model.Images.__tablename__ in tables
 
@@ -175,3 +202,52 @@ def test_ignore_image(session, measure_data, point_data, image_data):
     assert ignored_measures_resp.imageid == 1
     valid_measures_resp = session.query(model.Measures).filter(model.Measures.ignore == False)
     assert valid_measures_resp.count() == 3
+
+def test_bulk_measure_ignore_validates_points(session):
+    for i in range(1, 4):
+        model.Images.create(session, id=i, serial=f'ISISSERIAL{i}')
+    for pid in range(1, 3):
+        model.Points.create(session, id=pid, pointtype=2)
+        for i in range(1, 4):
+            model.Measures.create(session, id=10*pid+i, pointid=pid, imageid=i,
+                                  serial=f'ISISSERIAL{i}', measuretype=3, sample=0, line=0)
+
+    # One statement ignores two measures in point 1 and one in point 2
+    session.query(model.Measures).filter(model.Measures.id.in_([11, 12, 21])).update({'ignore':True}, synchronize_session=False)
+    session.expire_all()
+    assert session.query(model.Points).filter(model.Points.id == 1).one().ignore == True
+    assert session.query(model.Points).filter(model.Points.id == 2).one().ignore == False
+
+    # Restoring a measure revalidates the point
+    session.query(model.Measures).filter(model.Measures.id == 12).update({'ignore':False}, synchronize_session=False)
+    session.expire_all()
+    assert session.query(model.Points).filter(model.Points.id == 1).one().ignore == False
+
+def test_upgrade_triggers(session):
+    from autocnet.io.db.triggers import upgrade_triggers
+    upgrade_triggers(session.get_bind())
+    # Upgrading is idempotent
+    upgrade_triggers(session.get_bind())
+
+    model.Images.create(session, id=1, serial='ISISSERIAL1')
+    model.Points.create(session, id=1, pointtype=2)
+    for i in range(1, 4):
+        model.Measures.create(session, id=i, pointid=1, imageid=1,
+                              serial='ISISSERIAL1', measuretype=3, sample=0, line=0)
+    session.query(model.Images).filter(model.Images.id == 1).update({'ignore':True}, synchronize_session=False)
+    session.expire_all()
+    assert session.query(model.Points).filter(model.Points.id == 1).one().ignore == True
+
+def test_bulk_image_ignore(session):
+    for i in range(1, 4):
+        model.Images.create(session, id=i, serial=f'ISISSERIAL{i}')
+    model.Points.create(session, id=1, pointtype=2)
+    for i in range(1, 4):
+        model.Measures.create(session, id=i, pointid=1, imageid=i,
+                              serial=f'ISISSERIAL{i}', measuretype=3, sample=0, line=0)
+
+    session.query(model.Images).filter(model.Images.id.in_([1, 2])).update({'ignore':True}, synchronize_session=False)
+    session.expire_all()
+    ignored = session.query(model.Measures).filter(model.Measures.ignore == True).all()
+    assert sorted(m.imageid for m in ignored) == [1, 2]
+    assert session.query(model.Points).filter(model.Points.id == 1).one().ignore == True
@@ -0,0 +1,67 @@
+import sys
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+import pytest
+from shapely.geometry import MultiPolygon, Polygon, Point
+
+from autocnet.io.db import model
+from autocnet.io.db.spatial import images_at_points, points_near_existing, dedupe_points
+
+if sys.platform.startswith("darwin"):
+    pytest.skip("skipping DB tests for MacOS", allow_module_level=True)
+
+def test_images_at_points_single_query():
+    session = MagicMock()
+    with patch('autocnet.io.db.spatial.pd.read_sql') as read_sql:
+        images_at_points(session, [1, 2, 3], [4, 5, 6], srid=949900, columns=['id', 'path'])
+    assert read_sql.call_count == 1
+    sql = str(read_sql.call_args[0][0])
+    assert 'images.id, images.path' in sql
+    assert 'ignore' not in sql
+    assert read_sql.call_args[1]['params'] == {'lons':[1.0, 2.0, 3.0], 'lats':[4.0, 5.0, 6.0], 'srid':949900}
+
+def test_images_at_points_bad_column():
+    with pytest.raises(KeyError):
+        images_at_points(MagicMock(), [1], [4], columns=['id; DROP TABLE images'])
+
+def test_images_at_points_empty():
+    session = MagicMock()
+    df = images_at_points(session, [], [], columns=['id'])
+    assert len(df) == 0
+    assert list(df.columns) == ['point_index', 'id']
+    assert session.connection.call_count == 0
+
+def test_points_near_existing():
+    session = MagicMock()
+    session.execute.return_value = [(1,), (3,)]
+    near = points_near_existing(session, range(4), range(4), 0.01, srid=949900)
+    assert session.execute.call_count == 1
+    assert 'candidategroundpoints' in str(session.execute.call_args[0][0])
+    assert near.tolist() == [False, True, False, True]
+
+def test_dedupe_points():
+    session = MagicMock()
+    # The second point is near an existing point
+    session.execute.return_value = [(1,)]
+    lons = [0, 10, 0.005, 0.012, 10.001, 20]
+    lats = [0, 10, 0, 0, 10, 20]
+    keep = dedupe_points(session, lons, lats, 0.01, srid=949900)
+    assert session.execute.call_count == 1
+    # 2 is near 0. 3 is near 2, but 2 was dropped, so 3 is kept. 4 is only
+    # near 1, which was dropped because of the existing point.
+    assert keep.tolist() == [True, False, False, True, True, True]
+
+def test_images_at_points(session):
+    for i, x in enumerate([0, 1, 5], start=1):
+        geom = MultiPolygon([Polygon([(x, 0), (x+2, 0), (x+2, 2), (x, 2), (x, 0)])])
+        model.Images.create(session, id=i, serial=f'ISISSERIAL{i}', path=f'{i}.cub', geom=geom)
+
+    df = images_at_points(session, [0.5, 1.5, 10], [1, 1, 1])
+    assert list(zip(df.point_index, df.id)) == [(0, 1), (1, 1), (1, 2)]
+    assert df.path.tolist() == ['1.cub', '1.cub', '2.cub']
+
+def test_dedupe_points_db(session):
+    model.CandidateGroundPoints.create(session, path='base.cub', sample=0, line=0, geom=Point(0, 0))
+    keep = dedupe_points(session, [0.001, 1, 1.001], [0, 1, 1], 0.01)
+    assert keep.tolist() == [False, True, False]
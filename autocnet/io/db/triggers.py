@@ -1,3 +1,4 @@
+from sqlalchemy import text
 from sqlalchemy.schema import DDL
 
 valid_geom_function = DDL("""
@@ -30,20 +31,21 @@ CREATE OR REPLACE FUNCTION validate_points()
   RETURNS trigger AS
 $BODY$
 BEGIN
- IF (SELECT COUNT(*)
-	 FROM MEASURES
-	 WHERE pointid = NEW.pointid AND "measureIgnore" = False) < 2
- THEN
-   UPDATE points
-     SET "pointIgnore" = True
-	 WHERE points.id = NEW.pointid;
- ELSE
-   UPDATE points
-   SET "pointIgnore" = False
-   WHERE points.id = NEW.pointid;
- END IF;
-
- RETURN NEW;
+ -- Recompute the validity of each point touched by the statement once. Only
+ -- the points whose validity changes are written.
+ UPDATE points
+   SET "pointIgnore" = v.active < 2
+   FROM (SELECT affected.pointid,
+                COUNT(measures.id) FILTER (WHERE measures."measureIgnore" = False) AS active
+         FROM (SELECT pointid FROM new_measures
+               UNION
+               SELECT pointid FROM old_measures) AS affected
+         LEFT JOIN measures ON measures.pointid = affected.pointid
+         GROUP BY affected.pointid) AS v
+   WHERE points.id = v.pointid AND
+         points."pointIgnore" IS DISTINCT FROM (v.active < 2);
+
+ RETURN NULL;
 END;
 $BODY$
 
@@ -51,11 +53,14 @@ LANGUAGE plpgsql VOLATILE -- Says the function is implemented in the plpgsql lan
 COST 100; -- Estimated execution cost of the function.
 """)
 
+# A statement level trigger with transition tables (PostgreSQL >= 10) so that
+# mass updates of the measures check each point once instead of once per row.
 valid_point_trigger = DDL("""
 CREATE TRIGGER active_measure_changes
   AFTER UPDATE
   ON measures
-  FOR EACH ROW
+  REFERENCING OLD TABLE AS old_measures NEW TABLE AS new_measures
+  FOR EACH STATEMENT
 EXECUTE PROCEDURE validate_points();
 """)
 
@@ -64,14 +69,15 @@ CREATE OR REPLACE FUNCTION ignore_image()
   RETURNS trigger AS
 $BODY$
 BEGIN
- IF NEW.ignore
- THEN
-   UPDATE measures
-     SET "measureIgnore" = True
-     WHERE measures.serialnumber = NEW.serial;
- END IF;
-
- RETURN NEW;
+ -- A single update of the measures for all of the ignored images
+ UPDATE measures
+   SET "measureIgnore" = True
+   FROM new_images
+   WHERE new_images.ignore AND
+         measures.serialnumber = new_images.serial AND
+         measures."measureIgnore" IS DISTINCT FROM True;
+
+ RETURN NULL;
 END;
 $BODY$
 
@@ -83,6 +89,47 @@ ignore_image_trigger = DDL("""
 CREATE TRIGGER image_ignored
   AFTER UPDATE
   ON images
-  FOR EACH ROW
+  REFERENCING NEW TABLE AS new_images
+  FOR EACH STATEMENT
 EXECUTE PROCEDURE ignore_image();
 """)
+
+def upgrade_triggers(engine):
+    """
+    Replace the point validation (validate_points) and image ignore
+    (ignore_image) functions and their triggers in an existing database
+    with the current versions.
+
+    The triggers are only installed when the tables are first created (see
+    autocnet.io.db.model.try_db_creation), so a database created by an
+    earlier version of AutoCNet keeps the row level triggers until this is
+    called. The triggers and functions are dropped and recreated in a single
+    transaction, so the measures and images are never left without them.
+
+    Parameters
+    ----------
+    engine : sqlalchemy.engine.Engine
+             An engine connected to the database to upgrade, e.g., the engine
+             attribute of a NetworkCandidateGraph
+
+    Examples
+    --------
+    >>> from autocnet.io.db.triggers import upgrade_triggers
+    >>> upgrade_triggers(ncg.engine)  # doctest: +SKIP
+    """
+    with engine.connect() as conn:
+        version = conn.execute(text('SHOW server_version_num;')).scalar()
+        if int(version) < 100000:
+            raise Exception('The triggers use transition tables, which require PostgreSQL >= 10. '
+                            f'The server is version {version}.')
+
+        # The engines created by autocnet autocommit each statement
+        conn = conn.execution_options(isolation_level='READ COMMITTED')
+        with conn.begin():
+            conn.execute(text('DROP TRIGGER IF EXISTS active_measure_changes ON measures;'))
+            conn.execute(text('DROP TRIGGER IF EXISTS image_ignored ON images;'))
+            conn.execute(text('DROP FUNCTION IF EXISTS validate_points();'))
+            conn.execute(text('DROP FUNCTION IF EXISTS ignore_image();'))
+            for ddl in [valid_point_function, valid_point_trigger,
+                        ignore_image_function, ignore_image_trigger]:
+                conn.execute(ddl)
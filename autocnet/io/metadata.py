@@ -0,0 +1,210 @@
+import json
+import os
+
+import pvl
+
+from plio.io.io_gdal import GeoDataset
+from plio.io.isis_serial_number import generate_serial_number
+
+from autocnet.utils.lru import LRUCache
+
+
+class MetadataCache(LRUCache):
+    """
+    A least recently used cache of per image metadata (e.g., the pixel
+    type, serial number, and footprint) keyed by the image path and
+    modification time. Deriving this metadata means parsing the image label,
+    which for ISIS cubes can be many megabytes, so each image is parsed once
+    and the results are shared by all of the callers. If the image is
+    modified, the cached metadata are discarded.
+
+    Only the values derived from the label are cached, not the parsed label
+    itself, so each entry is small and the cache can be bounded by the
+    number of images (max_entries).
+
+    Optionally, the (JSON serializable) metadata are persisted to a sidecar
+    file next to the image so that they are also shared between processes
+    and runs.
+
+    Paths that can not be stat'ed (e.g., that do not exist) are not cached.
+
+    The hits and misses count the lookups of metadata values.
+
+    Attributes
+    ----------
+    sidecar : bool
+              If True, read and write the metadata from/to a sidecar file,
+              path + sidecar_ext
+
+    See Also
+    --------
+    autocnet.utils.lru.LRUCache
+    """
+    sidecar_ext = '.autocnet.json'
+
+    def __init__(self, max_entries=256, sidecar=False):
+        super(MetadataCache, self).__init__(max_entries=max_entries)
+        self.sidecar = sidecar
+
+    def __contains__(self, path):
+        return super(MetadataCache, self).__contains__(os.path.abspath(path))
+
+    def _entry(self, path):
+        """
+        Get the cache entry for a path, creating it (or replacing it if the
+        file has been modified) as needed.
+
+        Returns
+        -------
+         : dict
+           The cache entry or None if the path can not be cached
+        """
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except (OSError, TypeError, ValueError):
+            return
+        key = os.path.abspath(path)
+
+        entry = self._get(key)
+        if entry is None or entry['mtime'] != mtime:
+            entry = {'mtime':mtime}
+            if self.sidecar:
+                entry.update(self._read_sidecar(path, mtime))
+            self.put(key, entry)
+        return entry
+
+    def _read_sidecar(self, path, mtime):
+        try:
+            with open(path + self.sidecar_ext, 'r') as f:
+                persisted = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if persisted.get('mtime') != mtime:
+            return {}
+        return persisted
+
+    def _write_sidecar(self, path, entry):
+        try:
+            with open(path + self.sidecar_ext, 'w') as f:
+                json.dump(entry, f)
+        except OSError:
+            pass
+
+    def get(self, path, key, func, persist=True):
+        """
+        Get a metadata value for an image, computing and caching it if it
+        is not already cached.
+
+        Parameters
+        ----------
+        path : str
+               The path to the image
+
+        key : str
+              The name of the metadata value
+
+        func : callable
+               Called with the path to compute the value
+
+        persist : bool
+                  If True and the cache uses sidecar files, the value is
+                  written to the sidecar. The value must be JSON serializable.
+
+        Returns
+        -------
+         : object
+           The metadata value
+        """
+        with self._lock:
+            entry = self._entry(path)
+            if entry is not None and key in entry:
+                self.hits += 1
+                return entry[key]
+            self.misses += 1
+
+        value = func(path)
+
+        with self._lock:
+            entry = self._entry(path)
+            if entry is not None:
+                entry[key] = value
+                if self.sidecar and persist:
+                    self._write_sidecar(path, entry)
+        return value
+
+    def label(self, path):
+        """
+        The parsed PVL label of an image. The label is not cached; use the
+        methods for the values derived from it, e.g., pixel_type.
+        """
+        return pvl.load(path)
+
+    def _from_label(self, path, key):
+        """
+        Get a value derived from the label of an image. The label is parsed
+        once for all of the derived values, which are cached, and is then
+        discarded.
+        """
+        def func(p):
+            label = pvl.load(p)
+            values = {}
+            try:
+                values['pixel_type'] = label['IsisCube']['Core']['Pixels']['Type']
+            except (KeyError, TypeError):
+                pass
+            try:
+                values['projected'] = label.get('IsisCube').get('Mapping') is not None
+            except AttributeError:
+                pass
+            with self._lock:
+                entry = self._entry(p)
+                if entry is not None:
+                    entry.update(values)
+            return values[key]
+        return self.get(path, key, func)
+
+    def pixel_type(self, path):
+        """
+        The ISIS pixel type of a cube, e.g., 'Real'
+        """
+        return self._from_label(path, 'pixel_type')
+
+    def is_projected(self, path):
+        """
+        True if the ISIS cube has a Mapping group (is map projected)
+        """
+        return self._from_label(path, 'projected')
+
+    def serial(self, path):
+        """
+        The ISIS serial number of an image
+        """
+        return self.get(path, 'serial', generate_serial_number)
+
+    def raster_size(self, path, geodata=None):
+        """
+        The (samples, lines) size of an image. If the image is not cached,
+        the size is read from geodata or, if None, a new GeoDataset.
+        """
+        def func(p):
+            return list((geodata if geodata is not None else GeoDataset(p)).raster_size)
+        return tuple(self.get(path, 'raster_size', func))
+
+    def footprint(self, path, geodata=None):
+        """
+        The WKT of the first geometry of the image footprint. If the image
+        is not cached, the footprint is read from geodata or, if None, a new
+        GeoDataset.
+        """
+        def func(p):
+            return (geodata if geodata is not None else GeoDataset(p)).footprint.GetGeometryRef(0).ExportToWkt()
+        return self.get(path, 'footprint', func)
+
+    def invalidate(self, path):
+        """
+        Remove an image from the cache, if present.
+        """
+        super(MetadataCache, self).invalidate(os.path.abspath(path))
+
+# The process wide metadata cache
+metadata_cache = MetadataCache()
@@ -0,0 +1,91 @@
+import json
+import os
+from unittest.mock import patch
+
+import pytest
+
+from autocnet.io.metadata import MetadataCache
+
+label = {'IsisCube':{'Core':{'Pixels':{'Type':'Real'}}}}
+projected_label = {'IsisCube':{'Core':{'Pixels':{'Type':'SignedWord'}},
+                               'Mapping':{'ProjectionName':'Equirectangular'}}}
+
+@pytest.fixture
+def cube(tmpdir):
+    path = tmpdir.join('image.cub')
+    path.write('fake cube')
+    return str(path)
+
+def test_label_parsed_once(cube):
+    cache = MetadataCache()
+    with patch('autocnet.io.metadata.pvl.load', return_value=label) as load:
+        assert cache.pixel_type(cube) == 'Real'
+        assert cache.pixel_type(cube) == 'Real'
+        assert cache.is_projected(cube) == False
+    assert load.call_count == 1
+    assert cube in cache
+    # Only the derived values are kept
+    assert 'label' not in cache._get(os.path.abspath(cube))
+
+def test_modified_file_is_reparsed(cube):
+    cache = MetadataCache()
+    with patch('autocnet.io.metadata.pvl.load', side_effect=[label, projected_label]) as load:
+        assert cache.pixel_type(cube) == 'Real'
+        st = os.stat(cube)
+        os.utime(cube, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        assert cache.pixel_type(cube) == 'SignedWord'
+        assert cache.is_projected(cube) == True
+    assert load.call_count == 2
+
+def test_missing_path_is_not_cached():
+    cache = MetadataCache()
+    with patch('autocnet.io.metadata.pvl.load', return_value=label) as load:
+        assert cache.pixel_type('does_not_exist.cub') == 'Real'
+        assert cache.pixel_type('does_not_exist.cub') == 'Real'
+    assert load.call_count == 2
+    assert len(cache) == 0
+
+def test_serial(cube):
+    cache = MetadataCache()
+    with patch('autocnet.io.metadata.generate_serial_number', return_value='ISIS/1') as gsn:
+        assert cache.serial(cube) == 'ISIS/1'
+        assert cache.serial(cube) == 'ISIS/1'
+    assert gsn.call_count == 1
+    assert cache.stats['hits'] == 1
+
+def test_max_entries(tmpdir):
+    cache = MetadataCache(max_entries=2)
+    paths = []
+    for i in range(3):
+        path = tmpdir.join('{}.cub'.format(i))
+        path.write('fake cube')
+        paths.append(str(path))
+    with patch('autocnet.io.metadata.pvl.load', return_value=label):
+        for path in paths:
+            cache.pixel_type(path)
+    assert len(cache) == 2
+    assert paths[0] not in cache
+
+def test_sidecar(cube):
+    cache = MetadataCache(sidecar=True)
+    with patch('autocnet.io.metadata.pvl.load', return_value=label):
+        cache.pixel_type(cube)
+
+    with open(cube + MetadataCache.sidecar_ext) as f:
+        persisted = json.load(f)
+    assert persisted['pixel_type'] == 'Real'
+    assert persisted['mtime'] == os.stat(cube).st_mtime_ns
+    assert 'label' not in persisted
+
+    # A new cache (e.g., in another process) reads the sidecar
+    cache = MetadataCache(sidecar=True)
+    with patch('autocnet.io.metadata.pvl.load') as load:
+        assert cache.pixel_type(cube) == 'Real'
+    assert load.call_count == 0
+
+def test_stale_sidecar_is_ignored(cube):
+    with open(cube + MetadataCache.sidecar_ext, 'w') as f:
+        json.dump({'mtime':0, 'pixel_type':'UnsignedByte'}, f)
+    cache = MetadataCache(sidecar=True)
+    with patch('autocnet.io.metadata.pvl.load', return_value=label):
+        assert cache.pixel_type(cube) == 'Real'
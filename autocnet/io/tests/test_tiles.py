@@ -0,0 +1,175 @@
+import os
+
+import numpy as np
+import pytest
+
+from autocnet.io.tiles import TileCache, SharedTileStore
+
+
+class ArrayDataset(object):
+    """
+    A GeoDataset like object backed by an array with the same read_array
+    clipping behavior.
+    """
+    def __init__(self, arr, file_name):
+        self.arr = arr
+        self.file_name = file_name
+        self.reads = []
+
+    @property
+    def raster_size(self):
+        return self.arr.shape[::-1]
+
+    def read_array(self, band=1, pixels=None, dtype=None):
+        self.reads.append(pixels)
+        if pixels is None:
+            arr = self.arr
+        else:
+            xstart, ystart, xcount, ycount = pixels
+            arr = self.arr[ystart:ystart+ycount, xstart:xstart+xcount]
+        return arr.astype(dtype) if dtype else arr.copy()
+
+@pytest.fixture
+def geodata(tmpdir):
+    path = tmpdir.join('image.cub')
+    path.write('fake cube')
+    arr = np.arange(100 * 130, dtype=np.float32).reshape(100, 130)
+    return ArrayDataset(arr, str(path))
+
+@pytest.mark.parametrize("pixels", [[0, 0, 10, 10],
+                                    [15, 7, 40, 33],
+                                    [120, 90, 20, 20],
+                                    [31, 31, 1, 1],
+                                    [0, 0, 130, 100]])
+@pytest.mark.parametrize("dtype", [None, 'float64', 'uint16'])
+def test_read_array_matches_direct(geodata, pixels, dtype):
+    cache = TileCache(tile_size=32)
+    expected = geodata.read_array(pixels=pixels, dtype=dtype)
+    arr = cache.read_array(geodata, pixels=pixels, dtype=dtype)
+    np.testing.assert_array_equal(arr, expected)
+    assert arr.dtype == expected.dtype
+
+def test_overlapping_reads_hit(geodata):
+    cache = TileCache(tile_size=32)
+    cache.read_array(geodata, pixels=[10, 10, 40, 40])
+    nreads = len(geodata.reads)
+    assert nreads == 4
+    cache.read_array(geodata, pixels=[12, 12, 40, 40])
+    assert len(geodata.reads) == nreads
+    stats = cache.stats
+    assert stats['hits'] == 4
+    assert stats['misses'] == 4
+    assert stats['hit_rate'] == 0.5
+    assert stats['bytes_read'] == 4 * 32 * 32 * 4
+
+def test_eviction(geodata):
+    tile_bytes = 32 * 32 * 4
+    cache = TileCache(tile_size=32, max_bytes=2 * tile_bytes)
+    cache.read_array(geodata, pixels=[0, 0, 64, 32])
+    cache.read_array(geodata, pixels=[64, 0, 32, 32])
+    assert len(cache) == 2
+    assert cache.nbytes == 2 * tile_bytes
+    assert cache.stats['evictions'] == 1
+
+def test_modified_file_is_reread(geodata):
+    cache = TileCache(tile_size=32)
+    cache.read_array(geodata, pixels=[0, 0, 10, 10])
+    st = os.stat(geodata.file_name)
+    os.utime(geodata.file_name, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    cache.read_array(geodata, pixels=[0, 0, 10, 10])
+    assert cache.stats['misses'] == 2
+    assert len(cache) == 1
+
+@pytest.mark.parametrize("pixels, file_name, max_bytes", [(None, None, 2**20),
+                                                          ([0, 0, 10, 10], 'does_not_exist.cub', 2**20),
+                                                          ([0, 0, 10, 10], None, 0),
+                                                          ([-5, 0, 10, 10], None, 2**20)])
+def test_direct_reads(geodata, pixels, file_name, max_bytes):
+    if file_name is not None:
+        geodata.file_name = file_name
+    cache = TileCache(tile_size=32, max_bytes=max_bytes)
+    cache.read_array(geodata, pixels=pixels)
+    assert geodata.reads == [pixels]
+    assert len(cache) == 0
+
+def test_shared_tiles(geodata, tmpdir):
+    directory = str(tmpdir.join('shared'))
+    first = TileCache(tile_size=32)
+    first.share(directory, paths=[geodata.file_name])
+    first.read_array(geodata, pixels=[10, 10, 40, 40])
+    assert len(geodata.reads) == 4
+
+    # A second process reads the tiles from the shared store
+    second = TileCache(tile_size=32, shared=SharedTileStore(directory))
+    arr = second.read_array(geodata, pixels=[12, 12, 40, 40])
+    np.testing.assert_array_equal(arr, geodata.arr[12:52, 12:52])
+    assert len(geodata.reads) == 4
+    assert second.stats['shared_hits'] == 4
+    assert second.stats['misses'] == 4
+
+def test_shared_tiles_only_for_paths(geodata, tmpdir):
+    directory = str(tmpdir.join('shared'))
+    cache = TileCache(tile_size=32)
+    cache.share(directory, paths=['mosaic.cub'])
+    cache.read_array(geodata, pixels=[0, 0, 10, 10])
+    assert os.listdir(directory) == []
+
+    cache.share(directory, paths=[geodata.file_name])
+    assert cache.shared.paths == {os.path.abspath('mosaic.cub'), os.path.abspath(geodata.file_name)}
+    cache.unshare()
+    assert cache.shared is None
+
+def test_shared_tiles_modified_file(geodata, tmpdir):
+    store = SharedTileStore(str(tmpdir.join('shared')))
+    TileCache(tile_size=32, shared=store).read_array(geodata, pixels=[0, 0, 10, 10])
+    st = os.stat(geodata.file_name)
+    os.utime(geodata.file_name, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    cache = TileCache(tile_size=32, shared=store)
+    cache.read_array(geodata, pixels=[0, 0, 10, 10])
+    assert cache.stats['shared_hits'] == 0
+    assert len(geodata.reads) == 2
+
+def test_shared_tiles_cleanup_stale(geodata, tmpdir):
+    directory = str(tmpdir.join('shared'))
+    store = SharedTileStore(directory, max_bytes=None)
+    TileCache(tile_size=32, shared=store).read_array(geodata, pixels=[0, 0, 10, 10])
+    assert len(os.listdir(directory)) == 1
+    assert store.cleanup() == 0
+
+    # The tiles of a modified image are removed
+    st = os.stat(geodata.file_name)
+    os.utime(geodata.file_name, ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+    assert store.cleanup() > 0
+    assert os.listdir(directory) == []
+
+def test_shared_tiles_budget(geodata, tmpdir):
+    directory = str(tmpdir.join('shared'))
+    cache = TileCache(tile_size=32)
+    cache.share(directory, max_bytes=None)
+    tile_nbytes = 32 * 32 * geodata.arr.itemsize
+    cache.read_array(geodata, pixels=[0, 0, 64, 64])
+    tiles = [f for d in os.listdir(directory) for f in os.listdir(os.path.join(directory, d)) if f.endswith('.npy')]
+    assert len(tiles) == 4
+
+    # Reading a tile from the store marks it as recently used
+    second = TileCache(tile_size=32, shared=cache.shared)
+    second.read_array(geodata, pixels=[0, 0, 10, 10])
+    assert second.stats['shared_hits'] == 1
+    image_dir = os.path.join(directory, os.listdir(directory)[0])
+    for i, name in enumerate(sorted(os.listdir(image_dir))):
+        if name.endswith('.npy') and name != '1_None_0_0.npy':
+            os.utime(os.path.join(image_dir, name), ns=(i, i))
+
+    cache.shared.cleanup(max_bytes=2 * tile_nbytes + 1024)
+    remaining = sorted(f for f in os.listdir(image_dir) if f.endswith('.npy'))
+    assert len(remaining) == 2
+    assert '1_None_0_0.npy' in remaining
+
+def test_shared_tiles_put_triggers_cleanup(tmpdir, mocker):
+    # Each process sweeps the store after writing a quarter of the budget
+    store = SharedTileStore(str(tmpdir.join('shared')), max_bytes=4 * 8 * 200)
+    cleanup = mocker.patch.object(store, 'cleanup')
+    tile = np.zeros((10, 10))
+    for i in range(2):
+        store.put(('image.cub', 1, 'None', i, 0), 1, 32, tile)
+    assert cleanup.call_count == 1
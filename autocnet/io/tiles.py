@@ -0,0 +1,399 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+from autocnet.utils.lru import LRUCache
+
+
+class SharedTileStore(object):
+    """
+    A node local, read only store of decoded image tiles that is shared by
+    all of the processes on a host. Each tile is written once to a .npy file
+    in a directory (e.g., on /dev/shm so that the tiles are held in shared
+    memory) and is memory mapped by the readers, so concurrent workers read
+    and decode each region of an image once per host rather than once per
+    process.
+
+    Tiles are written atomically, so readers only ever see complete tiles
+    and concurrent writers of the same tile are harmless. The tiles of an
+    image are keyed by its absolute path, modification time, and the tile
+    size, so a modified image is never served stale tiles.
+
+    The store is bounded by a byte budget. Each process sweeps the store
+    with cleanup after it has written a quarter of the budget, removing the
+    tiles of images that have since been modified or deleted and then the
+    least recently used tiles until the store is within the budget. Tiles
+    that are memory mapped by a reader stay valid after they are removed.
+
+    Attributes
+    ----------
+    directory : str
+                The directory that the tiles are stored in
+
+    paths : set
+            The absolute paths of the images to share. If None, the tiles
+            of all images are shared.
+
+    max_bytes : int
+                The budget for the size of the stored tiles in bytes. If
+                None, the store is not bounded.
+    """
+    def __init__(self, directory, paths=None, max_bytes=2**32):
+        self.directory = directory
+        self.paths = None if paths is None else {os.path.abspath(p) for p in paths}
+        self.max_bytes = max_bytes
+        self._written = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def __contains__(self, path):
+        return self.paths is None or os.path.abspath(path) in self.paths
+
+    def _tile_path(self, key, mtime, tile_size):
+        path, band, dtype, tx, ty = key
+        image = hashlib.sha1(f'{os.path.abspath(path)}:{mtime}:{tile_size}'.encode()).hexdigest()
+        return os.path.join(self.directory, image, f'{band}_{dtype}_{tx}_{ty}.npy')
+
+    def get(self, key, mtime, tile_size):
+        """
+        Get a memory mapped tile or None if it has not been stored
+        """
+        tile_path = self._tile_path(key, mtime, tile_size)
+        try:
+            tile = np.load(tile_path, mmap_mode='r')
+        except (OSError, ValueError):
+            return
+        try:
+            # The modification time of a tile is its last use for cleanup
+            os.utime(tile_path)
+        except OSError:
+            pass
+        return tile
+
+    def put(self, key, mtime, tile_size, tile):
+        """
+        Store a tile. Failures to write, e.g., a full device, are ignored.
+        """
+        tile_path = self._tile_path(key, mtime, tile_size)
+        dirname = os.path.dirname(tile_path)
+        try:
+            os.makedirs(dirname, exist_ok=True)
+            # Record the image the tiles are from so that cleanup can find stale tiles
+            source = os.path.join(dirname, 'source.json')
+            if not os.path.exists(source):
+                self._write_atomic(dirname, source, json.dumps({'path':os.path.abspath(key[0]),
+                                                                 'mtime':mtime}).encode())
+            self._write_atomic(dirname, tile_path, tile)
+        except OSError:
+            return
+
+        self._written += tile.nbytes
+        if self.max_bytes is not None and self._written >= self.max_bytes / 4:
+            self.cleanup()
+
+    @staticmethod
+    def _write_atomic(dirname, path, data):
+        fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                if isinstance(data, bytes):
+                    f.write(data)
+                else:
+                    np.save(f, data)
+            os.replace(tmp, path)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+    @staticmethod
+    def _is_stale(source):
+        try:
+            with open(source) as f:
+                image = json.load(f)
+        except (OSError, ValueError):
+            # The directory is being created or was not written by this store
+            return False
+        try:
+            return os.stat(image['path']).st_mtime_ns != image['mtime']
+        except OSError:
+            return True
+
+    def cleanup(self, max_bytes=None):
+        """
+        Remove the tiles of images that have been modified or deleted since
+        the tiles were stored, then remove the least recently used tiles
+        until the store is within the budget. This can be called by any of
+        the processes sharing the store.
+
+        Parameters
+        ----------
+        max_bytes : int
+                    The budget in bytes. Default: the max_bytes of the store
+
+        Returns
+        -------
+         : int
+           The number of bytes removed
+        """
+        if max_bytes is None:
+            max_bytes = self.max_bytes
+        self._written = 0
+
+        nremoved = 0
+        tiles = []
+        try:
+            images = list(os.scandir(self.directory))
+        except OSError:
+            return nremoved
+        for image in images:
+            if not image.is_dir():
+                continue
+            try:
+                entries = [(e.path, e.stat()) for e in os.scandir(image.path) if e.name.endswith('.npy')]
+            except OSError:
+                continue
+            if self._is_stale(os.path.join(image.path, 'source.json')):
+                shutil.rmtree(image.path, ignore_errors=True)
+                nremoved += sum(st.st_size for _, st in entries)
+                continue
+            tiles.extend((st.st_mtime_ns, st.st_size, path) for path, st in entries)
+
+        if max_bytes is not None:
+            nbytes = sum(size for _, size, _ in tiles)
+            for _, size, path in sorted(tiles):
+                if nbytes <= max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except OSError:
+                    continue
+                nbytes -= size
+                nremoved += size
+        return nremoved
+
+
+class TileCache(LRUCache):
+    """
+    A least recently used cache of fixed size image tiles, addressed by
+    (path, band, dtype, tile_x, tile_y). Windows (e.g., ROIs around measures)
+    are assembled from the cached tiles so that overlapping windows on the
+    same image are only read and decoded once.
+
+    The cache is bounded by a memory budget. When adding a tile would exceed
+    the budget, the least recently used tiles are evicted. A budget of 0
+    disables the cache and all reads go directly to the image.
+
+    Optionally, tiles that are not in the cache are taken from (and added
+    to) a SharedTileStore that is shared by all of the processes on the
+    host. See share.
+
+    Reads are only cached for objects with a file_name that exists on disk;
+    if the file is modified, its tiles are discarded. Full image reads
+    (pixels=None), reads that start outside of the image, and reads from
+    south up images go directly to the image.
+
+    The hits and misses count the tiles served from and missing from the
+    cache.
+
+    Attributes
+    ----------
+    tile_size : int
+                The width and height of the tiles in pixels
+
+    bytes_read : int
+                 The number of bytes read from the images to fill the cache
+
+    shared : SharedTileStore
+             The node local tile store or None
+
+    shared_hits : int
+                  The number of missed tiles served from the shared store
+
+    See Also
+    --------
+    autocnet.utils.lru.LRUCache
+    """
+    def __init__(self, tile_size=256, max_bytes=2**28, shared=None):
+        super(TileCache, self).__init__(max_bytes=max_bytes)
+        self.tile_size = tile_size
+        self.shared = shared
+        self._mtimes = {}
+        self.bytes_read = 0
+        self.shared_hits = 0
+
+    def _cacheable_path(self, geodata):
+        """
+        Return the path of the image if reads from it can be cached, else None.
+        Tiles from a modified image are discarded.
+        """
+        path = getattr(geodata, 'file_name', None)
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except (OSError, TypeError, ValueError):
+            return
+        with self._lock:
+            if self._mtimes.get(path, mtime) != mtime:
+                self.invalidate(path)
+            self._mtimes[path] = mtime
+        return path
+
+    def _get_tile(self, geodata, path, band, dtype, tx, ty, raster_size):
+        key = (path, band, str(dtype), tx, ty)
+        tile = self.get(key)
+        if tile is not None:
+            return tile
+
+        shared = self.shared
+        if shared is not None and path in shared:
+            mtime = self._mtimes.get(path)
+            tile = shared.get(key, mtime, self.tile_size)
+        else:
+            shared = None
+
+        if tile is not None:
+            with self._lock:
+                self.shared_hits += 1
+        else:
+            xstart = tx * self.tile_size
+            ystart = ty * self.tile_size
+            pixels = [xstart, ystart,
+                      min(self.tile_size, raster_size[0] - xstart),
+                      min(self.tile_size, raster_size[1] - ystart)]
+            tile = geodata.read_array(band=band, pixels=pixels, dtype=dtype)
+            if shared is not None:
+                shared.put(key, mtime, self.tile_size, tile)
+            with self._lock:
+                self.bytes_read += tile.nbytes
+
+        self.put(key, tile, nbytes=tile.nbytes)
+        return tile
+
+    def read_array(self, geodata, band=1, pixels=None, dtype=None):
+        """
+        Read a window from an image through the cache. This has the same
+        signature and result as GeoDataset.read_array.
+
+        Parameters
+        ----------
+        geodata : object
+                  A GeoDataset or other object with read_array, raster_size,
+                  and file_name attributes
+
+        band : int
+               The band to read
+
+        pixels : list
+                 [xstart, ystart, xcount, ycount] of the window to read
+
+        dtype : str
+                The data type of the returned array
+
+        Returns
+        -------
+         : ndarray
+           The window
+        """
+        if pixels is None or self.max_bytes <= 0:
+            return geodata.read_array(band=band, pixels=pixels, dtype=dtype)
+
+        path = self._cacheable_path(geodata)
+        xstart, ystart, xcount, ycount = map(int, pixels)
+        if path is None or xstart < 0 or ystart < 0 or not getattr(geodata, 'north_up', True):
+            return geodata.read_array(band=band, pixels=pixels, dtype=dtype)
+
+        raster_size = geodata.raster_size
+        xstop = min(xstart + xcount, raster_size[0])
+        ystop = min(ystart + ycount, raster_size[1])
+        if xstop <= xstart or ystop <= ystart:
+            return geodata.read_array(band=band, pixels=pixels, dtype=dtype)
+
+        ts = self.tile_size
+        arr = None
+        for ty in range(ystart // ts, (ystop - 1) // ts + 1):
+            for tx in range(xstart // ts, (xstop - 1) // ts + 1):
+                tile = self._get_tile(geodata, path, band, dtype, tx, ty, raster_size)
+                if arr is None:
+                    arr = np.empty((ystop - ystart, xstop - xstart), dtype=tile.dtype)
+
+                # The intersection of the tile and the window in image space
+                x0 = max(xstart, tx * ts)
+                x1 = min(xstop, (tx + 1) * ts)
+                y0 = max(ystart, ty * ts)
+                y1 = min(ystop, (ty + 1) * ts)
+                arr[y0-ystart:y1-ystart, x0-xstart:x1-xstart] = tile[y0-ty*ts:y1-ty*ts, x0-tx*ts:x1-tx*ts]
+        return arr
+
+    def share(self, directory, paths=None, max_bytes=2**32):
+        """
+        Share the tiles of some or all images with the other processes on
+        the host through a SharedTileStore. This is intended for images that
+        many workers read, e.g., a ground mosaic. When a new store is opened,
+        the tiles of modified images (e.g., left by earlier jobs) are removed.
+
+        Parameters
+        ----------
+        directory : str
+                    The node local directory to store the tiles in, e.g., a
+                    directory on /dev/shm. All of the processes sharing the
+                    tiles must use the same directory.
+
+        paths : iterable
+                The paths of the images to share. If None, all images are
+                shared.
+
+        max_bytes : int
+                    The budget for the size of the shared store in bytes
+        """
+        with self._lock:
+            if self.shared is not None and self.shared.directory == directory:
+                # Add the paths to the images that are already shared
+                if self.shared.paths is None:
+                    return
+                if paths is not None:
+                    self.shared.paths.update(os.path.abspath(p) for p in paths)
+                    return
+            self.shared = SharedTileStore(directory, paths=paths, max_bytes=max_bytes)
+            self.shared.cleanup()
+
+    def unshare(self):
+        """
+        Stop using the shared tile store. The stored tiles are not removed.
+        """
+        with self._lock:
+            self.shared = None
+
+    def invalidate(self, path):
+        """
+        Remove all of the tiles for an image from the cache.
+        """
+        with self._lock:
+            for key in [k for k in self._entries if k[0] == path]:
+                self._pop(key)
+            self._mtimes.pop(path, None)
+
+    def clear(self):
+        """
+        Remove all tiles from the cache and reset the statistics.
+        """
+        with self._lock:
+            super(TileCache, self).clear()
+            self._mtimes.clear()
+            self.bytes_read = 0
+            self.shared_hits = 0
+
+    @property
+    def stats(self):
+        """
+        A dict of cache statistics
+        """
+        stats = super(TileCache, self).stats
+        stats.update({'shared_hits':self.shared_hits,
+                      'bytes_read':self.bytes_read,
+                      'tile_size':self.tile_size})
+        return stats
+
+# The process wide tile cache
+tile_cache = TileCache()
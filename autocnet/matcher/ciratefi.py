@@ -120,39 +120,22 @@ def cifi(template, search_image, thresh=90, use_percentile=True,
 
     # Cifi2 -- Circular Sample on Target Image
     search_result = np.empty((search_image.shape[0], search_image.shape[1], len(radii)))
+    y, x = np.ogrid[:search_image.shape[0], :search_image.shape[1]]
 
-    for i, y in enumerate(range(search_image.shape[0])):
-        for j, x in enumerate(range(search_image.shape[1])):
-            for k, r in enumerate(radii):
-                inv_area = 1 / (2 * math.pi * r)
+    for k, r in enumerate(radii):
+        inv_area = 1 / (2 * math.pi * r)
+        s = ring_sums(search_image, r) * inv_area
 
-                mask = circ_mask(search_image.shape, (i,j), r)
-                s = np.sum(search_image[mask]) * inv_area
-
-                if s == 0 or y < r or x < r or y+r > search_image.shape[0] or x+r > search_image.shape[1]:
-                    s = -1
-                search_result[i, j, k] = s
+        invalid = (s == 0) | (y < r) | (x < r) | (y+r > search_image.shape[0]) | (x+r > search_image.shape[1])
+        s[invalid] = -1
+        search_result[:, :, k] = s
 
     # Perform Normalized Cross-Correlation between template and target image
-    coeffs = np.empty((search_result.shape[0], search_result.shape[1]))
-    best_scales = np.empty((search_result.shape[0], search_result.shape[1]))
-
-    for y in range(search_result.shape[0]):
-        for x in range(search_result.shape[1]):
-            scale = 0
-            max_coeff = -math.inf
-            for i in range(template_result.shape[0]):
-
-                result = cv2.matchTemplate(template_result[i].astype(np.float32),
-                                           search_result[y, x].astype(np.float32), method=cv2.TM_CCORR_NORMED)
-                score = np.average(result)
-
-                if score > max_coeff:
-                    max_coeff = score
-                    scale = i
-
-            coeffs[y, x] = max_coeff
-            best_scales[y, x] = scales[scale]
+    # at all scales, (rows, columns, scales)
+    scores = _ccorr_normed(template_result[np.newaxis, np.newaxis, :, :],
+                           search_result[:, :, np.newaxis, :])
+    coeffs = np.max(scores, axis=-1).astype(float)
+    best_scales = scales[np.argmax(scores, axis=-1)].astype(float)
 
     # get first grade candidate points
 
@@ -295,15 +278,13 @@ def rafi(template, search_image, candidate_pixels, best_scales, thresh=95,
     else:
         radius = radii[bisect_left(radii, rad_thresh)]
 
-    for i in range(len(template_alpha_samples)):
-        # Create Radial Line Mask
-        mask = radial_line_mask(template.shape, (center_y, center_x), radius, alpha=alpha_list[i])
-
-        # Sum the values
-        template_alpha_samples[i] = np.sum(template[mask])/radius
+    # Sum the values along each radial line
+    masks = radial_line_masks(template.shape, (center_y, center_x), radius, alpha_list)
+    template_alpha_samples = masks.reshape(len(alpha_list), -1).dot(template.ravel().astype(float)) / radius
 
     # Rafi 2 -- Get Radial Samples of the Search Image for all First Grade Candidate Points
     rafi_alpha_means = np.zeros((len(candidate_pixels), len(alpha_list)))
+    search_masks = {}
 
     for i in range(len(candidate_pixels)):
         y, x = candidate_pixels[i]
@@ -322,38 +303,24 @@ def rafi(template, search_image, candidate_pixels, best_scales, thresh=95,
             rafi_alpha_means[i] = np.negative(np.ones(len(alpha_list)))
             continue
 
-        for j in range(len(alpha_list)):
-            # Create Radial Mask
-            mask = radial_line_mask(scaled_img.shape, (scaled_center_y, scaled_center_x),
-                                         scaled_center_y, alpha=alpha_list[j])
-            rafi_alpha_means[i, j] = np.sum(scaled_img[mask])/radius
+        # The radial masks only depend on the shape of the scaled window
+        key = scaled_img.shape
+        if key not in search_masks:
+            search_masks[key] = radial_line_masks(scaled_img.shape, (scaled_center_y, scaled_center_x),
+                                                  scaled_center_y, alpha_list).reshape(len(alpha_list), -1)
+        rafi_alpha_means[i] = search_masks[key].dot(scaled_img.ravel().astype(float)) / radius
 
-    best_rotation = np.zeros(len(candidate_pixels))
-    rafi_coeffs = np.zeros(len(candidate_pixels))
+    # Perform Normalized Cross-Correlation between template and target image
+    # for all circular shifts of the template sums, (candidates, shifts)
+    shifted_template_angle_sums = np.stack([np.roll(template_alpha_samples, j) for j in range(len(alpha_list))])
+    scores = _ccorr_normed(shifted_template_angle_sums[np.newaxis, :, :],
+                           rafi_alpha_means[:, np.newaxis, :])
+    rafi_coeffs = np.max(scores, axis=-1).astype(float)
+    best_rotation = alpha_list[np.argmax(scores, axis=-1)]
 
     if verbose: # pragma: no cover
         image_pixels = np.zeros((search_image.shape[0], search_image.shape[1]))
-
-    # Perform Normalized Cross-Correlation between template and target image
-    for i in range(len(candidate_pixels)):
-        maxcoeff = -math.inf
-        maxrotate = 0
-        y, x = candidate_pixels[i]
-        for j in range(len(alpha_list)):
-            # perform circular shifting of template sums
-            shifted_template_angle_sums = np.roll(template_alpha_samples, j)
-            result = cv2.matchTemplate(shifted_template_angle_sums.astype(np.float32),
-                                       rafi_alpha_means[i].astype(np.float32), method=cv2.TM_CCORR_NORMED)
-            score = np.average(result)
-
-            if score > maxcoeff:
-                maxcoeff = score
-                maxrotate = j
-
-        rafi_coeffs[i] = maxcoeff
-        best_rotation[i] = alpha_list[maxrotate]
-        if verbose: # pragma: no cover
-            image_pixels[y, x] = maxcoeff
+        image_pixels[candidate_pixels[:, 0], candidate_pixels[:, 1]] = rafi_coeffs
 
     # Get second grade candidate points and best rotation
 
@@ -487,6 +454,7 @@ def tefi(template, search_image, candidate_pixels, best_scales, best_angles,
 
     alpha_list = np.arange(0, 2*math.pi, alpha)
     candidate_pixels *= int(upsampling)
+    transformed_templates = {}
 
     # Tefi -- Template Matching Filter
     for i in range(len(candidate_pixels)):
@@ -506,8 +474,12 @@ def tefi(template, search_image, candidate_pixels, best_scales, best_angles,
 
         max_coeff = -math.inf
         for j in range(scalesxalphas.shape[0]):
-            transformed_template = rescale(u_template, scalesxalphas[j][0],preserve_range=True, multichannel=False)
-            transformed_template = rotate(transformed_template, scalesxalphas[j][1])
+            # The transformed templates are shared by all of the candidates
+            key = (scalesxalphas[j][0], scalesxalphas[j][1])
+            if key not in transformed_templates:
+                transformed_template = rescale(u_template, key[0], preserve_range=True, multichannel=False)
+                transformed_templates[key] = rotate(transformed_template, key[1]).astype(np.float32)
+            transformed_template = transformed_templates[key]
 
             y_window, x_window = (math.floor(transformed_template.shape[0]/2),
                                   math.floor(transformed_template.shape[1]/2))
@@ -518,7 +490,7 @@ def tefi(template, search_image, candidate_pixels, best_scales, best_angles,
                cropped_search.shape != transformed_template.shape):
                 score = -1
             else:
-                result = cv2.matchTemplate(transformed_template.astype(np.float32), cropped_search.astype(np.float32), method=cv2.TM_CCORR_NORMED)
+                result = cv2.matchTemplate(transformed_template, cropped_search.astype(np.float32), method=cv2.TM_CCORR_NORMED)
                 score = np.average(result)
 
             if score > max_coeff:
@@ -738,3 +710,111 @@ def radial_line_mask(shape, center, radius, alpha=0.19460421, atol=.01):
     anglemask = np.isclose(theta, [alpha], atol=atol)
 
     return line_mask*anglemask
+
+
+def radial_line_masks(shape, center, radius, alphas, atol=.01):
+    """
+    Generates a stack of linear masks from center, one for each angle in
+    alphas. This is equivalent to calling radial_line_mask for each angle,
+    but computes the polar coordinate grid once.
+
+    parameters
+    ----------
+    shape : tuple
+            tuple decribing the desired mask shape in
+            (y,x)
+
+    center : tuple
+             tuple describing the desired center
+             for the circle
+
+    radius : float
+             radius of the line masks
+
+    alphas : iterable
+             angles for the line masks
+
+    atol : float
+           absolute tolerance for alpha, the higher
+           the tolerance, the wider the angle bandwidth
+
+    returns
+    -------
+
+    masks : ndarray
+            (len(alphas), y, x) linear masks of bools
+    """
+    r, theta = to_polar_coord(shape, center)
+
+    line_mask = r <= radius**2
+    alphas = np.asarray(alphas, dtype=float).reshape(-1, 1, 1)
+    anglemask = np.isclose(theta[np.newaxis], alphas, atol=atol)
+
+    return line_mask[np.newaxis] * anglemask
+
+
+def ring_sums(image, radius):
+    """
+    Sum the values of an image on the circle of the given radius around
+    every pixel. This is equivalent to summing image[circ_mask(image.shape, (y, x), radius)]
+    for every (y, x), but is computed as a sparse convolution with the ring
+    kernel. Pixels on the ring that fall outside of the image contribute 0.
+
+    parameters
+    ----------
+    image : ndarray
+            (y, x) image
+
+    radius : float
+             radius of the ring
+
+    returns
+    -------
+
+    sums : ndarray
+           (y, x) array of ring sums
+    """
+    # The ring kernel, pixels whose squared distance from the center is exactly radius**2
+    extent = int(math.ceil(radius))
+    d = np.arange(-extent, extent + 1)
+    dy, dx = np.meshgrid(d, d, indexing='ij')
+    on_ring = dy*dy + dx*dx == radius*radius
+
+    h, w = image.shape
+    padded = np.pad(np.asarray(image, dtype=float), extent)
+    sums = np.zeros((h, w))
+    for oy, ox in zip(dy[on_ring], dx[on_ring]):
+        sums += padded[extent+oy:extent+oy+h, extent+ox:extent+ox+w]
+    return sums
+
+
+def _ccorr_normed(image, template):
+    """
+    Vectorized cv2.matchTemplate(image, template, method=cv2.TM_CCORR_NORMED)
+    for 1d samples of the same length, along the last axis. The inputs are
+    broadcast against one another. Like OpenCV, the samples and scores are
+    float32 and scores that can not be normalized are set to 0.
+
+    parameters
+    ----------
+    image : ndarray
+            (..., n) samples
+
+    template : ndarray
+               (..., n) samples
+
+    returns
+    -------
+
+    scores : ndarray
+             (...) normalized cross correlation coefficients
+    """
+    image = np.asarray(image, dtype=np.float32).astype(float)
+    template = np.asarray(template, dtype=np.float32).astype(float)
+
+    num = np.sum(image * template, axis=-1)
+    t = np.sqrt(np.sum(image * image, axis=-1)) * np.sqrt(np.sum(template * template, axis=-1))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        scores = np.where(np.abs(num) < t, num / t,
+                          np.where(np.abs(num) < t * 1.125, np.sign(num), 0))
+    return scores.astype(np.float32)
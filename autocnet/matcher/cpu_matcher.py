@@ -5,10 +5,12 @@ import pandas as pd
 
 import cv2
 
+from autocnet.utils.lru import LRUCache
+
 FLANN_INDEX_KDTREE = 1  # Algorithm to set centers,
 DEFAULT_FLANN_PARAMETERS = dict(algorithm=FLANN_INDEX_KDTREE, trees=3)
 
-def match(edge, k=2, **kwargs):
+def match(edge, k=2, index_cache=None, **kwargs):
     """
     Given two sets of descriptors, utilize a FLANN (Approximate Nearest
     Neighbor KDTree) matcher to find the k nearest matches.  Nearness is
@@ -20,25 +22,13 @@ def match(edge, k=2, **kwargs):
     ----------
     k : int
 	The number of neighbors to find
-    """
 
-    def _add_matches(matches):
-        """
-        Given a dataframe of matches, either append to an existing
-        matches edge attribute or initially populate said attribute.
-
-        Parameters
-        ----------
-        matches : dataframe
-                  A dataframe of matches
-        """
-        if edge.matches.empty:
-            edge.matches = matches
-        else:
-            df = edge.matches
-            edge.matches = df.append(matches,
-                                     ignore_index=True,
-                                     verify_integrity=True)
+    index_cache : FlannIndexCache
+                  An optional cache of per node trained matchers. When a
+                  node's descriptors are not subset (e.g., no MBR has been
+                  computed), the node's index is taken from (or added to)
+                  the cache instead of being trained for this edge.
+    """
 
     def mono_matches(a, b, aidx=None, bidx=None):
         """
@@ -57,45 +47,137 @@ def match(edge, k=2, **kwargs):
 
     	bidx : iterable
     		An index for the descriptors to subset
+
+        Returns
+        -------
+         : dataframe
+           The matches from b into a
     	"""
     	# Subset if requested
-        if aidx is not None:
-            ad = a.descriptors[aidx]
-        else:
-            ad = a.descriptors
-
         if bidx is not None:
             bd = b.descriptors[bidx]
         else:
             bd = b.descriptors
 
+        if index_cache is not None and _is_full_index(a.descriptors, aidx):
+            fl = index_cache.get(a['node_id'])
+            if fl is None:
+                fl = FlannMatcher()
+                fl.add(a.descriptors, a['node_id'])
+                fl.train()
+                index_cache.put(a['node_id'], fl, a.descriptors.nbytes)
+            return fl.query(bd, b['node_id'], k, index=bidx)
+
+        if aidx is not None:
+            ad = a.descriptors[aidx]
+        else:
+            ad = a.descriptors
+
         # Load, train, and match
+        fl = FlannMatcher()
         fl.add(ad, a['node_id'], index=aidx)
         fl.train()
-        matches = fl.query(bd, b['node_id'], k, index=bidx)
-        _add_matches(matches)
-        fl.clear()
-
-    fl = FlannMatcher()
+        return fl.query(bd, b['node_id'], k, index=bidx)
 
     # Get the correct descriptors
     aidx = kwargs.pop('aidx', None)
     bidx = kwargs.pop('bidx', None)
 
-    mono_matches(edge.source, edge.destination, aidx=aidx, bidx=bidx)
+    # Collect the matches and concatenate once
+    matches = []
+    if not edge.matches.empty:
+        # The keypoint coordinates are joined below for all of the matches
+        matches.append(edge.matches.drop(columns=['source_x', 'source_y',
+                                                  'destination_x', 'destination_y'],
+                                         errors='ignore'))
+    matches.append(mono_matches(edge.source, edge.destination, aidx=aidx, bidx=bidx))
     # Swap the indices since mono_matches is generic and source/destin are
     # swapped
-    mono_matches(edge.destination, edge.source, aidx=bidx, bidx=aidx)
+    matches.append(mono_matches(edge.destination, edge.source, aidx=bidx, bidx=aidx))
+    edge.matches = pd.concat(matches, ignore_index=True)
 
     source_keypoints = edge.source.keypoints[['x', 'y']]
-    source_keypoints.rename(columns={'x': 'source_x', 'y': 'source_y'}, inplace=True)
+    source_keypoints = source_keypoints.rename(columns={'x': 'source_x', 'y': 'source_y'})
     edge.matches = edge.matches.join(source_keypoints, 'source_idx')
 
     destination_keypoints = edge.destination.keypoints[['x', 'y']]
-    destination_keypoints.rename(columns={'x': 'destination_x', 'y': 'destination_y'}, inplace=True)
+    destination_keypoints = destination_keypoints.rename(columns={'x': 'destination_x', 'y': 'destination_y'})
     edge.matches = edge.matches.join(destination_keypoints, 'destination_idx')
     edge.matches.sort_values(by=['distance'])
 
+def _is_full_index(descriptors, index):
+    """
+    Check whether an index selects all of the descriptors, in order.
+
+    Parameters
+    ----------
+    descriptors : ndarray
+                  (n, m) array of descriptors
+
+    index : iterable
+            An index for the descriptors to subset or None
+
+    Returns
+    -------
+     : bool
+       True if the index is None or is equal to range(n)
+    """
+    if index is None:
+        return True
+    if len(index) != len(descriptors):
+        return False
+    return np.array_equal(np.asarray(index), np.arange(len(descriptors)))
+
+def edges_by_node(graph):
+    """
+    Order the edges of a graph so that all of the edges incident to a node
+    are visited consecutively. This keeps a node's trained index in a
+    FlannIndexCache hot while all of its neighbors are queried against it.
+
+    Parameters
+    ----------
+    graph : object
+            A networkx graph with an Edge object stored in the 'data'
+            attribute of each edge
+
+    Returns
+    -------
+    edges : list
+            of Edge objects
+    """
+    edges = []
+    seen = set()
+    for n in sorted(graph.nodes):
+        for s, d, edge in graph.edges(n, data='data'):
+            key = (min(s, d), max(s, d))
+            if key in seen:
+                continue
+            seen.add(key)
+            edges.append(edge)
+    return edges
+
+
+class FlannIndexCache(LRUCache):
+    """
+    A least recently used cache of trained FlannMatcher objects, keyed by
+    node id. Matching a graph trains each node's index once and queries all
+    of the node's neighbors against it, instead of training a new index in
+    each direction of each edge.
+
+    The cache is bounded by an (estimated) memory budget, the size of the
+    descriptors used to train each index. When adding an index would exceed
+    the budget, the least recently used indices are evicted. Matchers that
+    are removed from the cache are cleared.
+
+    See Also
+    --------
+    autocnet.utils.lru.LRUCache
+    """
+    def __init__(self, max_bytes=2**30):
+        super(FlannIndexCache, self).__init__(max_bytes=max_bytes)
+
+    def _discard(self, key, matcher):
+        matcher.clear()
 
 
 class FlannMatcher(object):
@@ -29,21 +29,60 @@ def distance_ratio(edge, matches, ratio=0.8, single=False):
            A Pandas DataFrame mask for the matches with those failing the
            ratio test set to False.
     """
-    def func(group):
-        res = [False] * len(group)
-        if len(res) == 1:
-            return [single]
-        if group.iloc[0] < group.iloc[1] * ratio:
-            res[0] = True
-        return res
-
-    mask_s = matches.groupby('source_idx')['distance'].transform(func).astype('bool')
-    single = True
-    mask_d = matches.groupby('destination_idx')['distance'].transform(func).astype('bool')
-    mask = mask_s & mask_d
+    distance = matches['distance'].values
+    mask_s = _first_match_ratio_mask(matches['source_idx'].values, distance, ratio, single)
+    mask_d = _first_match_ratio_mask(matches['destination_idx'].values, distance, ratio, True)
+    mask = pd.Series(mask_s & mask_d, index=matches.index, name='distance')
 
     return mask
 
+def _first_match_ratio_mask(keys, distance, ratio, single):
+    """
+    For each group of rows sharing a key, flag the first row (in the input
+    order) as True if its distance is less than ratio * the distance of the
+    second row in the group. Groups with a single row are set to single.
+    All other rows are False.
+
+    Parameters
+    ----------
+    keys : ndarray
+           (n,) group keys, e.g., the source keypoint indices
+
+    distance : ndarray
+               (n,) match distances
+
+    ratio : float
+            The ratio test threshold
+
+    single : bool
+             The value for groups with a single row
+
+    Returns
+    -------
+    mask : ndarray
+           (n,) boolean mask
+    """
+    mask = np.zeros(len(keys), dtype=bool)
+    if len(keys) == 0:
+        return mask
+
+    # A stable sort keeps the rows within each group in their input order
+    codes, _ = pd.factorize(keys)
+    order = np.argsort(codes, kind='stable')
+    sorted_codes = codes[order]
+    starts = np.flatnonzero(np.r_[True, sorted_codes[1:] != sorted_codes[:-1]])
+    counts = np.diff(np.r_[starts, len(keys)])
+
+    first = order[starts]
+    multiple = counts > 1
+    second = order[starts[multiple] + 1]
+    mask[first[multiple]] = distance[first[multiple]] < distance[second] * ratio
+    mask[first[~multiple]] = single
+
+    # Rows with a null key are not grouped and are left unmasked
+    mask[codes == -1] = True
+    return mask
+
 
 def spatial_suppression(df, bounds, xkey='x', ykey='y', k=60, error_k=0.05, nsteps=250):
     """
@@ -106,6 +145,8 @@ def spatial_suppression(df, bounds, xkey='x', ykey='y', k=60, error_k=0.05, nste
     df = df.sort_values(by=['strength'], ascending=True).copy()
     df = df.reset_index(drop=True)
     mask = pd.Series(False, index=df.index)
+    xs = df[xkey].values
+    ys = df[ykey].values
 
     process = True
     while process:
@@ -128,27 +169,18 @@ def spatial_suppression(df, bounds, xkey='x', ykey='y', k=60, error_k=0.05, nste
         if n_y_cells <= 0:
             n_y_cells = 1
 
-        grid = np.zeros((n_y_cells, n_x_cells), dtype=bool)
-        # Assign all points to bins
+        # Assign all points to bins. Points below the first edge wrap around
+        # into the last cell.
         x_edges = np.linspace(minx, maxx, n_x_cells)
         y_edges = np.linspace(miny, maxy, n_y_cells)
-        xbins = np.digitize(df[xkey], bins=x_edges)
-        ybins = np.digitize(df[ykey], bins=y_edges)
-
-        # Starting with the best point, start assigning points to grid cells
-        for i, (idx, p) in enumerate(df.iterrows()):
-            x_center = xbins[i] - 1
-            y_center = ybins[i] - 1
-            cell = grid[y_center, x_center]
-
-            if cell == False:
-                result.append(idx)
-                # Set the cell to True
-                grid[y_center, x_center] = True
-
-            # If everything is already 'covered' break from the list
-            if grid.all() == False:
-                continue
+        xbins = (np.digitize(xs, bins=x_edges) - 1) % n_x_cells
+        ybins = (np.digitize(ys, bins=y_edges) - 1) % n_y_cells
+
+        # The points are sorted best first, so the first point in each
+        # occupied cell is the point that claims the cell.
+        cells = ybins.astype(np.int64) * n_x_cells + xbins
+        _, first = np.unique(cells, return_index=True)
+        result.extend(first)
 
         # Check to see if the algorithm is completed, or if the grid size needs to be larger or smaller
         if k - k * error_k <= len(result) <= k + k * error_k:
@@ -1,3 +1,4 @@
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
 from plio.io.io_gdal import GeoDataset
 import numpy as np
 import os
@@ -8,6 +9,7 @@ import pandas as pd
 import geopandas as gpd
 
 from geoalchemy2 import functions
+from sqlalchemy import text
 
 
 
@@ -16,12 +18,13 @@ from shapely.geometry import Point
 
 from autocnet.matcher.subpixel import check_match_func
 from autocnet.io.db.model import Images, Points, Measures, JsonEncoder
+from autocnet.io.db.spatial import images_at_points
 from autocnet.cg.cg import distribute_points_in_geom, xy_in_polygon
 from autocnet.spatial import isis
 from autocnet.transformation.spatial import reproject, oc2og
 from autocnet.matcher.cpu_extractor import extract_most_interesting
 from autocnet.transformation import roi
-from autocnet.matcher.subpixel import geom_match_simple
+from autocnet.matcher.subpixel import geom_match_simple, _estimate_window_affines
 from autocnet.utils.utils import bytescale
 
 import warnings
@@ -221,9 +224,7 @@ def propagate_point(Session,
     match_func = check_match_func(match_func)
 
     session = Session()
-    engine = session.get_bind()
-    string = f"select * from images where ST_Intersects(geom, ST_SetSRID(ST_Point({lon}, {lat}), {config['spatial']['latitudinal_srid']}))"
-    images = pd.read_sql(string, engine)
+    images = images_at_points(session, [lon], [lat], srid=config['spatial']['latitudinal_srid'])
     session.close()
 
     image_measures = pd.DataFrame(zip(paths, lines, samples), columns=["path", "line", "sample"])
@@ -322,6 +323,184 @@ def propagate_point(Session,
 
     return new_measures
 
+def _propagation_candidates(Session, base_cnet, srid):
+    """
+    Pair each of the measures in a base control network with the database
+    images that its point intersects. The images for all of the points are
+    found with a single spatial join against the images table.
+
+    Parameters
+    ----------
+    Session : sqlalchemy.sessionmaker
+              session maker associated with the database you want to propagate to
+
+    base_cnet : pd.DataFrame
+                with pointid, point, path, line, and sample columns
+
+    srid : int
+           The latitudinal srid of the images
+
+    Returns
+    -------
+    pairs : pd.DataFrame
+            with one row per (base measure, destination image) pair and
+            measure_index, pointid, base_path, line, sample, imageid,
+            dest_path, and serial columns
+    """
+    points = base_cnet.groupby('pointid', sort=False)['point'].first()
+    lons = [float(p.x) for p in points.values]
+    lats = [float(p.y) for p in points.values]
+
+    session = Session()
+    images = images_at_points(session, lons, lats, srid=srid)
+    session.close()
+    images = images.rename(columns={'id':'imageid', 'path':'dest_path'})
+    images['pointid'] = points.index.values[images['point_index'].values.astype(int)]
+
+    measures = base_cnet[['pointid', 'path', 'line', 'sample']].rename(columns={'path':'base_path'})
+    measures['measure_index'] = base_cnet.index.values
+    pairs = measures.merge(images.drop(columns='point_index'), on='pointid')
+
+    # Do not propagate a measure into its own image
+    same = np.asarray([os.path.basename(b) == os.path.basename(d) for b, d in zip(pairs['base_path'], pairs['dest_path'])],
+                      dtype=bool)
+    return pairs[~same].reset_index(drop=True)
+
+def _propagate_from_image(base_path, pairs, match_func, match_kwargs, verbose=False):
+    """
+    Match all of the measures on a single base image into the destination
+    images that they intersect. Each image is opened once and the affine
+    transformations for all of the measures on an image pair are estimated
+    with a single batch of projections.
+
+    Parameters
+    ----------
+    base_path : str
+                The path to the base image
+
+    pairs : pd.DataFrame
+            The rows of _propagation_candidates with this base_path
+
+    match_func : str or callable
+                 The matcher passed to geom_match_simple
+
+    match_kwargs : dict
+                   kwargs passed to the matcher
+
+    verbose : boolean
+              If True, print the matcher output
+
+    Returns
+    -------
+    results : list
+              of (index, sample, line, metric, dist) tuples, where index is
+              the index of the pair in pairs
+    """
+    match_func = check_match_func(match_func)
+    base_image = GeoDataset(base_path)
+
+    results = []
+    for dest_path, group in pairs.groupby('dest_path', sort=False):
+        dest_image = GeoDataset(dest_path)
+
+        # Neighboring measures are matched together so that the windows
+        # that they read overlap
+        group = group.sort_values(['line', 'sample'])
+        # The same 16 pixel half window that propagate_point uses
+        affines = _estimate_window_affines(base_image, dest_image,
+                                           zip(group['sample'], group['line']), 16, 16)
+        for (idx, row), affine in zip(group.iterrows(), affines):
+            if affine is None:
+                continue
+            try:
+                x, y, dist, metric, _ = geom_match_simple(base_image, dest_image,
+                                                          row['sample'], row['line'], 16, 16,
+                                                          match_func=match_func,
+                                                          match_kwargs=match_kwargs,
+                                                          affine=affine,
+                                                          verbose=verbose)
+            except Exception as e:
+                warnings.warn(f'Unable to match {base_path} ({row["sample"]}, {row["line"]}) into {dest_path}: {e}')
+                continue
+            if any(r is None for r in (x, y, dist, metric)):
+                continue
+            results.append((idx, x, y, metric, dist))
+    return results
+
+def _write_propagated_points(Session, ground, lat_srid):
+    """
+    Add the propagated points to the database. Propagated points that fall on
+    an existing point are added to that point as new measures, all others are
+    added as new points. The existing points and their measures are found
+    with one query each and all of the new rows are added in a single commit.
+    """
+    groundpoints = ground.groupby('pointid', sort=False).groups
+    firsts = [ground.loc[indices[0]] for indices in groundpoints.values()]
+    lons = [float(point.point.x) for point in firsts]
+    lats = [float(point.point.y) for point in firsts]
+
+    session = Session()
+    sql = text("""SELECT p.idx - 1 AS idx, points.id
+                  FROM unnest(CAST(:lons AS double precision[]), CAST(:lats AS double precision[]))
+                       WITH ORDINALITY AS p(lon, lat, idx)
+                  JOIN points ON ST_Intersects(points.geom, ST_Buffer(ST_SetSRID(ST_Point(p.lon, p.lat), :srid), 10e-10))""")
+    existing = {}
+    for idx, pid in session.execute(sql, {'lons':lons, 'lats':lats, 'srid':lat_srid}):
+        existing.setdefault(int(idx), []).append(pid)
+
+    serialnumbers = {}
+    pids = [pid for res in existing.values() for pid in res]
+    if pids:
+        for pid, serial in session.query(Measures.pointid, Measures.serial).filter(Measures.pointid.in_(pids)):
+            serialnumbers.setdefault(pid, set()).add(serial)
+
+    points = []
+    for i, (point, indices) in enumerate(zip(firsts, groundpoints.values())):
+        res = existing.get(i, [])
+        if len(res) > 1:
+            warnings.warn(f"There is more than one point at lon: {lons[i]}, lat: {lats[i]}")
+
+        elif len(res) == 1:
+            # update existing point with new measures
+            pid = res[0]
+            for j in indices:
+                row = ground.loc[j]
+                if row['serial'] in serialnumbers.get(pid, ()):
+                    continue
+
+                points.append(Measures(pointid = pid,
+                                       line = float(row['line']),
+                                       sample = float(row['sample']),
+                                       aprioriline = float(row['line']),
+                                       apriorisample = float(row['sample']),
+                                       imageid = int(row['imageid']),
+                                       template_metric = float(row['template_metric']),
+                                       template_shift = float(row['template_shift']),
+                                       serial = row['serial'],
+                                       measuretype = 3))
+        else:
+            # upload new point
+            p = Points()
+            p.pointtype = 3
+            p.apriori = point['point_ecef']
+            p.adjusted = point['point_ecef']
+            for j in indices:
+                row = ground.loc[j]
+                p.measures.append(Measures(line = float(row['line']),
+                                           sample = float(row['sample']),
+                                           aprioriline = float(row['line']),
+                                           apriorisample = float(row['sample']),
+                                           imageid = int(row['imageid']),
+                                           serial = row['serial'],
+                                           template_metric = float(row['template_metric']),
+                                           template_shift = float(row['template_shift']),
+                                           measuretype = 3))
+            points.append(p)
+
+    session.add_all(points)
+    session.commit()
+    session.close()
+
 def propagate_control_network(Session,
         config,
         dem,
@@ -331,11 +510,17 @@ def propagate_control_network(Session,
         match_func="classic",
         match_kwargs={'image_size': (39,39), 'template_size': (21,21)},
         verbose=False,
-        cost=lambda x,y: y == np.max(x)):
+        cost=lambda x,y: y == np.max(x),
+        executor='serial',
+        max_workers=None):
     """
     Loops over a base control network's measure information (line, sample, image path) and uses image matching
     algorithms (autocnet.matcher.subpixel.geom_match) to find the corresponding line(s)/sample(s) in database images.
 
+    Rather than propagating point by point, the base measures are bucketed by base image and
+    destination image using a single spatial join. Each base image is then matched into all of
+    its destination images at once, so that every image is opened once per base image and the
+    window transformations for an image pair are estimated in one batch.
 
     Parameters
     ----------
@@ -370,6 +555,13 @@ def propagate_control_network(Session,
                 cost = lambda x,y: y > 0.6 will propegate the point to all images whose correlation
                 result is greater than 0.6
 
+    executor  : {'serial', 'thread', 'process'}
+                How to run the base images. With a process executor, match_func must be
+                a string or a picklable function.
+
+    max_workers : int
+                  The maximum number of workers for the thread or process executors.
+                  If None, the executor default is used.
 
     Returns
     -------
@@ -381,112 +573,79 @@ def propagate_control_network(Session,
     warnings.warn('This function is not well tested. No tests currently exist \
     in the test suite for this version of the function.')
 
-    match_func = check_match_func(match_func)
+    if executor not in ('serial', 'thread', 'process'):
+        raise ValueError(f'{executor} is not a valid executor. Use serial, thread, or process.')
+    # Fail before any matching if the match_func is not valid
+    check_match_func(match_func)
+
+    lat_srid = config['spatial']['latitudinal_srid']
+    pairs = _propagation_candidates(Session, base_cnet, lat_srid)
 
-    groups = base_cnet.groupby('pointid').groups
+    tasks = [(base_path, group, match_func, match_kwargs, verbose) for base_path, group in pairs.groupby('base_path', sort=False)]
+    if executor == 'serial' or len(tasks) <= 1:
+        results = [_propagate_from_image(*task) for task in tasks]
+    else:
+        pool = ThreadPoolExecutor if executor == 'thread' else ProcessPoolExecutor
+        with pool(max_workers=max_workers) as pool:
+            futures = [pool.submit(_propagate_from_image, *task) for task in tasks]
+            results = [f.result() for f in futures]
+
+    matches = pd.DataFrame([r for res in results for r in res],
+                           columns=['index', 'x', 'y', 'metric', 'dist']).set_index('index')
+    matches = pairs.join(matches, how='inner')
+
+    semi_major = config['spatial']['semimajor_rad']
+    semi_minor = config['spatial']['semiminor_rad']
 
     # append CNET info into structured Python list
     constrained_net = []
-
-    # easily parallelized on the cpoint level, dummy serial for now
-    for cpoint, indices in groups.items():
-        measures = base_cnet.loc[indices]
-        measure = measures.iloc[0]
-
-        p = measure.point
-
-        # get image in the destination that overlap
-        lon, lat = measures["point"].iloc[0].xy
-        gp_measures = propagate_point(Session,
-                                      config,
-                                      dem,
-                                      lon[0],
-                                      lat[0],
-                                      cpoint,
-                                      measures["path"],
-                                      measures["line"],
-                                      measures["sample"],
-                                      size_x,
-                                      size_y,
-                                      match_func,
-                                      match_kwargs,
-                                      verbose=verbose,
-                                      cost=cost)
-
-        # do not append if propagate_point is unable to find result
-        if len(gp_measures) == 0:
+    points = base_cnet.groupby('pointid')['point'].first()
+    for cpoint, match_results in matches.groupby('pointid', sort=False):
+        metrics = match_results['metric'].values
+        best_results = match_results[[bool(cost(metrics, m)) for m in metrics]]
+        if len(best_results) == 0:
+            # no matches satisfying cost
             continue
-        constrained_net.extend(gp_measures)
 
-    ground = gpd.GeoDataFrame.from_dict(constrained_net).set_geometry('point')
-    groundpoints = ground.groupby('pointid').groups
+        if verbose:
+            print("match_results final length: ", len(match_results))
+            print("best_results length: ", len(best_results))
+            print("Winning CORRs: ", best_results['metric'].values, "Themis Pixel shifts: ", best_results['dist'].values)
+            print("Themis Images: ", best_results['base_path'].values, "CTX images:", best_results['dest_path'].values)
+            print('\n')
+
+        p = points[cpoint]
+        lon, lat = p.x, p.y
+        px, py = dem.latlon_to_pixel(lat, lon)
+        height = dem.read_array(1, [px, py, 1, 1])[0][0]
+
+        # The CSM conversion makes the LLA/ECEF conversion explicit
+        # reprojection takes ographic lat
+        lon_og, lat_og = oc2og(lon, lat, semi_major, semi_minor)
+        x, y, z = reproject([lon_og, lat_og, height],
+                             semi_major, semi_minor,
+                             'latlon', 'geocent')
+
+        for _, row in best_results.iterrows():
+            constrained_net.append({
+                'pointid' : cpoint,
+                'imageid' : row['imageid'],
+                'serial' : row['serial'],
+                'path': row['dest_path'],
+                'line' : row['y'],
+                'sample' : row['x'],
+                'template_metric' : row['metric'],
+                'template_shift' : row['dist'],
+                'point' : p,
+                'point_ecef' : Point(x, y, z)
+                })
+
+    if not constrained_net:
+        return gpd.GeoDataFrame(constrained_net)
 
-    points = []
+    ground = gpd.GeoDataFrame.from_dict(constrained_net).set_geometry('point')
 
     # conditionally upload a new point to DB or updated existing point with new measures
-    lat_srid = config['spatial']['latitudinal_srid']
-    session = Session()
-    for gp_point, indices in groundpoints.items():
-        point = ground.loc[indices].iloc[0]
-
-        # check DB for if point already exists there
-        lon = point.point.x
-        lat = point.point.y
-
-        spatial_point = functions.ST_Point(lon, lat)
-        spatial_setSRID = functions.ST_SetSRID(spatial_point, lat_srid)
-        spatial_buffer = functions.ST_Buffer(spatial_setSRID, 10e-10)
-        spatial_intersects = functions.ST_Intersects(Points.geom, spatial_buffer)
-        
-        res = session.query(Points).filter(spatial_intersects).all()
-        
-        if len(res) > 1:
-            warnings.warn(f"There is more than one point at lon: {lon}, lat: {lat}")
-
-        elif len(res) == 1:
-            # update existing point with new measures
-            for i in indices:
-                row = ground.loc[i]
-                pid = res[0].id
-                meas = session.query(Measures.serial).filter(Measures.pointid == pid).all()
-                serialnumbers = [m[0] for m in meas]
-
-                if row['serial'] in serialnumbers:
-                    continue
-
-                points.append(Measures(pointid = pid,
-                                       line = float(row['line']),
-                                       sample = float(row['sample']),
-                                       aprioriline = float(row['line']),
-                                       apriorisample = float(row['sample']),
-                                       imageid = int(row['imageid']),
-                                       template_metric = float(row['template_metric']),
-                                       template_shift = float(row['template_shift']),
-                                       serial = row['serial'],
-                                       measuretype = 3))
-        else:
-            # upload new point
-            p = Points()
-            p.pointtype = 3
-            p.apriori = point['point_ecef']
-            p.adjusted = point['point_ecef']
-            for i in indices:
-                row = ground.loc[i]
-                p.measures.append(Measures(line = float(row['line']),
-                                           sample = float(row['sample']),
-                                           aprioriline = float(row['line']),
-                                           apriorisample = float(row['sample']),
-                                           imageid = int(row['imageid']),
-                                           serial = row['serial'],
-                                           template_metric = float(row['template_metric']),
-                                           template_shift = float(row['template_shift']),
-                                           measuretype = 3))
-            points.append(p)
-
-    session.add_all(points)
-    session.commit()
-    session.close()
+    _write_propagated_points(Session, ground, lat_srid)
 
     return ground
-
-
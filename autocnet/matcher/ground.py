@@ -1,3 +1,4 @@
+from functools import lru_cache
 import os
 import warnings
 
@@ -5,9 +6,10 @@ import numpy as np
 import pandas as pd
 from plio.io.io_gdal import GeoDataset
 from shapely.geometry import Point
-from geoalchemy2.functions import ST_DWithin
 
 from autocnet.io.db.model import Points, Measures, Images, CandidateGroundPoints
+from autocnet.io.db.spatial import images_at_points, points_near_existing, dedupe_points
+from autocnet.io.tiles import tile_cache
 from autocnet.graph.node import NetworkNode
 from autocnet.matcher.subpixel import check_geom_func, check_match_func, geom_match_simple
 from autocnet.matcher.cpu_extractor import extract_most_interesting
@@ -19,6 +21,31 @@ from autocnet.transformation.spatial import reproject, oc2og
 from autocnet.io.db.model import Images
 from autocnet.transformation import roi
 
+@lru_cache(maxsize=8)
+def _open_ground_dataset(path, mtime):
+    return GeoDataset(path)
+
+def _open_ground_source(path):
+    """
+    Open a ground source (e.g., a mosaic). The dataset is opened once per
+    process and reused for all of the points that are registered to it. The
+    open datasets are keyed by the path and modification time, so a ground
+    source that is rewritten is opened again.
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except (OSError, TypeError, ValueError):
+        mtime = None
+    return _open_ground_dataset(path, mtime)
+
+def _share_ground_tiles(path, shared_tiles):
+    """
+    Read the tiles of a ground source through the node local shared tile
+    store in the shared_tiles directory, if one is given.
+    """
+    if shared_tiles is not None:
+        tile_cache.share(shared_tiles, paths=[path])
+
 def propagate_ground_point(point,
                            match_func='classic',
                            verbose=False,
@@ -26,21 +53,45 @@ def propagate_ground_point(point,
                            cost=lambda x, y: y == np.max(x),
                            threshold=0.01,
                            ncg=None, 
-                           Session=None):
+                           Session=None,
+                           images=None,
+                           shared_tiles=None):
+    """
+    Propagate a candidate ground point into the images that it intersects.
+
+    Parameters
+    ----------
+    images : pd.DataFrame
+             The id, path, and serial of the images that the point intersects,
+             e.g., from autocnet.io.db.spatial.images_at_points. If None, the
+             images are queried.
+
+    shared_tiles : str
+                   A node local directory (e.g., on /dev/shm) in which the
+                   decoded tiles of the ground source are shared by all of
+                   the worker processes on the host. If None (default), each
+                   process reads the ground source itself.
+
+    See Also
+    --------
+    autocnet.matcher.ground.propagate_ground_points_batch
+    """
     print(f'Attempting to propagate point {point.id}.')    
     
     match_func = check_match_func(match_func)
 
-    with ncg.session_scope() as session:
-        query = session.query(Images).filter(Images.geom.ST_Intersects(point._geom))
-        images = pd.read_sql(query.statement, ncg.engine)
+    if images is None:
+        with ncg.session_scope() as session:
+            query = session.query(Images).filter(Images.geom.ST_Intersects(point._geom))
+            images = pd.read_sql(query.statement, ncg.engine)
 
     path = point.path
     sy = point.line
     sx = point.sample
     pointid = point.id
 
-    base_image = GeoDataset(path)
+    _share_ground_tiles(path, shared_tiles)
+    base_image = _open_ground_source(path)
 
     lon = point.geom.x
     lat = point.geom.y
@@ -185,36 +236,64 @@ def propagate_ground_point(point,
         session.add(point)
     print('Done adding points')
 
-def find_most_interesting_ground(apriori_lon_lat, 
-                                 ground_mosaic, 
-                                 cam_type='isis',
-                                 size=71, 
-                                 base_dtype='int8',
-                                 threshold=0.01,
-                                 ncg=None, 
-                                 Session=None):
+def _images_by_point(points, ncg, columns=('id', 'path', 'serial')):
     """
-    This is the same functionality as cim.generate_ground_points. The difference here
-    is that the data are pushed to a database table instead of being pushed to
-    a 
+    Find the images that intersect each of a list of points with a single
+    query.
+
+    Returns
+    -------
+     : list
+       of pd.DataFrame, the intersecting images for each point
+    """
+    points = list(points)
+    with ncg.session_scope() as session:
+        images = images_at_points(session,
+                                  [p.geom.x for p in points],
+                                  [p.geom.y for p in points],
+                                  srid=ncg.config['spatial']['latitudinal_srid'],
+                                  columns=columns)
+    groups = images.groupby('point_index').groups
+    empty = images.iloc[:0].drop(columns='point_index')
+    return [images.loc[groups[i]].drop(columns='point_index') if i in groups else empty
+            for i in range(len(points))]
+
+def propagate_ground_points_batch(points, ncg=None, **kwargs):
+    """
+    Propagate many candidate ground points. The images that each point
+    intersects are found with a single query for all of the points, rather
+    than one query per point.
+
     Parameters
     ----------
-    cam_type : str 
-               Either 'isis' (Default;enabled) or 'csm' (Disabled). Defines which sensor model implementation to use.
-    size : int
-           The size of the area to extract from the data to search for interesting features.
-    base_dtype : str
-                 The numpy string that describes the datatype of the base image. Options include 'int8', 'uint8', 'float32'.
-    """
-    if cam_type == 'csm':
-        raise ValueError('Unable to find interesting ground using a CSM sensor.')
+    points : iterable
+             of candidate ground points, as passed to propagate_ground_point
 
-    if not ncg.Session:
-        raise BrokenPipeError('This func requires a database session from a NetworkCandidateGraph.')
+    ncg : obj
+          A NetworkCandidateGraph
 
-    if not isinstance(ground_mosaic, GeoDataset):
-        ground_mosaic = GeoDataset(ground_mosaic)
+    kwargs : dict
+             passed to propagate_ground_point
+
+    See Also
+    --------
+    autocnet.matcher.ground.propagate_ground_point
+    """
+    points = list(points)
+    for point, images in zip(points, _images_by_point(points, ncg)):
+        propagate_ground_point(point, ncg=ncg, images=images, **kwargs)
 
+def _most_interesting_ground(apriori_lon_lat, ground_mosaic, size, base_dtype):
+    """
+    Find the most interesting feature in the ground mosaic about an apriori
+    longitude, latitude.
+
+    Returns
+    -------
+     : CandidateGroundPoints
+       The (not yet added) candidate ground point or None if no interesting
+       feature is found
+    """
     p = Point(*apriori_lon_lat)
 
     # Convert the apriori lon, lat into line,sample in the image
@@ -241,23 +320,113 @@ def find_most_interesting_ground(apriori_lon_lat,
     p = Point(newpoint[0].get('PositiveEast360Longitude'),
               newpoint[0].get('PlanetocentricLatitude'))
 
+    return CandidateGroundPoints(path=ground_mosaic.file_name,
+                                 choosername='find_most_interesting_ground',
+                                 aprioriline=line,
+                                 apriorisample=sample,
+                                 line=newline,
+                                 sample=newsample,
+                                 geom=p,
+                                 ignore=False)
+
+def find_most_interesting_ground(apriori_lon_lat, 
+                                 ground_mosaic, 
+                                 cam_type='isis',
+                                 size=71, 
+                                 base_dtype='int8',
+                                 threshold=0.01,
+                                 ncg=None, 
+                                 Session=None):
+    """
+    This is the same functionality as cim.generate_ground_points. The difference here
+    is that the data are pushed to a database table instead of being pushed to
+    a 
+    Parameters
+    ----------
+    cam_type : str 
+               Either 'isis' (Default;enabled) or 'csm' (Disabled). Defines which sensor model implementation to use.
+    size : int
+           The size of the area to extract from the data to search for interesting features.
+    base_dtype : str
+                 The numpy string that describes the datatype of the base image. Options include 'int8', 'uint8', 'float32'.
+
+    See Also
+    --------
+    autocnet.matcher.ground.find_most_interesting_ground_batch
+    """
+    if cam_type == 'csm':
+        raise ValueError('Unable to find interesting ground using a CSM sensor.')
+
+    if not ncg.Session:
+        raise BrokenPipeError('This func requires a database session from a NetworkCandidateGraph.')
+
+    if not isinstance(ground_mosaic, GeoDataset):
+        ground_mosaic = GeoDataset(ground_mosaic)
+
+    g = _most_interesting_ground(apriori_lon_lat, ground_mosaic, size, base_dtype)
+    if g is None:
+        return
+
     with ncg.session_scope() as session:
         # Check to see if the point already exists
-        g = CandidateGroundPoints(path=ground_mosaic.file_name,
-                    choosername='find_most_interesting_ground',
-                    aprioriline=line,
-                    apriorisample=sample,
-                    line=newline,
-                    sample=newsample,
-                    geom=p,
-                    ignore=False)
-
-        res = session.query(CandidateGroundPoints).filter(ST_DWithin(CandidateGroundPoints._geom, g._geom, threshold)).all()
-        if res:
+        if points_near_existing(session, [g.geom.x], [g.geom.y], threshold,
+                                srid=ncg.config['spatial']['latitudinal_srid'])[0]:
             warnings.warn(f'Skipping adding a point as another point already exists within {threshold} units.')
         else:
             session.add(g)
 
+def find_most_interesting_ground_batch(apriori_lon_lats,
+                                       ground_mosaic,
+                                       cam_type='isis',
+                                       size=71,
+                                       base_dtype='int8',
+                                       threshold=0.01,
+                                       ncg=None,
+                                       Session=None):
+    """
+    Find the most interesting ground feature about each of many apriori
+    longitude, latitudes and add them as candidate ground points. Candidates
+    that are within the threshold of an existing candidate, or of an earlier
+    candidate in apriori_lon_lats, are skipped. The duplicate check is a
+    single query for all of the candidates rather than one per candidate.
+
+    Parameters
+    ----------
+    apriori_lon_lats : iterable
+                       of (lon, lat)
+
+    See find_most_interesting_ground for the remaining parameters.
+
+    Returns
+    -------
+     : int
+       The number of candidate ground points added
+    """
+    if cam_type == 'csm':
+        raise ValueError('Unable to find interesting ground using a CSM sensor.')
+
+    if not ncg.Session:
+        raise BrokenPipeError('This func requires a database session from a NetworkCandidateGraph.')
+
+    if not isinstance(ground_mosaic, GeoDataset):
+        ground_mosaic = GeoDataset(ground_mosaic)
+
+    candidates = [_most_interesting_ground(lon_lat, ground_mosaic, size, base_dtype) for lon_lat in apriori_lon_lats]
+    candidates = [g for g in candidates if g is not None]
+    if not candidates:
+        return 0
+
+    with ncg.session_scope() as session:
+        keep = dedupe_points(session,
+                             [g.geom.x for g in candidates],
+                             [g.geom.y for g in candidates],
+                             threshold,
+                             srid=ncg.config['spatial']['latitudinal_srid'])
+        if not keep.all():
+            warnings.warn(f'Skipping adding {(~keep).sum()} points as other points already exist within {threshold} units.')
+        session.add_all([g for g, k in zip(candidates, keep) if k])
+    return int(keep.sum())
+
 def find_ground_reference(point, 
                            ncg=None, 
                            Session=None,
@@ -267,7 +436,30 @@ def find_ground_reference(point,
                            geom_kwargs={"size_x": 16, "size_y": 16},
                            threshold=0.9,
                            cost_func=lambda x,y: (0*x)+y,
-                           verbose=False):
+                           verbose=False,
+                           images=None,
+                           shared_tiles=None):
+    """
+    Register a point to the ground source by matching the base measure into
+    each of the images that the point intersects.
+
+    Parameters
+    ----------
+    images : pd.DataFrame
+             The id and path of the images that the point intersects, e.g.,
+             from autocnet.io.db.spatial.images_at_points. If None, the
+             images are queried.
+
+    shared_tiles : str
+                   A node local directory (e.g., on /dev/shm) in which the
+                   decoded tiles of the ground source are shared by all of
+                   the worker processes on the host. If None (default), each
+                   process reads the ground source itself.
+
+    See Also
+    --------
+    autocnet.matcher.ground.find_ground_references_batch
+    """
 
     geom_func = check_geom_func(geom_func)
     match_func = check_match_func(match_func)
@@ -286,7 +478,8 @@ def find_ground_reference(point,
         raise FileNotFoundError(f'Unable to find {baseimage} to register the data to.')
     
     # Get the base image and the roi extracted that the image data will register to
-    baseimage = GeoDataset(baseimage)
+    _share_ground_tiles(baseimage, shared_tiles)
+    baseimage = _open_ground_source(baseimage)
     
     # Select the images that the point is in.
     cost = -1
@@ -294,13 +487,17 @@ def find_ground_reference(point,
     line = None
     best_node = None
     
-    with ncg.session_scope() as session:
-        images = session.query(Images).filter(Images.geom.ST_Intersects(point._geom)).all()
-        
-        nodes = []
-        for image in images:
-            node = NetworkNode(node_id=image.id, image_path=image.path)
-            nodes.append(node)
+    if images is None:
+        with ncg.session_scope() as session:
+            images = session.query(Images).filter(Images.geom.ST_Intersects(point._geom)).all()
+            images = [(image.id, image.path) for image in images]
+    else:
+        images = list(zip(images['id'], images['path']))
+
+    nodes = []
+    for imageid, path in images:
+        node = NetworkNode(node_id=imageid, image_path=path)
+        nodes.append(node)
       
     for node in nodes:
         node.geodata
@@ -351,3 +548,28 @@ def find_ground_reference(point,
         point.reference_index = len(point.measures) - 1  # The measure that was just appended is the new reference
 
     print('successfully added a reference measure to the database.')
+
+def find_ground_references_batch(points, ncg=None, **kwargs):
+    """
+    Register many points to the ground source. The images that each point
+    intersects are found with a single query for all of the points, rather
+    than one query per point.
+
+    Parameters
+    ----------
+    points : iterable
+             of points, as passed to find_ground_reference
+
+    ncg : obj
+          A NetworkCandidateGraph
+
+    kwargs : dict
+             passed to find_ground_reference
+
+    See Also
+    --------
+    autocnet.matcher.ground.find_ground_reference
+    """
+    points = list(points)
+    for point, images in zip(points, _images_by_point(points, ncg, columns=('id', 'path'))):
+        find_ground_reference(point, ncg=ncg, images=images, **kwargs)
@@ -77,7 +77,8 @@ def pattern_match_autoreg(template, image, subpixel_size=3, max_scaler=0.2, metr
 
     return float(x), float(y), float(max_corr), result
 
-def pattern_match(template, image, upsampling=16, metric=cv2.TM_CCOEFF_NORMED, error_check=False):
+def pattern_match(template, image, upsampling=16, metric=cv2.TM_CCOEFF_NORMED, error_check=False,
+                  coarse_to_fine=False, search_radius=2):
     """
     Call an arbitrary pattern matcher using a subpixel approach where the template and image
     are upsampled using a third order polynomial.
@@ -97,6 +98,15 @@ def pattern_match(template, image, upsampling=16, metric=cv2.TM_CCOEFF_NORMED, e
     error_check : bool
                   If True, also apply a different matcher and test that the values
                   are not too divergent.  Default, False.
+    coarse_to_fine : bool
+                     If True, find the integer peak at native resolution and
+                     only upsample the neighborhood of the image around the
+                     peak. This is significantly faster than upsampling the
+                     entire image. Default, False.
+    search_radius : int
+                    When coarse_to_fine is True, the subpixel peak is
+                    searched for within this many (native) pixels of the
+                    integer peak.
     Returns
     -------
     x : float
@@ -105,11 +115,17 @@ def pattern_match(template, image, upsampling=16, metric=cv2.TM_CCOEFF_NORMED, e
         The y offset
     strength : float
                The strength of the correlation in the range [-1, 1].
+    result : ndarray
+             The (upsampled) correlation surface. When coarse_to_fine is True,
+             this is the surface for the neighborhood around the integer peak.
     """
 
     if upsampling < 1:
         raise ValueError
 
+    if coarse_to_fine and upsampling != 1:
+        return _pattern_match_coarse_to_fine(template, image, upsampling, metric, search_radius)
+
     # Fit a 3rd order polynomial to upsample the images
     if upsampling != 1:
         u_template = zoom(template, upsampling, order=3)
@@ -136,4 +152,80 @@ def pattern_match(template, image, upsampling=16, metric=cv2.TM_CCOEFF_NORMED, e
 
     x = (x - ideal_x) / upsampling
     y = (y - ideal_y) / upsampling
-    return x, y, max_corr, result
\ No newline at end of file
+    return x, y, max_corr, result
+
+def _pattern_match_coarse_to_fine(template, image, upsampling, metric, search_radius):
+    """
+    Find the integer peak of the correlation surface at native resolution,
+    then upsample the template and only the neighborhood of the image around
+    the peak to find the subpixel peak.
+
+    Parameters
+    ----------
+    template : ndarray
+               The input search template
+
+    image : ndarray
+            The image or sub-image to be searched
+
+    upsampling : int
+                 The multiplier to upsample the template and neighborhood
+
+    metric : object
+             The cv2 template matching method
+
+    search_radius : int
+                    The number of native pixels around the integer peak to
+                    search for the subpixel peak
+
+    Returns
+    -------
+    x : float
+        The x offset
+
+    y : float
+        The y offset
+
+    strength : float
+               The strength of the correlation
+
+    result : ndarray
+             The upsampled correlation surface of the neighborhood
+    """
+    minimize = metric == cv2.TM_SQDIFF or metric == cv2.TM_SQDIFF_NORMED
+
+    result = cv2.matchTemplate(image, template, method=metric)
+    _, _, min_loc, max_loc = cv2.minMaxLoc(result)
+    x0, y0 = min_loc if minimize else max_loc
+
+    # Pad the neighborhood so that the spline edge effects fall outside of
+    # the searched area
+    pad = search_radius + 2
+    th, tw = template.shape[:2]
+    ymin = max(y0 - pad, 0)
+    xmin = max(x0 - pad, 0)
+    ymax = min(y0 + th + pad, image.shape[0])
+    xmax = min(x0 + tw + pad, image.shape[1])
+
+    u_template = zoom(template, upsampling, order=3)
+    u_image = zoom(image[ymin:ymax, xmin:xmax], upsampling, order=3)
+
+    # Crop the upsampled neighborhood so that only the template positions
+    # within the radius around the integer peak are correlated
+    uymin = max(y0 - search_radius - ymin, 0) * upsampling
+    uxmin = max(x0 - search_radius - xmin, 0) * upsampling
+    uymax = (y0 + search_radius - ymin) * upsampling + u_template.shape[0]
+    uxmax = (x0 + search_radius - xmin) * upsampling + u_template.shape[1]
+    u_image = u_image[uymin:uymax, uxmin:uxmax]
+
+    u_result = cv2.matchTemplate(u_image, u_template, method=metric)
+    _, max_corr, min_loc, max_loc = cv2.minMaxLoc(u_result)
+    x, y = min_loc if minimize else max_loc
+
+    # Back to native image coordinates of the template center
+    x = (x + uxmin + u_template.shape[1] / 2) / upsampling + xmin
+    y = (y + uymin + u_template.shape[0] / 2) / upsampling + ymin
+
+    x -= image.shape[1] / 2
+    y -= image.shape[0] / 2
+    return x, y, max_corr, u_result
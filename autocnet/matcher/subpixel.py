@@ -1,5 +1,5 @@
 import json
-from math import modf, floor
+from math import modf, floor, ceil
 import time
 import numpy as np
 import warnings
@@ -18,9 +18,6 @@ from scipy import fftpack
 from matplotlib import pyplot as plt
 
 from plio.io.io_gdal import GeoDataset
-from pysis.exceptions import ProcessError
-
-import pvl
 
 import PIL
 from PIL import Image
@@ -28,6 +25,9 @@ from PIL import Image
 from autocnet.matcher.naive_template import pattern_match, pattern_match_autoreg
 from autocnet.matcher import ciratefi
 from autocnet.io.db.model import Measures, Points, Images, JsonEncoder
+from autocnet.io.db.controlnetwork import MeasureUpdateSink
+from autocnet.io.metadata import metadata_cache
+from autocnet.io.tiles import tile_cache
 from autocnet.graph.node import NetworkNode
 from autocnet.transformation import roi
 from autocnet import spatial
@@ -198,7 +198,7 @@ def clip_roi(img, center_x, center_y, size_x=200, size_y=200, dtype="uint64"):
         subarray = img[pixels[1]:pixels[1] + pixels[3] + 1, pixels[0]:pixels[0] + pixels[2] + 1]
     else:
         try:
-            subarray = img.read_array(pixels=pixels, dtype=dtype)
+            subarray = tile_cache.read_array(img, pixels=pixels, dtype=dtype)
         except:
             return None, 0, 0
     return subarray, axr, ayr
@@ -368,12 +368,12 @@ def subpixel_transformed_template(sx, sy, dx, dy,
         return [None] * 4
 
     try:
-        s_image_dtype = isis2np_types[pvl.load(s_img.file_name)["IsisCube"]["Core"]["Pixels"]["Type"]]
+        s_image_dtype = isis2np_types[metadata_cache.pixel_type(s_img.file_name)]
     except:
         s_image_dtype = None
 
     try:
-        d_template_dtype = isis2np_types[pvl.load(d_img.file_name)["IsisCube"]["Core"]["Pixels"]["Type"]]
+        d_template_dtype = isis2np_types[metadata_cache.pixel_type(d_img.file_name)]
     except:
         d_template_dtype = None
 
@@ -600,12 +600,12 @@ def subpixel_template(sx, sy, dx, dy,
         return [None] * 4
 
     try:
-        s_image_dtype = isis2np_types[pvl.load(s_img.file_name)["IsisCube"]["Core"]["Pixels"]["Type"]]
+        s_image_dtype = isis2np_types[metadata_cache.pixel_type(s_img.file_name)]
     except:
         s_image_dtype = None
 
     try:
-        d_template_dtype = isis2np_types[pvl.load(d_img.file_name)["IsisCube"]["Core"]["Pixels"]["Type"]]
+        d_template_dtype = isis2np_types[metadata_cache.pixel_type(d_img.file_name)]
     except:
         d_template_dtype = None
 
@@ -786,6 +786,239 @@ def estimate_affine_transformation(destination_coordinates, source_coordinates):
     return tf.estimate_transform('affine', destination_coordinates, source_coordinates)
 
 
+def _project_image_points(base_cube, input_cube, points):
+    """
+    Project image points from the base cube, through the ground, and into
+    the input cube. All of the points are projected with a single ISIS
+    call per cube.
+
+    Parameters
+    ----------
+    base_cube : plio.io.io_gdal.GeoDataset
+                source image
+
+    input_cube : plio.io.io_gdal.GeoDataset
+                 destination image
+
+    points : iterable
+             of (x, y) image coordinates in the base_cube
+
+    Returns
+    -------
+     : ndarray
+       (n, 2) array of (x, y) image coordinates in the input_cube or None
+       if any of the points fail to project
+    """
+    points = np.asarray(points, dtype=np.float64)
+    lats, lons = spatial.isis.batch_image_to_ground(base_cube.file_name, points[:,0], points[:,1])
+    lines, samples = spatial.isis.batch_ground_to_image(input_cube.file_name, lons, lats)
+    projected = np.column_stack((samples, lines))
+
+    failed = ~np.isfinite(projected).all(axis=1)
+    if failed.any():
+        for lon, lat in zip(lons[failed], lats[failed]):
+            print(f'Skip geom_match; Region of interest point located at ({lon}, {lat}) does not project to image {input_cube.base_name}')
+        return None
+    return projected
+
+
+def _window_corners(bcenter_x, bcenter_y, size_x, size_y):
+    """
+    The (x, y) corners of the base image window about a measure that are
+    projected into the input image to estimate the affine transformation.
+    """
+    base_startx = int(bcenter_x - size_x)
+    base_starty = int(bcenter_y - size_y)
+    base_stopx = int(bcenter_x + size_x)
+    base_stopy = int(bcenter_y + size_y)
+    return [(base_startx,base_starty),
+            (base_startx,base_stopy),
+            (base_stopx,base_stopy),
+            (base_stopx,base_starty)]
+
+
+def _estimate_window_affines(base_cube, input_cube, centers, size_x=60, size_y=60):
+    """
+    Estimate the base to input affine transformation about each of a set
+    of measures in the base cube. The corners of all of the windows are
+    projected with a single ISIS call per cube, so the cost of the camera
+    models is paid once per image pair rather than once per measure.
+
+    Parameters
+    ----------
+    base_cube : plio.io.io_gdal.GeoDataset
+                source image
+
+    input_cube : plio.io.io_gdal.GeoDataset
+                 destination image
+
+    centers : iterable
+              of (x, y) measure locations in the base_cube
+
+    size_x : int
+             half-width of the window used to estimate the transformation
+
+    size_y : int
+             half-height of the window used to estimate the transformation
+
+    Returns
+    -------
+    affines : list
+              of skimage.transform.AffineTransform, one per center, or None
+              where any of the window corners fail to project
+    """
+    centers = list(centers)
+    if not centers:
+        return []
+    base_corners = np.array([_window_corners(x, y, size_x, size_y) for x, y in centers],
+                            dtype=np.float64).reshape(-1, 2)
+    lats, lons = spatial.isis.batch_image_to_ground(base_cube.file_name, base_corners[:,0], base_corners[:,1])
+    lines, samples = spatial.isis.batch_ground_to_image(input_cube.file_name, lons, lats)
+    dst_corners = np.column_stack((samples, lines))
+
+    affines = []
+    for i in range(len(centers)):
+        base_gcps = base_corners[4*i:4*i+4]
+        dst_gcps = dst_corners[4*i:4*i+4]
+        if not np.isfinite(dst_gcps).all():
+            affines.append(None)
+            continue
+        affines.append(tf.estimate_transform('affine', base_gcps, dst_gcps))
+    return affines
+
+
+def _match_window_size(size_x, size_y, match_kwargs, buffer=5):
+    """
+    Compute the half width and half height of the base image window that
+    must be read in order to run a matcher about a measure. The window is
+    large enough to hold the affine subimage (size_x, size_y) and any of the
+    image, template, or search sizes passed to the matcher.
+
+    Parameters
+    ----------
+    size_x : int
+             half-width of the subimage used in the affine transformation
+
+    size_y : int
+             half-height of the subimage used in the affine transformation
+
+    match_kwargs : dict
+                   The keyword arguments that are passed to the matcher
+
+    buffer : int
+             An additional number of pixels added to each side of the window
+
+    Returns
+    -------
+    half_x : int
+             half-width of the window to read
+
+    half_y : int
+             half-height of the window to read
+    """
+    half_x = size_x
+    half_y = size_y
+    for key in ['image_size', 'template_size', 'size']:
+        if key not in match_kwargs:
+            continue
+        kx, ky = check_image_size(match_kwargs[key])
+        half_x = max(half_x, kx)
+        half_y = max(half_y, ky)
+    return int(half_x + buffer), int(half_y + buffer)
+
+
+def _read_and_warp_window(base_cube, input_cube, affine,
+                          bcenter_x, bcenter_y,
+                          half_x, half_y,
+                          base_type=None, dst_type=None,
+                          pad=3):
+    """
+    Read a window about (bcenter_x, bcenter_y) from the base cube and the
+    bounding box of that window projected into the input cube. The input cube
+    tile is then warped into the geometry of the base window.
+
+    Parameters
+    ----------
+    base_cube : plio.io.io_gdal.GeoDataset
+                source image
+
+    input_cube : plio.io.io_gdal.GeoDataset
+                 destination image
+
+    affine : object
+             skimage transform that maps base image coordinates into input
+             image coordinates
+
+    bcenter_x : Numeric
+                sample location of the source measure in base_cube
+
+    bcenter_y : Numeric
+                line location of the source measure in base_cube
+
+    half_x : int
+             half-width of the base window
+
+    half_y : int
+             half-height of the base window
+
+    base_type : str
+                The numpy dtype to read the base window with
+
+    dst_type : str
+               The numpy dtype to read the input tile with
+
+    pad : int
+          The number of pixels to pad the input tile by so that the warp
+          interpolation at the tile edges is identical to a full image warp
+
+    Returns
+    -------
+    base_arr : ndarray
+               The base window
+
+    dst_arr : ndarray
+              The input tile warped into the base window geometry or None
+              if the base window does not project into the input cube
+
+    origin : tuple
+             The (x, y) upper left of the base window in base image space
+    """
+    base_size = base_cube.raster_size
+    dst_size = input_cube.raster_size
+
+    bstart_x = max(int(bcenter_x) - half_x, 0)
+    bstart_y = max(int(bcenter_y) - half_y, 0)
+    bstop_x = min(int(bcenter_x) + half_x, base_size[0] - 1)
+    bstop_y = min(int(bcenter_y) + half_y, base_size[1] - 1)
+    base_pixels = [bstart_x, bstart_y, bstop_x - bstart_x + 1, bstop_y - bstart_y + 1]
+    base_arr = tile_cache.read_array(base_cube, pixels=base_pixels, dtype=base_type)
+
+    # The bounding box of the base window in the input image
+    window_corners = np.array([(bstart_x, bstart_y),
+                               (bstart_x, bstop_y),
+                               (bstop_x, bstop_y),
+                               (bstop_x, bstart_y)])
+    projected = affine(window_corners)
+    dstart_x = max(int(floor(projected[:,0].min())) - pad, 0)
+    dstart_y = max(int(floor(projected[:,1].min())) - pad, 0)
+    dstop_x = min(int(ceil(projected[:,0].max())) + pad, dst_size[0] - 1)
+    dstop_y = min(int(ceil(projected[:,1].max())) + pad, dst_size[1] - 1)
+
+    if dstop_x < dstart_x or dstop_y < dstart_y:
+        return base_arr, None, (bstart_x, bstart_y)
+
+    dst_pixels = [dstart_x, dstart_y, dstop_x - dstart_x + 1, dstop_y - dstart_y + 1]
+    dst_arr = tile_cache.read_array(input_cube, pixels=dst_pixels, dtype=dst_type)
+
+    # Chain: base window -> base image -> input image -> input tile
+    to_base = tf.AffineTransform(translation=(bstart_x, bstart_y))
+    to_tile = tf.AffineTransform(translation=(-dstart_x, -dstart_y))
+    local_affine = tf.AffineTransform(matrix=to_tile.params @ affine.params @ to_base.params)
+
+    dst_arr = tf.warp(dst_arr, local_affine, output_shape=base_arr.shape)
+    return base_arr, dst_arr, (bstart_x, bstart_y)
+
+
 def geom_match_simple(base_cube,
                        input_cube,
                        bcenter_x,
@@ -795,6 +1028,8 @@ def geom_match_simple(base_cube,
                        match_func="classic",
                        match_kwargs={"image_size":(101,101), "template_size":(31,31)},
                        phase_kwargs=None,
+                       windowed=True,
+                       affine=None,
                        verbose=True):
     """
     Propagates a source measure into destination images and then perfroms subpixel registration.
@@ -803,7 +1038,9 @@ def geom_match_simple(base_cube,
     of the destination image into source image space (using an affine transformation) and a naive
     template match with optional phase template match.
 
-    This version projects the entirity of the input cube onto the base
+    By default, only a window about the measure in the base cube and the bounding box of that window
+    in the input cube are read and warped. If windowed is False, the entirity of the input cube is
+    projected onto the base.
 
     Parameters
     ----------
@@ -823,6 +1060,13 @@ def geom_match_simple(base_cube,
                      contains keywords necessary for autocnet.matcher.subpixel.subpixel_template
     phase_kwargs:    dict
                      contains kwargs for autocnet.matcher.subpixel.subpixel_phase
+    windowed:   boolean
+                If True (default), read and warp only the window of the images that the matcher
+                uses. If False, read and warp the full images.
+    affine:     skimage.transform.AffineTransform
+                A precomputed base to input transformation, e.g., from _estimate_window_affines.
+                If None (default), the transformation is estimated by projecting the corners
+                of the window through the ground.
     verbose:    boolean
                 indicates level of print out desired. If True, two subplots are output; the first subplot contains
                 the source subimage and projected destination subimage, the second subplot contains the registered
@@ -880,31 +1124,17 @@ def geom_match_simple(base_cube,
     # specifically not putting this in a try/except, this should never fail
     center_x, center_y = bcenter_x, bcenter_y
 
-    base_corners = [(base_startx,base_starty),
-                    (base_startx,base_stopy),
-                    (base_stopx,base_stopy),
-                    (base_stopx,base_starty)]
-
-    dst_corners = []
-    for x,y in base_corners:
-        try:
-            lat, lon = spatial.isis.image_to_ground(base_cube.file_name, x, y)
-            dst_corners.append(spatial.isis.ground_to_image(input_cube.file_name, lon, lat)[::-1])
-        except ProcessError as e:
-            if 'Requested position does not project in camera model' in e.stderr:
-                print(f'Skip geom_match; Region of interest corner located at ({lon}, {lat}) does not project to image {input_cube.base_name}')
-                return None, None, None, None, None
-
-    base_gcps = np.array([*base_corners])
+    if affine is None:
+        base_corners = _window_corners(bcenter_x, bcenter_y, size_x, size_y)
+        dst_corners = _project_image_points(base_cube, input_cube, base_corners)
+        if dst_corners is None:
+            return None, None, None, None, None
 
-    dst_gcps = np.array([*dst_corners])
+        base_gcps = np.array([*base_corners])
 
-    start_x = dst_gcps[:,0].min()
-    start_y = dst_gcps[:,1].min()
-    stop_x = dst_gcps[:,0].max()
-    stop_y = dst_gcps[:,1].max()
+        dst_gcps = np.array([*dst_corners])
 
-    affine = tf.estimate_transform('affine', np.array([*base_gcps]), np.array([*dst_gcps]))
+        affine = tf.estimate_transform('affine', np.array([*base_gcps]), np.array([*dst_gcps]))
     t2 = time.time()
     print(f'Estimation of the transformation took {t2-t1} seconds.')
     # read_array not getting correct type by default
@@ -914,29 +1144,46 @@ def geom_match_simple(base_cube,
                     "Real" : "float64"
     }
 
-    base_type = isis2np_types[pvl.load(base_cube.file_name)["IsisCube"]["Core"]["Pixels"]["Type"]]
-    base_arr = base_cube.read_array(dtype=base_type)
+    base_type = isis2np_types[metadata_cache.pixel_type(base_cube.file_name)]
+    dst_type = isis2np_types[metadata_cache.pixel_type(input_cube.file_name)]
+
+    if windowed:
+        half_x, half_y = _match_window_size(size_x, size_y, match_kwargs)
+        base_arr, dst_arr, (origin_x, origin_y) = _read_and_warp_window(base_cube, input_cube, affine,
+                                                                        bcenter_x, bcenter_y,
+                                                                        half_x, half_y,
+                                                                        base_type=base_type,
+                                                                        dst_type=dst_type)
+        if dst_arr is None:
+            print(f'Skip geom_match; Region of interest does not project into image {input_cube.base_name}')
+            return None, None, None, None, None
+    else:
+        base_arr = base_cube.read_array(dtype=base_type)
+        dst_arr = input_cube.read_array(dtype=dst_type)
+
+        box = (0, 0, max(dst_arr.shape[1], base_arr.shape[1]), max(dst_arr.shape[0], base_arr.shape[0]))
+        dst_arr = np.array(Image.fromarray(dst_arr).crop(box))
 
-    dst_type = isis2np_types[pvl.load(input_cube.file_name)["IsisCube"]["Core"]["Pixels"]["Type"]]
-    dst_arr = input_cube.read_array(dtype=dst_type)
+        dst_arr = tf.warp(dst_arr, affine)
+        origin_x = origin_y = 0
 
-    box = (0, 0, max(dst_arr.shape[1], base_arr.shape[1]), max(dst_arr.shape[0], base_arr.shape[0]))
-    dst_arr = np.array(Image.fromarray(dst_arr).crop(box))
+    # The measure location in the (possibly windowed) base array
+    center_x = bcenter_x - origin_x
+    center_y = bcenter_y - origin_y
 
-    dst_arr = tf.warp(dst_arr, affine)      
     t3 = time.time()
     print(f'Affine warp took {t3-t2} seconds.')
     if verbose:
         fig, axs = plt.subplots(1, 2)
         axs[0].set_title("Base")
-        axs[0].imshow(roi.Roi(bytescale(base_arr, cmin=0), bcenter_x, bcenter_y, 25, 25).clip(), cmap="Greys_r")
+        axs[0].imshow(roi.Roi(bytescale(base_arr, cmin=0), center_x, center_y, 25, 25).clip(), cmap="Greys_r")
         axs[1].set_title("Projected Image")
-        axs[1].imshow(roi.Roi(bytescale(dst_arr, cmin=0), bcenter_x, bcenter_y, 25, 25).clip(), cmap="Greys_r")
+        axs[1].imshow(roi.Roi(bytescale(dst_arr, cmin=0), center_x, center_y, 25, 25).clip(), cmap="Greys_r")
         plt.show()
     print(base_arr.shape, dst_arr.shape)
     # Run through one step of template matching then one step of phase matching
     # These parameters seem to work best, should pass as kwargs later
-    restemplate = match_func(bcenter_x, bcenter_y, bcenter_x, bcenter_y, bytescale(base_arr, cmin=0), bytescale(dst_arr, cmin=0), **match_kwargs)
+    restemplate = match_func(center_x, center_y, center_x, center_y, bytescale(base_arr, cmin=0), bytescale(dst_arr, cmin=0), **match_kwargs)
     t4 = time.time()
     print(f'Matching took {t4-t3} seconds')
 
@@ -950,6 +1197,11 @@ def geom_match_simple(base_cube,
     
     if x is None or y is None:
         return None, None, None, None, None
+
+    # Move the matched location from the base array back into base image space
+    x += origin_x
+    y += origin_y
+
     metric = maxcorr
     sample, line = affine([x, y])[0]
     dist = np.linalg.norm([bcenter_x-x, bcenter_y-y])
@@ -958,19 +1210,19 @@ def geom_match_simple(base_cube,
         fig, axs = plt.subplots(2, 3)
         fig.set_size_inches((30,30))
 
-        oarr = roi.Roi(input_cube.read_array(), sample, line, 150, 150).clip()
+        oarr = roi.Roi(input_cube, sample, line, 150, 150).clip()
         axs[0][2].imshow(bytescale(oarr, cmin=0), cmap="Greys_r")
         axs[0][2].axhline(y=oarr.shape[1]/2, color="red", linestyle="-", alpha=1)
         axs[0][2].axvline(x=oarr.shape[1]/2, color="red", linestyle="-", alpha=1)
         axs[0][2].set_title("Original Registered Image")
 
-        barr = roi.Roi(base_arr, bcenter_x, bcenter_y, size_x, size_y).clip()
+        barr = roi.Roi(base_arr, center_x, center_y, size_x, size_y).clip()
         axs[0][0].imshow(bytescale(barr, cmin=0), cmap="Greys_r")
         axs[0][0].axhline(y=barr.shape[1]/2, color="red", linestyle="-", alpha=1)
         axs[0][0].axvline(x=barr.shape[1]/2, color="red", linestyle="-", alpha=1)
         axs[0][0].set_title("Base")
 
-        darr = roi.Roi(dst_arr, x, y, size_x, size_y).clip()
+        darr = roi.Roi(dst_arr, x - origin_x, y - origin_y, size_x, size_y).clip()
         axs[0][1].imshow(bytescale(darr, cmin=0), cmap="Greys_r")
         axs[0][1].axhline(y=darr.shape[1]/2, color="red", linestyle="-", alpha=1)
         axs[0][1].axvline(x=darr.shape[1]/2, color="red", linestyle="-", alpha=1)
@@ -1072,24 +1324,18 @@ def geom_match_classic(base_cube,
     if base_starty < 0:
         raise Exception(f"Window: {base_starty} < 0, center: {bcenter_x},{bcenter_y}")
 
-    # specifically not putting this in a try/except, this should never fail
-    mlat, mlon = spatial.isis.image_to_ground(base_cube.file_name, bcenter_x, bcenter_y)
-    center_x, center_y = spatial.isis.ground_to_image(input_cube.file_name, mlon, mlat)[::-1]
-
     base_corners = [(base_startx,base_starty),
                     (base_startx,base_stopy),
                     (base_stopx,base_stopy),
                     (base_stopx,base_starty)]
 
-    dst_corners = []
-    for x,y in base_corners:
-        try:
-            lat, lon = spatial.isis.image_to_ground(base_cube.file_name, x, y)
-            dst_corners.append(spatial.isis.ground_to_image(input_cube.file_name, lon, lat)[::-1])
-        except ProcessError as e:
-            if 'Requested position does not project in camera model' in e.stderr:
-                print(f'Skip geom_match; Region of interest corner located at ({lon}, {lat}) does not project to image {input_cube.base_name}')
-                return None, None, None, None, None
+    # Project the center and the corners together so that each image is only
+    # touched by a single ISIS call
+    projected = _project_image_points(base_cube, input_cube, [(bcenter_x, bcenter_y), *base_corners])
+    if projected is None:
+        return None, None, None, None, None
+    center_x, center_y = projected[0]
+    dst_corners = projected[1:]
 
     base_gcps = np.array([*base_corners])
     base_gcps[:,0] -= base_startx
@@ -1113,12 +1359,12 @@ def geom_match_classic(base_cube,
     }
 
     base_pixels = list(map(int, [base_corners[0][0], base_corners[0][1], size_x*2, size_y*2]))
-    base_type = isis2np_types[pvl.load(base_cube.file_name)["IsisCube"]["Core"]["Pixels"]["Type"]]
-    base_arr = base_cube.read_array(pixels=base_pixels, dtype=base_type)
+    base_type = isis2np_types[metadata_cache.pixel_type(base_cube.file_name)]
+    base_arr = tile_cache.read_array(base_cube, pixels=base_pixels, dtype=base_type)
 
     dst_pixels = list(map(int, [start_x, start_y, stop_x-start_x, stop_y-start_y]))
-    dst_type = isis2np_types[pvl.load(input_cube.file_name)["IsisCube"]["Core"]["Pixels"]["Type"]]
-    dst_arr = input_cube.read_array(pixels=dst_pixels, dtype=dst_type)
+    dst_type = isis2np_types[metadata_cache.pixel_type(input_cube.file_name)]
+    dst_arr = tile_cache.read_array(input_cube, pixels=dst_pixels, dtype=dst_type)
 
     dst_arr = tf.warp(dst_arr, affine)
     dst_arr = dst_arr[:size_y*2, :size_x*2]
@@ -1264,30 +1510,14 @@ def geom_match(destination_cube,
                     (destination_stopx,destination_stopy),
                     (destination_stopx,destination_starty)]
 
-    # specifically not putting this in a try/except, this should never fail
-    # 07/28 - putting it in a try/except because of how we ground points
-    # Transform from the destination center to the source_cube center
-    try:
-        mlat, mlon = spatial.isis.image_to_ground(destination_cube.file_name, bcenter_x, bcenter_y)
-        center_y, center_x = spatial.isis.ground_to_image(source_cube.file_name, mlon, mlat)
-    except ProcessError as e:
-            if 'Requested position does not project in camera model' in e.stderr:
-                print(f'Skip geom_match; Region of interest center located at ({mlon}, {mlat}) does not project to image {source_cube.base_name}')
-                print('This should only appear when propagating ground points')
-                return None, None, None, None, None
-
-    # Compute the mapping between the destination corners and the source_cube corners in
-    # order to estimate an affine transformation
-    source_corners = []
-    for x,y in destination_corners:
-        try:
-            lat, lon = spatial.isis.image_to_ground(destination_cube.file_name, x, y)
-            source_corners.append(spatial.isis.ground_to_image(source_cube.file_name, lon, lat)[::-1])
-        except ProcessError as e:
-            if 'Requested position does not project in camera model' in e.stderr:
-                print(f'Skip geom_match; Region of interest corner located at ({lon}, {lat}) does not project to image {source_cube.base_name}')
-                return None, None, None, None, None
-
+    # Transform from the destination center and corners to the source_cube in order
+    # to estimate an affine transformation. This can fail when propagating ground points.
+    projected = _project_image_points(destination_cube, source_cube,
+                                      [(bcenter_x, bcenter_y), *destination_corners])
+    if projected is None:
+        return None, None, None, None, None
+    center_x, center_y = projected[0]
+    source_corners = projected[1:]
 
     # Estimate the transformation
     affine = estimate_affine_transformation(destination_corners, source_corners)
@@ -1315,6 +1545,7 @@ def subpixel_register_measure(measureid,
                               cost_func=lambda x,y: 1/x**2 * y,
                               threshold=0.005,
                               ncg=None,
+                              sink=None,
                               **kwargs):
     """
     Given a measure, subpixel register to the reference measure of its associated point.
@@ -1340,6 +1571,11 @@ def subpixel_register_measure(measureid,
     threshold : numeric
                 measures with a cost <= the threshold are marked as ignore=True in
                 the database.
+
+    sink : obj
+           An autocnet.io.db.controlnetwork.MeasureUpdateSink to add the measure
+           updates to. The caller is responsible for flushing the sink. If None
+           (default), the updates are written before returning.
     """
 
     if isinstance(measureid, Measures):
@@ -1365,12 +1601,11 @@ def subpixel_register_measure(measureid,
         reference_index = measures[0].reference_index
         source = measures[reference_index]
 
-        source.template_metric = 1
-        source.template_shift = 0
-        source.phase_error = 0
-        source.phase_diff = 0
-        source.phase_shift = 0
-        source.weight = 1
+        flush = sink is None
+        if flush:
+            sink = MeasureUpdateSink(ncg, max_rows=None)
+        sink.add(source.id, template_metric=1, template_shift=0,
+                 phase_error=0, phase_diff=0, phase_shift=0, weight=1)
 
         sourceid = source.imageid
         sourceimage = session.query(Images).filter(Images.id == sourceid).one()
@@ -1383,52 +1618,117 @@ def subpixel_register_measure(measureid,
         
         if source.measureid == measureid:
             currentlog['status'] = f'Unable to register this measure. Measure {measureid} is the reference measure.'
-            return resultlog
-
-        try:
-            new_x, new_y, dist, metric = geom_match_simple(source_node.geodata, destination_node.geodata,
-                                                        source.sample, source.line,
-                                                        match_func=match_func,
-                                                        template_kwargs=subpixel_template_kwargs)
-        except Exception as e:
-            print(f'geom_match failed on measure {measureid} with exception -> {e}')
-            destination.ignore = True # geom_match failed
-            currentlog['status'] = f"Failed to register measure {measureid}"
+        else:
+            try:
+                new_x, new_y, dist, metric = geom_match_simple(source_node.geodata, destination_node.geodata,
+                                                            source.sample, source.line,
+                                                            match_func=match_func,
+                                                            template_kwargs=subpixel_template_kwargs)
+                currentlog['status'] = 'Failed to geom match.'
+            except Exception as e:
+                print(f'geom_match failed on measure {measureid} with exception -> {e}')
+                new_x = new_y = None
+                currentlog['status'] = f"Failed to register measure {measureid}"
+
+            if new_x is None or new_y is None:
+                sink.add(measureid, ignore=True) # Unable to geom match
+            else:
+                sink.add(measureid, template_metric=metric, template_shift=dist)
+                cost = cost_func(dist, metric)
+                if cost <= threshold:
+                    sink.add(measureid, ignore=True) # Threshold criteria not met
+                    currentlog['status'] = f'Cost failed. Distance shifted: {dist}. Metric: {metric}.'
+                else:
+                    # Update the measure. In case this is a second run, set the ignore to False
+                    # if this measures passed. Also, set the source measure back to ignore=False
+                    sink.add(measureid, sample=new_x, line=new_y, weight=cost,
+                             choosername='subpixel_register_measure', ignore=False)
+                    sink.add(source.id, ignore=False)
+                    currentlog['status'] = f'Success.'
             resultlog.append(currentlog)
-            return resultlog
 
-        if new_x == None or new_y == None:
-            destination.ignore = True # Unable to geom match
-            currentlog['status'] = 'Failed to geom match.'
-            resultlog.append(currentlog)
-            return resultlog
+        if flush:
+            sink.flush(session=session)
+
+    return resultlog
 
-        destination.template_metric = metric
-        destination.template_shift = dist
 
-        cost = cost_func(destination.template_shift, destination.template_metric)
+def _evaluate_registration(measureid, weight, new_x, new_y, dist, metric,
+                           cost_func, threshold, chooser):
+    """
+    Apply the cost function and threshold to the result of registering a
+    measure and determine the updates to make to the measure.
 
-        if cost <= threshold:
-            destination.ignore = True # Threshold criteria not met
-            currentlog['status'] = f'Cost failed. Distance shifted: {destination.template_shift}. Metric: {destination.template_metric}.'
-            resultlog.append(currentlog)
-            return resultlog
+    Parameters
+    ----------
+    measureid : int
+                The identifier of the measure, used in the status message
 
-        # Update the measure
-        destination.sample = new_x
-        destination.line = new_y
-        destination.weight = cost
-        destination.choosername = 'subpixel_register_measure'
+    weight : float
+             The current weight of the measure, None if the measure has never
+             been successfully registered
 
-        # In case this is a second run, set the ignore to False if this
-        # measures passed. Also, set the source measure back to ignore=False
-        destination.ignore = False
-        source.ignore = False
-        currentlog['status'] = f'Success.'
-        resultlog.append(currentlog)
+    new_x : float
+            The registered sample or None if the registration failed
 
+    new_y : float
+            The registered line or None if the registration failed
 
-    return resultlog
+    dist : float
+           The distance that the measure shifted
+
+    metric : float
+             The metric (e.g., correlation) returned by the matcher
+
+    cost_func : func
+                A generic cost function accepting two arguments (x,y), where x is the
+                distance and y is the metric
+
+    threshold : numeric
+                measures with a cost <= the threshold fail
+
+    chooser : str
+              The choosername to set on successfully registered measures
+
+    Returns
+    -------
+    updates : dict
+              of measure attribute names to new values
+
+    status : str
+             A description of the outcome for the result log
+
+    success : bool
+              True if the measure was successfully registered
+    """
+    if new_x is None or new_y is None:
+        updates = {'ignore':True} if weight is None else {} # Unable to geom match and no previous sucesses
+        return updates, f'Failed to register measure {measureid}.', False
+
+    updates = {'template_metric':metric,
+               'template_shift':dist}
+
+    cost = cost_func(dist, metric)
+
+    print(f'Current Cost: {cost},  Current Weight: {weight}')
+
+    # Check to see if the cost function requirement has been met
+    if weight and cost <= weight:
+        return updates, f'Previous match provided better correlation. {weight} > {cost}.', False
+
+    if cost <= threshold:
+        if weight is None:
+            updates['ignore'] = True # Threshold criteria not met and no previous sucesses
+        return updates, f'Cost failed. Distance calculated: {dist}. Metric calculated: {metric}.', False
+
+    # In case this is a second run, set the ignore to False if this
+    # measures passed.
+    updates.update({'sample':new_x,
+                    'line':new_y,
+                    'weight':cost,
+                    'choosername':chooser,
+                    'ignore':False})
+    return updates, f'Success. Distance shifted: {dist}. Metric: {metric}.', True
 
 
 def subpixel_register_point(pointid,
@@ -1440,6 +1740,7 @@ def subpixel_register_point(pointid,
                             match_kwargs={},
                             verbose=False,
                             chooser='subpixel_register_point',
+                            sink=None,
                             **kwargs):
 
     """
@@ -1470,6 +1771,11 @@ def subpixel_register_point(pointid,
     
     match_func : callable
                  subpixel matching function to use registering measures      
+
+    sink : obj
+           An autocnet.io.db.controlnetwork.MeasureUpdateSink to add the measure
+           updates to. The caller is responsible for flushing the sink. If None
+           (default), the updates are written before returning.
     """
 
     geom_func=geom_func.lower()
@@ -1502,11 +1808,11 @@ def subpixel_register_point(pointid,
 
         print(f'Using measure {source.id} on image {source.imageid}/{source.serial} as the reference.')
         print(f'Measure reference index is: {point.reference_index}')
-        source.template_metric = 1
-        source.template_shift = 0
-        source.phase_error = 0
-        source.phase_diff = 0
-        source.phase_shift = 0
+        flush = sink is None
+        if flush:
+            sink = MeasureUpdateSink(ncg, max_rows=None)
+        sink.add(source.id, template_metric=1, template_shift=0,
+                 phase_error=0, phase_diff=0, phase_shift=0)
 
         sourceid = source.imageid
         sourceres = session.query(Images).filter(Images.id == sourceid).one()
@@ -1523,7 +1829,6 @@ def subpixel_register_point(pointid,
             
             currentlog = {'measureid':measure.id,
                         'status':''}
-            cost = None
             destinationid = measure.imageid
 
             res = session.query(Images).filter(Images.id == destinationid).one()
@@ -1551,50 +1856,228 @@ def subpixel_register_point(pointid,
                 currentlog['status'] = f"geom_match failed on measure {measure.id}"
                 resultlog.append(currentlog)
                 if measure.weight is None:
-                    measure.ignore = True # Geom match failed and no previous sucesses
+                    sink.add(measure.id, ignore=True) # Geom match failed and no previous sucesses
                 continue
 
-            if new_x == None or new_y == None:
-                currentlog['status'] = f'Failed to register measure {measure.id}.'
-                resultlog.append(currentlog)
-                if measure.weight is None:
-                    measure.ignore = True # Unable to geom match and no previous sucesses
-                continue
+            updates, currentlog['status'], success = _evaluate_registration(measure.id, measure.weight,
+                                                                            new_x, new_y, dist, metric,
+                                                                            cost_func, threshold, chooser)
+            if updates:
+                sink.add(measure.id, **updates)
+            if success:
+                # Also, set the source measure back to ignore=False
+                sink.add(source.id, ignore=False)
+            resultlog.append(currentlog)
+        t4 = time.time()
+        print(f'Registering {len(measures)} took {t4-t3} seconds.')
 
-            measure.template_metric = metric
-            measure.template_shift = dist
+        if flush:
+            sink.flush(session=session)
+    return resultlog
 
-            cost = cost_func(measure.template_shift, measure.template_metric)
 
-            print(f'Current Cost: {cost},  Current Weight: {measure.weight}')
+def subpixel_register_points_batch(pointids,
+                                   cost_func=lambda x,y: 1/x**2 * y,
+                                   threshold=0.005,
+                                   ncg=None,
+                                   geom_func='simple',
+                                   geom_kwargs={},
+                                   match_func='classic',
+                                   match_kwargs={},
+                                   verbose=False,
+                                   chooser='subpixel_register_points_batch',
+                                   sink=None,
+                                   **kwargs):
+    """
+    Subpixel register all of the measures in many points to the reference
+    measures of the points. This gives the same result as calling
+    subpixel_register_point on each point, but:
+
+    - the points, measures, and images are loaded with one query each,
+    - each image is opened once,
+    - the measures are registered grouped by (reference image, destination
+      image) and ordered by location so that the image tiles and metadata
+      are reused from the caches,
+    - when geom_func is 'simple', the affine transformations for all of the
+      measures on an image pair are estimated with a single ISIS call per
+      image. Measures without an affine are geom failures, and
+    - the measure updates are written in bulk through a MeasureUpdateSink.
 
-            # Check to see if the cost function requirement has been met
-            if measure.weight and cost <= measure.weight:
-                currentlog['status'] = f'Previous match provided better correlation. {measure.weight} > {cost}.'
-                resultlog.append(currentlog)
-                continue
+    Parameters
+    ----------
+    pointids : iterable
+               of point identifiers in the DB or Points objects
 
-            if cost <= threshold:
-                currentlog['status'] = f'Cost failed. Distance calculated: {measure.template_shift}. Metric calculated: {measure.template_metric}.'
-                resultlog.append(currentlog)
-                if measure.weight is None:
-                    measure.ignore = True # Threshold criteria not met and no previous sucesses
+    cost_func : func
+                A generic cost function accepting two arguments (x,y), where x is the
+                distance that a point has shifted from the original, sensor identified
+                intersection, and y is the correlation coefficient coming out of the
+                template matcher.
+
+    threshold : numeric
+                measures with a cost <= the threshold are marked as ignore=True in
+                the database.
+
+    ncg : obj
+          the network candidate graph that the points are associated with; used for
+          the DB session that is able to access the points.
+
+    geom_func : callable
+                function used to tranform the source and/or destination image before
+                running a matcher.
+
+    geom_kwargs : dict
+                  of keyword arguments passed to the geom_func, e.g., size_x and size_y
+
+    match_func : callable
+                 subpixel matching function to use registering measures
+
+    sink : obj
+           An autocnet.io.db.controlnetwork.MeasureUpdateSink to add the measure
+           updates to. The caller is responsible for flushing the sink. If None
+           (default), the updates are written before returning.
+
+    Returns
+    -------
+    resultlog : list
+                of dicts with the pointid, measureid, and status of each registered
+                measure
+
+    See Also
+    --------
+    autocnet.matcher.subpixel.subpixel_register_point
+    """
+    if isinstance(geom_func, str):
+        geom_func = geom_func.lower()
+    if isinstance(match_func, str):
+        match_func = match_func.lower()
+
+    match_func = check_match_func(match_func)
+    geom_func = check_geom_func(geom_func)
+
+    if not ncg.Session:
+        raise BrokenPipeError('This func requires a database session from a NetworkCandidateGraph.')
+
+    pointids = [p.id if isinstance(p, Points) else p for p in pointids]
+    if not pointids:
+        return []
+
+    t1 = time.time()
+    resultlog = []
+    with ncg.session_scope() as session:
+        points = session.query(Points.id, Points.reference_index).filter(Points.id.in_(pointids)).all()
+        reference_indices = {pid:ref for pid, ref in points}
+
+        point_measures = {}
+        for m in session.query(Measures.id, Measures.pointid, Measures.imageid,
+                               Measures.apriorisample, Measures.aprioriline,
+                               Measures.weight).filter(Measures.pointid.in_(pointids)).order_by(Measures.id):
+            point_measures.setdefault(m.pointid, []).append(m)
+
+        imageids = {m.imageid for measures in point_measures.values() for m in measures}
+        paths = dict(session.query(Images.id, Images.path).filter(Images.id.in_(imageids)).all())
+        t2 = time.time()
+        print(f'Query took {t2-t1} seconds to find {len(reference_indices)} points.')
+
+        # Group the measures to register by (reference image, destination image)
+        groups = {}
+        flush = sink is None
+        if flush:
+            sink = MeasureUpdateSink(ncg, max_rows=None)
+        for pointid, reference_index in reference_indices.items():
+            measures = point_measures.get(pointid, [])
+            if reference_index is None or reference_index >= len(measures):
                 continue
+            source = measures[reference_index]
+            sink.add(source.id, template_metric=1, template_shift=0,
+                     phase_error=0, phase_diff=0, phase_shift=0)
+            for i, measure in enumerate(measures):
+                if i == reference_index:
+                    continue
+                groups.setdefault((source.imageid, measure.imageid), []).append((pointid, source, measure))
+
+        nodes = {}
+        def get_geodata(imageid):
+            if imageid not in nodes:
+                node = NetworkNode(node_id=imageid, image_path=paths[imageid])
+                node.parent = ncg
+                nodes[imageid] = node
+            return nodes[imageid].geodata
+
+        for (sourceid, destinationid), jobs in groups.items():
+            # Visit the measures in raster order so that neighboring windows are read back to back
+            jobs.sort(key=lambda job: (job[1].aprioriline, job[1].apriorisample))
+            source_geodata = get_geodata(sourceid)
+            destination_geodata = get_geodata(destinationid)
+
+            affines = [None] * len(jobs)
+            if geom_func == geom_match_simple:
+                try:
+                    affines = _estimate_window_affines(source_geodata, destination_geodata,
+                                                       [(s.apriorisample, s.aprioriline) for _, s, _ in jobs],
+                                                       size_x=geom_kwargs.get('size_x', 60),
+                                                       size_y=geom_kwargs.get('size_y', 60))
+                except Exception as e:
+                    print(f'Unable to estimate the affine transformations from {sourceid} to {destinationid} -> {e}')
+
+            for (pointid, source, measure), affine in zip(jobs, affines):
+                currentlog = {'pointid':pointid,
+                              'measureid':measure.id,
+                              'status':''}
+                if geom_func == geom_match_simple and affine is None:
+                    # The window could not be projected into the destination, which is
+                    # a geom failure. geom_match_simple would retry the same projection.
+                    print(f'Unable to estimate the affine transformation for measure {measure.id}')
+                    currentlog['status'] = f"geom_match failed on measure {measure.id}"
+                    resultlog.append(currentlog)
+                    if measure.weight is None:
+                        sink.add(measure.id, ignore=True)
+                    continue
+                try:
+                    # new geom_match has a incompatible API, until we decide on one, put in if.
+                    if geom_func == geom_match:
+                        new_x, new_y, dist, metric, _ = geom_func(source_geodata, destination_geodata,
+                                                                  source.apriorisample, source.aprioriline,
+                                                                  template_kwargs=match_kwargs,
+                                                                  verbose=verbose,
+                                                                  **geom_kwargs)
+                    elif geom_func == geom_match_simple:
+                        new_x, new_y, dist, metric, _ = geom_func(source_geodata, destination_geodata,
+                                                                  source.apriorisample, source.aprioriline,
+                                                                  match_func=match_func,
+                                                                  match_kwargs=match_kwargs,
+                                                                  affine=affine,
+                                                                  verbose=verbose,
+                                                                  **geom_kwargs)
+                    else:
+                        new_x, new_y, dist, metric, _ = geom_func(source_geodata, destination_geodata,
+                                                                  source.apriorisample, source.aprioriline,
+                                                                  match_func=match_func,
+                                                                  match_kwargs=match_kwargs,
+                                                                  verbose=verbose,
+                                                                  **geom_kwargs)
+                except Exception as e:
+                    print(f'geom_match failed on measure {measure.id} with exception -> {e}')
+                    currentlog['status'] = f"geom_match failed on measure {measure.id}"
+                    resultlog.append(currentlog)
+                    if measure.weight is None:
+                        sink.add(measure.id, ignore=True) # Geom match failed and no previous sucesses
+                    continue
+
+                registered, currentlog['status'], success = _evaluate_registration(measure.id, measure.weight,
+                                                                                   new_x, new_y, dist, metric,
+                                                                                   cost_func, threshold, chooser)
+                if registered:
+                    sink.add(measure.id, **registered)
+                if success:
+                    # Also, set the source measure back to ignore=False
+                    sink.add(source.id, ignore=False)
+                resultlog.append(currentlog)
+        t3 = time.time()
+        print(f'Registering {len(resultlog)} measures took {t3-t2} seconds.')
 
-            # Update the measure
-            measure.sample = new_x
-            measure.line = new_y
-            measure.weight = cost
-            measure.choosername = chooser
-
-            # In case this is a second run, set the ignore to False if this
-            # measures passed. Also, set the source measure back to ignore=False
-            measure.ignore = False
-            source.ignore = False
-            currentlog['status'] = f'Success. Distance shifted: {measure.template_shift}. Metric: {measure.template_metric}.'
-            resultlog.append(currentlog)
-        t4 = time.time()
-        print(f'Registering {len(measures)} took {t4-t3} seconds.')
+        if flush:
+            sink.flush(session=session)
     return resultlog
 
 
@@ -1750,9 +2233,9 @@ def register_to_base(pointid,
 
     # Finally, update the point that will be the reference
     with ncg.session_scope() as session:
-       measure = session.query(Measures).filter(Measures.id == best_results[0]).one()
-       measure.sample = best_results[2]
-       measure.line = best_results[3]
+       sink = MeasureUpdateSink(ncg, max_rows=None)
+       sink.add(int(best_results[0]), sample=best_results[2], line=best_results[3])
+       sink.flush(session=session)
 
        point = session.query(Points).filter(Points.id == pointid).one()
        point.ref_measure = best_results[1]
@@ -2,6 +2,7 @@ import math
 import unittest
 import warnings
 
+import cv2
 import numpy as np
 from imageio import imread
 from scipy.ndimage.interpolation import rotate
@@ -174,3 +175,32 @@ def test_ciratefi(template, search, cifi_thresh, rafi_thresh, tefi_thresh, alpha
 
     assert len(results) == 3
     assert (np.array(results[1], results[0]) < 1).all()
+
+@pytest.mark.parametrize("radius", [1, 2, 5, 1.5])
+def test_ring_sums(radius):
+    image = np.random.RandomState(0).uniform(0, 255, (15, 17))
+    expected = np.empty(image.shape)
+    for (y, x), _ in np.ndenumerate(image):
+        expected[y, x] = np.sum(image[ciratefi.circ_mask(image.shape, (y, x), radius)])
+    np.testing.assert_allclose(ciratefi.ring_sums(image, radius), expected)
+
+def test_radial_line_masks():
+    alphas = np.arange(0, 2*math.pi, math.pi/8)
+    masks = ciratefi.radial_line_masks((11, 13), (5, 6), 5, alphas)
+    assert masks.shape == (len(alphas), 11, 13)
+    for mask, alpha in zip(masks, alphas):
+        np.testing.assert_array_equal(mask, ciratefi.radial_line_mask((11, 13), (5, 6), 5, alpha=alpha))
+
+def test_ccorr_normed():
+    rs = np.random.RandomState(0)
+    image = rs.normal(size=(20, 5)).astype(np.float32)
+    template = rs.normal(size=(20, 5)).astype(np.float32)
+    # Degenerate samples are handled like OpenCV
+    image[0] = -math.inf
+    image[1] = 0
+    template[2] = -1
+
+    scores = ciratefi._ccorr_normed(image, template)
+    for i in range(len(image)):
+        expected = cv2.matchTemplate(image[i:i+1], template[i:i+1], method=cv2.TM_CCORR_NORMED)
+        assert scores[i] == pytest.approx(expected[0, 0], abs=1e-6)
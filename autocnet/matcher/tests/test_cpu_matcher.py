@@ -0,0 +1,127 @@
+from unittest.mock import patch
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+import pytest
+
+from autocnet.matcher import cpu_matcher
+
+
+class MockNode(dict):
+    def __init__(self, node_id, descriptors):
+        super(MockNode, self).__init__(node_id=node_id)
+        self.descriptors = descriptors
+        self.keypoints = pd.DataFrame(np.random.RandomState(node_id).uniform(0, 100, size=(len(descriptors), 2)),
+                                      columns=['x', 'y'])
+
+
+class MockEdge(object):
+    def __init__(self, source, destination):
+        self.source = source
+        self.destination = destination
+        self.matches = pd.DataFrame()
+
+
+@pytest.fixture
+def nodes():
+    # Each image sees the same (shuffled, noisy) features so that the nearest
+    # neighbor of each descriptor is unambiguous
+    rs = np.random.RandomState(12345)
+    base = rs.uniform(0, 255, size=(200, 128))
+    return [MockNode(i, (rs.permutation(base) + rs.normal(0, 1, size=base.shape)).astype(np.float32))
+            for i in range(4)]
+
+
+def best_matches(matches):
+    cols = ['source_image', 'source_idx', 'destination_image', 'destination_idx']
+    best = matches.sort_values(by='distance').drop_duplicates(subset=['source_idx'])
+    return best[cols].sort_values(by=cols).reset_index(drop=True)
+
+
+def test_match_with_cache_equals_match(nodes):
+    expected = MockEdge(nodes[0], nodes[1])
+    cpu_matcher.match(expected, k=2)
+
+    cache = cpu_matcher.FlannIndexCache()
+    edge = MockEdge(nodes[0], nodes[1])
+    cpu_matcher.match(edge, k=2, index_cache=cache)
+
+    assert len(cache) == 2
+    assert len(edge.matches) == 2 * 2 * 200
+    pd.testing.assert_frame_equal(best_matches(edge.matches), best_matches(expected.matches))
+    assert 'source_x' in edge.matches.columns
+    assert 'destination_y' in edge.matches.columns
+
+
+def test_match_appends_to_existing(nodes):
+    edge = MockEdge(nodes[0], nodes[1])
+    cpu_matcher.match(edge, k=2)
+    cpu_matcher.match(edge, k=2)
+    assert len(edge.matches) == 2 * 2 * 2 * 200
+    assert edge.matches.index.is_unique
+
+
+def test_match_subset_is_not_cached(nodes):
+    cache = cpu_matcher.FlannIndexCache()
+    edge = MockEdge(nodes[0], nodes[1])
+    aidx = pd.Index(np.arange(50, 150))
+    cpu_matcher.match(edge, k=2, index_cache=cache, aidx=aidx)
+
+    # The subset source is trained per edge, the full destination is cached
+    assert 0 not in cache
+    assert 1 in cache
+    source_matches = edge.matches[edge.matches.source_image == 0]
+    assert source_matches.source_idx.between(50, 149).all()
+
+
+def test_graph_trains_each_node_once(nodes):
+    graph = nx.Graph()
+    for s, d in [(0, 1), (0, 2), (0, 3), (1, 2), (2, 3)]:
+        graph.add_edge(s, d, data=MockEdge(nodes[s], nodes[d]))
+
+    cache = cpu_matcher.FlannIndexCache()
+    with patch.object(cpu_matcher.FlannMatcher, 'train', autospec=True,
+                      side_effect=cpu_matcher.FlannMatcher.train) as train:
+        for edge in cpu_matcher.edges_by_node(graph):
+            cpu_matcher.match(edge, k=2, index_cache=cache)
+    assert train.call_count == 4
+    assert cache.stats['hits'] == 2 * 5 - 4
+    for s, d, edge in graph.edges.data('data'):
+        assert len(edge.matches) == 2 * 2 * 200
+
+
+def test_edges_by_node():
+    graph = nx.Graph()
+    for s, d in [(2, 3), (0, 1), (1, 2), (0, 2)]:
+        graph.add_edge(s, d, data=(s, d))
+    edges = cpu_matcher.edges_by_node(graph)
+    assert len(edges) == 4
+    # All of the edges on node 0 are visited first
+    assert set(edges[:2]) == {(0, 1), (0, 2)}
+
+
+def test_index_cache_eviction(nodes):
+    nbytes = nodes[0].descriptors.nbytes
+    cache = cpu_matcher.FlannIndexCache(max_bytes=2 * nbytes)
+    matchers = [cpu_matcher.FlannMatcher() for i in range(3)]
+    for i, m in enumerate(matchers):
+        cache.put(i, m, nbytes)
+    assert 0 not in cache
+    assert len(cache) == 2
+    assert cache.nbytes == 2 * nbytes
+    assert cache.stats['evictions'] == 1
+
+    # Touching 1 makes 2 the least recently used
+    assert cache.get(1) is matchers[1]
+    cache.put(3, cpu_matcher.FlannMatcher(), nbytes)
+    assert 2 not in cache
+    assert 1 in cache
+
+    # Too large to cache
+    cache.put(4, cpu_matcher.FlannMatcher(), 3 * nbytes)
+    assert 4 not in cache
+
+    cache.clear()
+    assert len(cache) == 0
+    assert cache.nbytes == 0
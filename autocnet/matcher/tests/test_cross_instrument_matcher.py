@@ -0,0 +1,97 @@
+from unittest.mock import MagicMock, patch
+
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import Point
+
+from autocnet.matcher import cross_instrument_matcher as cim
+
+
+@pytest.fixture
+def base_cnet():
+    return pd.DataFrame({'pointid':[0, 0, 1],
+                         'path':['/themis/a.cub', '/themis/b.cub', '/themis/a.cub'],
+                         'line':[10.0, 20.0, 30.0],
+                         'sample':[11.0, 21.0, 31.0],
+                         'point':[Point(1, 2), Point(1, 2), Point(3, 4)]})
+
+def test_propagation_candidates(base_cnet):
+    images = pd.DataFrame({'point_index':[0, 0, 1],
+                           'id':[5, 6, 6],
+                           'path':['/ctx/c.cub', '/ctx/b.cub', '/ctx/b.cub'],
+                           'serial':['C', 'B', 'B']})
+    with patch('autocnet.matcher.cross_instrument_matcher.images_at_points', return_value=images) as lookup:
+        pairs = cim._propagation_candidates(MagicMock(), base_cnet, 30110)
+    assert lookup.call_count == 1
+    assert lookup.call_args[0][1:] == ([1.0, 3.0], [2.0, 4.0])
+
+    # b.cub is not propagated into itself
+    assert list(zip(pairs.measure_index, pairs.imageid)) == [(0, 5), (0, 6), (1, 5), (2, 6)]
+    assert pairs[pairs.measure_index == 2].pointid.iloc[0] == 1
+
+def test_propagate_point_uses_images_at_points():
+    images = pd.DataFrame({'point_index':[0], 'id':[5], 'path':['/ctx/c.cub'], 'serial':['C']})
+    config = {'spatial':{'latitudinal_srid':30110, 'semimajor_rad':3396190, 'semiminor_rad':3376200}}
+    with patch('autocnet.matcher.cross_instrument_matcher.images_at_points', return_value=images) as lookup, \
+         patch('autocnet.matcher.cross_instrument_matcher.GeoDataset'), \
+         patch('autocnet.matcher.cross_instrument_matcher.geom_match_simple',
+               return_value=(None, None, None, None, None)):
+        assert cim.propagate_point(MagicMock(), config, MagicMock(), 1.0, 2.0, 0,
+                                   ['/themis/a.cub'], [10.0], [11.0]) == []
+    assert lookup.call_args[0][1:] == ([1.0], [2.0])
+    assert lookup.call_args[1] == {'srid':30110}
+
+def test_propagate_from_image():
+    pairs = pd.DataFrame({'dest_path':['c', 'd', 'c'],
+                          'line':[30.0, 10.0, 10.0],
+                          'sample':[31.0, 11.0, 11.0]}, index=[7, 8, 9])
+    affine = MagicMock()
+    with patch('autocnet.matcher.cross_instrument_matcher.GeoDataset') as geodataset, \
+         patch('autocnet.matcher.cross_instrument_matcher._estimate_window_affines',
+               side_effect=[[affine, affine], [None]]) as estimate, \
+         patch('autocnet.matcher.cross_instrument_matcher.geom_match_simple',
+               side_effect=[(1, 2, 0.5, 0.9, None), (3, 4, 0.1, 0.8, None)]) as match:
+        results = cim._propagate_from_image('base', pairs, 'classic', {})
+
+    # Each image is opened once and the affines are estimated once per pair
+    assert [c[0][0] for c in geodataset.call_args_list] == ['base', 'c', 'd']
+    assert estimate.call_count == 2
+    assert list(estimate.call_args_list[0][0][2]) == [(11.0, 10.0), (31.0, 30.0)]
+    assert match.call_count == 2
+    assert match.call_args[1]['affine'] is affine
+    # Sorted by line then sample, the measure with no affine is skipped
+    assert results == [(9, 1, 2, 0.9, 0.5), (7, 3, 4, 0.8, 0.1)]
+
+def test_propagate_control_network(base_cnet):
+    pairs = pd.DataFrame({'measure_index':[0, 0, 2],
+                          'pointid':[0, 0, 1],
+                          'base_path':['/themis/a.cub', '/themis/a.cub', '/themis/a.cub'],
+                          'line':[10.0, 10.0, 30.0],
+                          'sample':[11.0, 11.0, 31.0],
+                          'imageid':[5, 6, 6],
+                          'dest_path':['/ctx/c.cub', '/ctx/d.cub', '/ctx/d.cub'],
+                          'serial':['C', 'D', 'D']})
+    results = [(0, 1.0, 2.0, 0.7, 0.5), (1, 3.0, 4.0, 0.9, 0.1), (2, 5.0, 6.0, 0.6, 0.2)]
+    config = {'spatial':{'latitudinal_srid':30110, 'semimajor_rad':3396190, 'semiminor_rad':3376200}}
+    dem = MagicMock()
+    dem.latlon_to_pixel.return_value = (0, 0)
+    dem.read_array.return_value = np.zeros((1, 1))
+    with patch('autocnet.matcher.cross_instrument_matcher._propagation_candidates', return_value=pairs), \
+         patch('autocnet.matcher.cross_instrument_matcher._propagate_from_image', return_value=results) as prop, \
+         patch('autocnet.matcher.cross_instrument_matcher.oc2og', side_effect=lambda lon, lat, a, b: (lon, lat)), \
+         patch('autocnet.matcher.cross_instrument_matcher.reproject', return_value=(1, 2, 3)), \
+         patch('autocnet.matcher.cross_instrument_matcher._write_propagated_points') as write:
+        ground = cim.propagate_control_network(MagicMock(), config, dem, base_cnet)
+
+    # All of the measures on a base image are matched in one task
+    assert prop.call_count == 1
+    assert write.call_count == 1
+    # The best match for each point is kept
+    assert ground.imageid.tolist() == [6, 6]
+    assert ground.pointid.tolist() == [0, 1]
+    assert ground['sample'].tolist() == [3.0, 5.0]
+
+def test_propagate_control_network_executor(base_cnet):
+    with pytest.raises(ValueError):
+        cim.propagate_control_network(MagicMock(), {}, MagicMock(), base_cnet, executor='gpu')
@@ -0,0 +1,129 @@
+import os
+
+from unittest.mock import patch, MagicMock
+
+import numpy as np
+import pandas as pd
+import pytest
+from shapely.geometry import Point
+
+from autocnet.matcher import ground
+
+
+@pytest.fixture
+def ncg():
+    ncg = MagicMock()
+    ncg.config = {'spatial':{'latitudinal_srid':949900}}
+    return ncg
+
+def test_find_ground_references_batch(ncg):
+    points = [MagicMock(geom=Point(i, i)) for i in range(3)]
+    images = pd.DataFrame({'point_index':[0, 0, 2],
+                           'id':[1, 2, 2],
+                           'path':['a.cub', 'b.cub', 'b.cub']})
+    with patch('autocnet.matcher.ground.images_at_points', return_value=images) as lookup, \
+         patch('autocnet.matcher.ground.find_ground_reference') as find:
+        ground.find_ground_references_batch(points, ncg=ncg, threshold=0.5)
+
+    assert lookup.call_count == 1
+    assert lookup.call_args[0][1:] == ([0, 1, 2], [0, 1, 2])
+    assert find.call_count == 3
+    found = {c[0][0].geom.x:c[1]['images'] for c in find.call_args_list}
+    assert found[0].id.tolist() == [1, 2]
+    assert len(found[1]) == 0
+    assert found[2].path.tolist() == ['b.cub']
+    assert 'point_index' not in found[0]
+    assert find.call_args[1]['threshold'] == 0.5
+
+def test_find_most_interesting_ground_batch(ncg):
+    candidates = [MagicMock(geom=Point(0, 0)), None, MagicMock(geom=Point(1, 1))]
+    session = ncg.session_scope.return_value.__enter__.return_value
+    with patch('autocnet.matcher.ground._most_interesting_ground', side_effect=candidates), \
+         patch('autocnet.matcher.ground.dedupe_points', return_value=np.array([False, True])) as dedupe:
+        with pytest.warns(UserWarning):
+            nadded = ground.find_most_interesting_ground_batch([(0, 0), (0.5, 0.5), (1, 1)],
+                                                               MagicMock(spec=ground.GeoDataset),
+                                                               threshold=0.1, ncg=ncg)
+    assert nadded == 1
+    assert dedupe.call_count == 1
+    assert dedupe.call_args[0][1:] == ([0.0, 1.0], [0.0, 1.0], 0.1)
+    session.add_all.assert_called_once_with([candidates[2]])
+
+def test_find_ground_reference_shared_tiles(ncg, tmpdir):
+    mosaic = tmpdir.join('mosaic.cub')
+    mosaic.write('fake cube')
+    base = MagicMock(measuretype=0, sample=1, line=2, serial=str(mosaic))
+    session = ncg.session_scope.return_value.__enter__.return_value
+    session.query.return_value.filter.return_value.all.return_value = [base]
+    directory = str(tmpdir.join('shared'))
+
+    ground._open_ground_dataset.cache_clear()
+    with patch('autocnet.matcher.ground.GeoDataset') as geodataset, \
+         patch('autocnet.matcher.ground.tile_cache') as cache:
+        for i in range(2):
+            ground.find_ground_reference(MagicMock(id=i), ncg=ncg, images=pd.DataFrame({'id':[], 'path':[]}),
+                                         shared_tiles=directory)
+    # The mosaic is opened once and its tiles are shared on the host
+    geodataset.assert_called_once_with(str(mosaic))
+    cache.share.assert_called_with(directory, paths=[str(mosaic)])
+    ground._open_ground_dataset.cache_clear()
+
+def test_open_ground_source_modified(tmpdir):
+    mosaic = tmpdir.join('mosaic.cub')
+    mosaic.write('fake cube')
+    ground._open_ground_dataset.cache_clear()
+    with patch('autocnet.matcher.ground.GeoDataset', side_effect=lambda path: MagicMock()) as geodataset:
+        first = ground._open_ground_source(str(mosaic))
+        assert ground._open_ground_source(str(mosaic)) is first
+        st = os.stat(str(mosaic))
+        os.utime(str(mosaic), ns=(st.st_atime_ns, st.st_mtime_ns + 10**9))
+        # The rewritten mosaic is opened again instead of using the stale handle
+        assert ground._open_ground_source(str(mosaic)) is not first
+    assert geodataset.call_count == 2
+    ground._open_ground_dataset.cache_clear()
+
+@pytest.fixture
+def interesting_mocks():
+    image = MagicMock()
+    image.image_extent = (100, 200, 300, 400)
+    point_info = [[{'Line':350, 'Sample':150}],
+                  [{'PositiveEast360Longitude':10.5, 'PlanetocentricLatitude':-3.25}]]
+    with patch('autocnet.matcher.ground.isis.point_info', side_effect=point_info) as pi, \
+         patch('autocnet.matcher.ground.roi.Roi', return_value=image) as r, \
+         patch('autocnet.matcher.ground.bytescale', side_effect=lambda x: x), \
+         patch('autocnet.matcher.ground.extract_most_interesting',
+               return_value=MagicMock(x=7, y=9)) as emi:
+        yield pi, r, emi
+
+def test_most_interesting_ground(interesting_mocks):
+    point_info, r, _ = interesting_mocks
+    mosaic = MagicMock(file_name='mosaic.cub')
+    g = ground._most_interesting_ground((10, -3), mosaic, 71, 'int8')
+
+    r.assert_called_once_with(mosaic, 150, 350, size_x=71, size_y=71)
+    assert point_info.call_args_list[0][0] == ('mosaic.cub', 10, -3, 'ground')
+    assert point_info.call_args_list[1][0] == ('mosaic.cub', 107, 309, 'image')
+    assert isinstance(g, ground.CandidateGroundPoints)
+    assert (g.path, g.apriorisample, g.aprioriline, g.sample, g.line) == ('mosaic.cub', 150, 350, 107, 309)
+    assert (g.geom.x, g.geom.y) == (10.5, -3.25)
+    assert g.choosername == 'find_most_interesting_ground'
+
+def test_most_interesting_ground_no_feature(interesting_mocks):
+    _, _, emi = interesting_mocks
+    emi.return_value = None
+    with pytest.warns(UserWarning):
+        assert ground._most_interesting_ground((10, -3), MagicMock(file_name='mosaic.cub'), 71, 'int8') is None
+
+@pytest.mark.parametrize("near", [True, False])
+def test_find_most_interesting_ground(ncg, interesting_mocks, near):
+    session = ncg.session_scope.return_value.__enter__.return_value
+    with patch('autocnet.matcher.ground.points_near_existing', return_value=np.array([near])) as pne:
+        if near:
+            with pytest.warns(UserWarning):
+                ground.find_most_interesting_ground((10, -3), MagicMock(spec=ground.GeoDataset, file_name='mosaic.cub'),
+                                                    threshold=0.1, ncg=ncg)
+        else:
+            ground.find_most_interesting_ground((10, -3), MagicMock(spec=ground.GeoDataset, file_name='mosaic.cub'),
+                                                threshold=0.1, ncg=ncg)
+    assert pne.call_args[0][1:] == ([10.5], [-3.25], 0.1)
+    assert session.add.call_count == (0 if near else 1)
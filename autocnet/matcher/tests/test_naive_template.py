@@ -1,8 +1,10 @@
 import pytest
 
+import time
 import unittest
 from .. import naive_template
 import numpy as np
+from scipy.ndimage import gaussian_filter, shift
 
 class TestNaiveTemplateAutoReg(unittest.TestCase):
 
@@ -112,3 +114,63 @@ class TestNaiveTemplate(unittest.TestCase):
     def tearDown(self):
         pass
 
+    def test_coarse_to_fine_native(self):
+        # Without upsampling, the coarse to fine search is the native search
+        for shape in [self._t_shape, self._rect_shape, self._square_shape, self._vertical_line]:
+            expected = naive_template.pattern_match(shape, self._test_image, upsampling=1)
+            result = naive_template.pattern_match(shape, self._test_image, upsampling=1, coarse_to_fine=True)
+            self.assertEqual(result[:3], expected[:3])
+
+
+def shifted_template_image(rs, size=301, template_size=25, image_size=121):
+    """
+    Return a template, an image and the (x, y) subpixel shift of the image
+    """
+    base = gaussian_filter(rs.uniform(0, 255, (size, size)), 2)
+    dx, dy = rs.uniform(-5, 5, 2)
+    moved = shift(base, (dy, dx), order=3)
+    c = size // 2
+    t = template_size // 2
+    i = image_size // 2
+    template = base[c-t:c+t+1, c-t:c+t+1].astype(np.float32)
+    image = moved[c-i:c+i+1, c-i:c+i+1].astype(np.float32)
+    return template, image, dx, dy
+
+def test_coarse_to_fine_subpixel_shift():
+    rs = np.random.RandomState(42)
+    for i in range(5):
+        template, image, dx, dy = shifted_template_image(rs)
+        x, y, strength, result = naive_template.pattern_match(template, image, coarse_to_fine=True)
+        assert x == pytest.approx(dx, abs=1/8)
+        assert y == pytest.approx(dy, abs=1/8)
+        assert strength > 0.99
+        # Only the neighborhood of the peak is correlated
+        assert result.shape == (2 * 2 * 16 + 1, 2 * 2 * 16 + 1)
+
+def test_coarse_to_fine_benchmark():
+    rs = np.random.RandomState(7)
+    full_time = 0
+    c2f_time = 0
+    offsets = []
+    for i in range(3):
+        template, image, dx, dy = shifted_template_image(rs)
+
+        t0 = time.perf_counter()
+        full = naive_template.pattern_match(template, image)
+        full_time += time.perf_counter() - t0
+
+        t0 = time.perf_counter()
+        c2f = naive_template.pattern_match(template, image, coarse_to_fine=True)
+        c2f_time += time.perf_counter() - t0
+
+        offsets.append((full[0] - c2f[0], full[1] - c2f[1]))
+        # Both modes reach the same subpixel accuracy
+        for x, y in [full[:2], c2f[:2]]:
+            assert x == pytest.approx(dx, abs=0.25)
+            assert y == pytest.approx(dy, abs=0.25)
+
+    # The timings are reported, not asserted, so that a loaded machine does not fail the test
+    max_offset = np.abs(offsets).max()
+    print(f'pattern_match: full {full_time:.4f}s, coarse to fine {c2f_time:.4f}s '
+          f'({full_time / c2f_time:.1f}x), max offset difference {max_offset:.4f}px')
+    assert max_offset <= 0.25
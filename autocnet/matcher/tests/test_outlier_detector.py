@@ -1,5 +1,6 @@
 import os
 import sys
+import time
 import unittest
 import warnings
 
@@ -98,3 +99,71 @@ class testSuppressionRanges(unittest.TestCase):
         with pytest.warns(UserWarning):
             mask, k = cpu_outlier_detector.spatial_suppression(df, (0, 0, 100, 100), k = 15, xkey='x', ykey='y')
         self.assertEqual(len(df[mask]), 17)
+
+    def test_large_distribution(self):
+        # Use a separate random state so the other tests see the same data
+        r = np.random.RandomState(54321)
+        df = pd.DataFrame(r.uniform(0,1000,(100000, 3)), columns=['x', 'y', 'strength'])
+        mask, k = cpu_outlier_detector.spatial_suppression(df, (0, 0, 1000, 1000), k=100, xkey='x', ykey='y')
+        self.assertEqual(k, 100)
+        self.assertEqual(mask.sum(), k)
+        self.assertEqual(len(mask), len(df))
+        # The best point is always kept
+        self.assertTrue(mask.iloc[0])
+
+
+def _groupby_distance_ratio(matches, ratio=0.8, single=False):
+    # The original, groupby based, implementation of the ratio test used as a reference
+    def func(group):
+        res = [False] * len(group)
+        if len(res) == 1:
+            return [single]
+        if group.iloc[0] < group.iloc[1] * ratio:
+            res[0] = True
+        return res
+
+    mask_s = matches.groupby('source_idx')['distance'].transform(func).astype('bool')
+    single = True
+    mask_d = matches.groupby('destination_idx')['distance'].transform(func).astype('bool')
+    return mask_s & mask_d
+
+def _random_matches(n, seed=12345):
+    rs = np.random.RandomState(seed)
+    df = pd.DataFrame({'source_idx':rs.randint(0, max(n // 3, 1), n),
+                       'destination_idx':rs.randint(0, max(n // 2, 1), n),
+                       'distance':rs.rand(n)})
+    # Non-sequential index to check that the mask aligns with the input
+    df.index = rs.permutation(n) + 10
+    return df
+
+@pytest.mark.parametrize("n", [0, 1, 2, 10, 1000])
+@pytest.mark.parametrize("single", [True, False])
+@pytest.mark.parametrize("ratio", [0.5, 0.8])
+def test_distance_ratio_matches_groupby(n, single, ratio):
+    df = _random_matches(n)
+    mask = cpu_outlier_detector.distance_ratio(None, df, ratio=ratio, single=single)
+    expected = _groupby_distance_ratio(df, ratio=ratio, single=single)
+    assert mask.index.equals(df.index)
+    np.testing.assert_array_equal(mask.values, expected.values)
+
+def test_distance_ratio_null_keys():
+    df = pd.DataFrame({'source_idx':[0, np.nan, 0, 1],
+                       'destination_idx':[1, 2, 3, np.nan],
+                       'distance':[1., 2., 3., 4.]})
+    mask = cpu_outlier_detector.distance_ratio(None, df)
+    np.testing.assert_array_equal(mask.values, _groupby_distance_ratio(df).values)
+
+def test_distance_ratio_benchmark():
+    df = _random_matches(20000)
+
+    t0 = time.perf_counter()
+    expected = _groupby_distance_ratio(df)
+    groupby_time = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    mask = cpu_outlier_detector.distance_ratio(None, df)
+    vectorized_time = time.perf_counter() - t0
+
+    # The timings are reported, not asserted, so that a loaded machine does not fail the test
+    print(f'distance_ratio on {len(df)} matches: groupby {groupby_time:.4f}s, vectorized {vectorized_time:.4f}s')
+    np.testing.assert_array_equal(mask.values, expected.values)
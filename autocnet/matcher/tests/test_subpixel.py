@@ -2,7 +2,7 @@ import math
 import os
 import sys
 import unittest
-from unittest.mock import patch
+from unittest.mock import patch, Mock, MagicMock
 
 from skimage import transform as tf
 from skimage.util import img_as_float   
@@ -13,6 +13,9 @@ import pytest
 
 import numpy as np
 from imageio import imread
+from scipy import ndimage
+
+from plio.io.io_gdal import GeoDataset
 
 from autocnet.examples import get_path
 import autocnet.matcher.subpixel as sp
@@ -47,6 +50,28 @@ def apollo_subsets():
     arr2 = imread(get_path('AS15-M-0295_SML(2).png'))[235:336, 95:196]
     return arr1, arr2
 
+def _mock_geodataset(arr, name):
+    geodata = Mock(spec=GeoDataset)
+    geodata.file_name = name
+    geodata.base_name = name
+    geodata.raster_size = arr.shape[::-1]
+
+    def read_array(pixels=None, dtype=None, band=1):
+        if pixels is None:
+            return arr.copy()
+        x, y, xcount, ycount = pixels
+        return arr[y:y+ycount, x:x+xcount].copy()
+
+    geodata.read_array = MagicMock(side_effect=read_array)
+    return geodata
+
+@pytest.fixture
+def shifted_geodata_pair():
+    shift = (5.25, 3.5)
+    base = data.camera().astype(np.float64)
+    dst = ndimage.shift(base, (shift[1], shift[0]), order=3)
+    return _mock_geodataset(base, 'base.cub'), _mock_geodataset(dst, 'dst.cub'), shift
+
 @pytest.mark.parametrize("nmatches, nstrengths", [(10,1), (10,2)])
 def test_prep_subpixel(nmatches, nstrengths):
     arrs = sp._prep_subpixel(nmatches, nstrengths=nstrengths)
@@ -285,4 +310,239 @@ def test_subpixel_phase_cooked(x, y, x1, y1, image_size, expected):
     assert dx == expected[0]
     assert dy == expected[1]
 
-
+def test_match_window_size():
+    assert sp._match_window_size(60, 60, {}) == (65, 65)
+    assert sp._match_window_size(10, 20, {'image_size':(101,101), 'template_size':(31,31)}, buffer=0) == (50, 50)
+    assert sp._match_window_size(10, 20, {'size':(51, 81)}, buffer=1) == (26, 41)
+
+@pytest.mark.parametrize("bcenter_x, bcenter_y", [(200.3, 250.7), (300, 100), (61, 61)])
+def test_geom_match_simple_windowed(shifted_geodata_pair, bcenter_x, bcenter_y):
+    base, dst, shift = shifted_geodata_pair
+    pixels = {"IsisCube": {"Core": {"Pixels": {"Type": "Real"}}}}
+    with patch('autocnet.io.metadata.pvl.load', return_value=pixels), \
+         patch('autocnet.spatial.isis.batch_image_to_ground', side_effect=lambda f, x, y: (np.asarray(y), np.asarray(x))), \
+         patch('autocnet.spatial.isis.batch_ground_to_image', side_effect=lambda f, lon, lat: (np.asarray(lat) + shift[1], np.asarray(lon) + shift[0])):
+        full = sp.geom_match_simple(base, dst, bcenter_x, bcenter_y, windowed=False, verbose=False)
+        windowed = sp.geom_match_simple(base, dst, bcenter_x, bcenter_y, verbose=False)
+
+    # The windowed matcher reads subsets of the images
+    assert base.read_array.call_args[1]['pixels'] is not None
+    assert dst.read_array.call_args[1]['pixels'] is not None
+
+    assert windowed[0] == pytest.approx(full[0], abs=0.3)
+    assert windowed[1] == pytest.approx(full[1], abs=0.3)
+    assert windowed[0] == pytest.approx(bcenter_x + shift[0], abs=0.5)
+    assert windowed[1] == pytest.approx(bcenter_y + shift[1], abs=0.5)
+    assert windowed[3] == pytest.approx(full[3], abs=0.05)
+
+def test_geom_match_simple_unprojectable_corner(shifted_geodata_pair):
+    base, dst, shift = shifted_geodata_pair
+    pixels = {"IsisCube": {"Core": {"Pixels": {"Type": "Real"}}}}
+    def ground_to_image(f, lon, lat):
+        lines = np.asarray(lat) + shift[1]
+        lines[0] = np.nan
+        return lines, np.asarray(lon) + shift[0]
+    with patch('autocnet.io.metadata.pvl.load', return_value=pixels), \
+         patch('autocnet.spatial.isis.batch_image_to_ground', side_effect=lambda f, x, y: (np.asarray(y), np.asarray(x))) as i2g, \
+         patch('autocnet.spatial.isis.batch_ground_to_image', side_effect=ground_to_image) as g2i:
+        res = sp.geom_match_simple(base, dst, 200, 200, verbose=False)
+    # All four corners are projected with a single call per image
+    assert i2g.call_count == 1
+    assert g2i.call_count == 1
+    assert res == (None, None, None, None, None)
+
+def test_estimate_window_affines(shifted_geodata_pair):
+    base, dst, shift = shifted_geodata_pair
+    def ground_to_image(f, lon, lat):
+        lines = np.asarray(lat) + shift[1]
+        # A corner of the second window does not project
+        lines[5] = np.nan
+        return lines, np.asarray(lon) + shift[0]
+    with patch('autocnet.spatial.isis.batch_image_to_ground', side_effect=lambda f, x, y: (np.asarray(y), np.asarray(x))) as i2g, \
+         patch('autocnet.spatial.isis.batch_ground_to_image', side_effect=ground_to_image) as g2i:
+        affines = sp._estimate_window_affines(base, dst, [(100, 100), (200, 200), (300, 250)], size_x=20, size_y=20)
+    # The corners of all of the windows are projected with a single call per image
+    assert i2g.call_count == 1
+    assert g2i.call_count == 1
+    assert len(i2g.call_args[0][1]) == 12
+    assert affines[1] is None
+    for affine in (affines[0], affines[2]):
+        np.testing.assert_allclose(affine.translation, shift, atol=1e-8)
+        np.testing.assert_allclose(affine.params[:2,:2], np.eye(2), atol=1e-8)
+
+def test_geom_match_simple_with_affine(shifted_geodata_pair):
+    base, dst, shift = shifted_geodata_pair
+    pixels = {"IsisCube": {"Core": {"Pixels": {"Type": "Real"}}}}
+    affine = tf.AffineTransform(translation=shift)
+    with patch('autocnet.io.metadata.pvl.load', return_value=pixels), \
+         patch('autocnet.spatial.isis.batch_image_to_ground') as i2g:
+        res = sp.geom_match_simple(base, dst, 200, 250, affine=affine, verbose=False)
+    assert i2g.call_count == 0
+    assert res[0] == pytest.approx(200 + shift[0], abs=0.5)
+    assert res[1] == pytest.approx(250 + shift[1], abs=0.5)
+
+def _mock_batch_ncg(points, measures, images):
+    from collections import namedtuple
+    from contextlib import contextmanager
+    Row = namedtuple('Row', ['id', 'pointid', 'imageid', 'apriorisample', 'aprioriline', 'weight'])
+    rows = [Row(*m) for m in measures]
+
+    session = MagicMock()
+    def query(*args):
+        q = MagicMock()
+        if args[0] is sp.Points.id:
+            q.filter.return_value.all.return_value = points
+        elif args[0] is sp.Measures.id:
+            q.filter.return_value.order_by.return_value = rows
+        elif args[0] is sp.Images.id:
+            q.filter.return_value.all.return_value = images
+        return q
+    session.query.side_effect = query
+
+    ncg = Mock()
+    @contextmanager
+    def session_scope():
+        yield session
+    ncg.session_scope = session_scope
+    return ncg, session
+
+def test_subpixel_register_points_batch():
+    # Two points, each with the reference on image 1 and measures on images 2 and 3
+    points = [(10, 0), (11, 0)]
+    measures = [(1, 10, 1, 100., 100., None),
+                (2, 10, 2, 100., 100., None),
+                (3, 10, 3, 100., 100., None),
+                (4, 11, 1, 50., 50., None),
+                (5, 11, 2, 50., 50., None),
+                (6, 11, 3, 50., 50., 0.5)]
+    images = [(1, 'one.cub'), (2, 'two.cub'), (3, 'three.cub')]
+    ncg, session = _mock_batch_ncg(points, measures, images)
+
+    def geom_match(base, dst, x, y, **kwargs):
+        if dst.name == 'three.cub':
+            return None, None, None, None, None
+        return x + 1, y + 2, 1, 0.9, None
+
+    def estimate_affines(base, dst, centers, **kwargs):
+        return [tf.AffineTransform() for c in centers]
+
+    def network_node(node_id=None, image_path=None):
+        node = Mock()
+        node.geodata.name = image_path
+        return node
+
+    with patch('autocnet.matcher.subpixel.geom_match_simple', side_effect=geom_match) as gm, \
+         patch('autocnet.matcher.subpixel._estimate_window_affines', side_effect=estimate_affines) as ea, \
+         patch('autocnet.matcher.subpixel.NetworkNode', side_effect=network_node) as nn, \
+         patch('autocnet.matcher.subpixel.MeasureUpdateSink.flush', autospec=True) as flush:
+        resultlog = sp.subpixel_register_points_batch([10, 11], ncg=ncg)
+
+    # Each image is opened once and the affines are estimated once per image pair
+    assert nn.call_count == 3
+    assert ea.call_count == 2
+    assert sorted(len(c[0][2]) for c in ea.call_args_list) == [2, 2]
+    assert gm.call_count == 4
+    assert all(c[1]['affine'] is not None for c in gm.call_args_list)
+
+    assert len(resultlog) == 4
+    assert {r['measureid'] for r in resultlog} == {2, 3, 5, 6}
+
+    # All of the updates are written with one bulk update
+    assert flush.call_count == 1
+    assert flush.call_args[1]['session'] is session
+    mappings = flush.call_args[0][0].rows
+    assert mappings[1]['template_metric'] == 1
+    assert mappings[1]['ignore'] == False
+    assert mappings[2]['sample'] == 101
+    assert mappings[2]['line'] == 102
+    assert mappings[2]['weight'] == pytest.approx(0.9)
+    assert mappings[2]['choosername'] == 'subpixel_register_points_batch'
+    assert mappings[3] == {'ignore':True}
+    # Failed, but previously registered, measures are left alone
+    assert 6 not in mappings
+
+def test_subpixel_register_point_writes_through_sink():
+    from contextlib import contextmanager
+    measures = [Mock(id=1, imageid=1, weight=None, apriorisample=100., aprioriline=100.),
+                Mock(id=2, imageid=2, weight=None),
+                Mock(id=3, imageid=3, weight=None),
+                Mock(id=4, imageid=4, weight=0.5)]
+    point = Mock(measures=measures, reference_index=0)
+    session = MagicMock()
+    session.query.return_value.filter.return_value.one.side_effect = \
+        [point] + [Mock(path=p) for p in ['one.cub', 'two.cub', 'three.cub', 'four.cub']]
+    ncg = Mock()
+    @contextmanager
+    def session_scope():
+        yield session
+    ncg.session_scope = session_scope
+
+    def geom_match(base, dst, x, y, **kwargs):
+        if dst == 'two.cub':
+            return x + 1, y + 2, 1, 0.9, None
+        if dst == 'three.cub':
+            raise ValueError('Unable to match')
+        return None, None, None, None, None
+
+    def network_node(node_id=None, image_path=None):
+        return Mock(geodata=image_path)
+
+    with patch('autocnet.matcher.subpixel.geom_match_simple', side_effect=geom_match), \
+         patch('autocnet.matcher.subpixel.NetworkNode', side_effect=network_node), \
+         patch('autocnet.matcher.subpixel.MeasureUpdateSink.flush', autospec=True) as flush:
+        resultlog = sp.subpixel_register_point(10, ncg=ncg)
+
+    assert [r['measureid'] for r in resultlog] == [2, 3, 4]
+    # The measures are written in one bulk update instead of through the ORM objects
+    assert flush.call_count == 1
+    assert flush.call_args[1]['session'] is session
+    mappings = flush.call_args[0][0].rows
+    assert mappings[1]['template_metric'] == 1
+    assert mappings[1]['ignore'] == False
+    assert mappings[2]['sample'] == 101
+    assert mappings[2]['line'] == 102
+    assert mappings[2]['choosername'] == 'subpixel_register_point'
+    assert mappings[3] == {'ignore':True}
+    # Failed, but previously registered, measures are left alone
+    assert 4 not in mappings
+
+@pytest.mark.parametrize("affine_error", [False, True])
+def test_subpixel_register_points_batch_no_affine(affine_error):
+    points = [(10, 0), (11, 0)]
+    measures = [(1, 10, 1, 100., 100., None),
+                (2, 10, 2, 100., 100., None),
+                (4, 11, 1, 50., 50., None),
+                (5, 11, 2, 50., 50., 0.5)]
+    images = [(1, 'one.cub'), (2, 'two.cub')]
+    ncg, session = _mock_batch_ncg(points, measures, images)
+
+    def estimate_affines(base, dst, centers, **kwargs):
+        if affine_error:
+            raise ValueError('Unable to project')
+        # The first window (in raster order) can not be projected
+        return [None] + [tf.AffineTransform() for c in centers[1:]]
+
+    def network_node(node_id=None, image_path=None):
+        return Mock()
+
+    with patch('autocnet.matcher.subpixel.geom_match_simple', return_value=(1, 2, 1, 0.9, None)) as gm, \
+         patch('autocnet.matcher.subpixel._estimate_window_affines', side_effect=estimate_affines), \
+         patch('autocnet.matcher.subpixel.NetworkNode', side_effect=network_node), \
+         patch('autocnet.matcher.subpixel.MeasureUpdateSink.flush', autospec=True) as flush:
+        resultlog = sp.subpixel_register_points_batch([10, 11], ncg=ncg)
+
+    # The measures without an affine are geom failures and are not matched
+    assert all(c[1]['affine'] is not None for c in gm.call_args_list)
+    failed = {r['measureid'] for r in resultlog if r['status'].startswith('geom_match failed')}
+    if affine_error:
+        assert gm.call_count == 0
+        assert failed == {2, 5}
+    else:
+        assert gm.call_count == 1
+        assert failed == {5}
+
+    mappings = flush.call_args[0][0].rows
+    # Previously registered measures are left alone
+    assert 5 not in mappings
+    if affine_error:
+        assert mappings[2] == {'ignore':True}
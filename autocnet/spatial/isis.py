@@ -6,6 +6,8 @@ from numbers import Number
 import numpy as np
 import tempfile
 
+from autocnet.io.metadata import metadata_cache
+
 
 def point_info(cube_path, x, y, point_type, allow_outside=False):
     """
@@ -48,7 +50,7 @@ def point_info(cube_path, x, y, point_type, allow_outside=False):
         x = np.add(x, .5)
         y = np.add(y, .5)
 
-    if pvl.load(cube_path).get("IsisCube").get("Mapping"):
+    if metadata_cache.is_projected(cube_path):
       pvlres = []
       # We have a projected image
       for x,y in zip(x,y):
@@ -165,3 +167,185 @@ def ground_to_image(cube_path, lon, lat):
     return lines, samples
 
 
+
+
+def _quantity_value(v):
+    """
+    Strip the units off of a pvl quantity, if present.
+    """
+    return getattr(v, 'value', v)
+
+
+def batch_point_info(cube_path, x, y, point_type, allow_outside=False):
+    """
+    Use Isis's campt (or mappt for projected cubes) to get image/ground point
+    info for many points in a single cube. All of the points are written to
+    one coordinate list so that ISIS is only started once per call, no matter
+    how many points are requested.
+
+    Parameters
+    ----------
+    cube_path : str
+                path to the input cube
+
+    x : iterable
+        points in the x direction. Either samples or longitudes
+        depending on the point_type flag
+
+    y : iterable
+        points in the y direction. Either lines or latitudes
+        depending on the point_type flag
+
+    point_type : str
+                 Options: {"image", "ground"}
+                 Pass "image" if  x,y are in image space (sample, line) or
+                 "ground" if in ground space (longitude, lattiude)
+
+    allow_outside : bool
+                    If True, allow points outside of the image to be computed
+
+    Returns
+    -------
+    results : list
+              of dicts, one per input point, in the same order as the inputs.
+              Points that could not be computed are None. Sample and Line
+              values are in PLIO (pixel center = 0.5) pixels.
+    """
+    point_type = point_type.lower()
+
+    if point_type not in {"image", "ground"}:
+        raise Exception(f'{point_type} is not a valid point type, valid types are ["image", "ground"]')
+
+    x = np.atleast_1d(np.asarray(x, dtype=np.float64))
+    y = np.atleast_1d(np.asarray(y, dtype=np.float64))
+    if x.shape != y.shape:
+        raise ValueError('x and y must be the same length')
+
+    # Points that can not be resolved (e.g., NaN from an earlier failed
+    # projection) are never sent to ISIS.
+    results = [None] * len(x)
+    finite = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if len(finite) == 0:
+        return results
+    x = x[finite]
+    y = y[finite]
+
+    if point_type == "image":
+        # convert to ISIS pixels
+        x = x + .5
+        y = y + .5
+    else:
+        # campt and mappt use lat, lon for ground but sample, line for image.
+        # So swap x,y for ground-to-image calls
+        x, y = y, x
+
+    projected = metadata_cache.is_projected(cube_path)
+
+    with tempfile.NamedTemporaryFile("w+") as f:
+        # ISIS wants the points in a file, so write to a temp file
+        f.write("\n".join(["{}, {}".format(xval, yval) for xval, yval in zip(x, y)]))
+        f.flush()
+        try:
+            if projected:
+                kwargs = {'coordsys':'UNIVERSAL'} if point_type == "ground" else {}
+                pvlres = isis.mappt(from_=cube_path, coordlist=f.name, allowoutside=allow_outside,
+                                    type_="coordlist", coordtype=point_type, **kwargs)
+            else:
+                pvlres = isis.campt(from_=cube_path, coordlist=f.name, allowoutside=allow_outside,
+                                    usecoordlist=True, coordtype=point_type)
+        except ProcessError as e:
+            warn(f"{'MAPPT' if projected else 'CAMPT'} call failed, image: {cube_path}\n{e.stderr}")
+            return results
+
+    groups = pvl.loads(pvlres).getall("Results" if projected else "GroundPoint")
+    if len(groups) != len(finite):
+        warn(f'Expected {len(finite)} results from ISIS but got {len(groups)}, image: {cube_path}')
+        return results
+
+    for i, group in zip(finite, groups):
+        if group.get('Error') is not None:
+            continue
+        res = dict(group)
+        # convert all pixels to PLIO pixels from ISIS
+        res["Sample"] = _quantity_value(res["Sample"]) - .5
+        res["Line"] = _quantity_value(res["Line"]) - .5
+        results[i] = res
+    return results
+
+
+def batch_image_to_ground(cube_path, samples, lines, lattype="PlanetocentricLatitude", lonttype="PositiveEast360Longitude"):
+    """
+    Convert many line/sample points in a single image to lat/lon using
+    one ISIS call.
+
+    Parameters
+    ----------
+    cube_path : str
+                path to the input cube
+
+    samples : iterable
+              of sample coordinates
+
+    lines : iterable
+            of line coordinates
+
+    Returns
+    -------
+    lats : np.array, float
+           1-D array of latitudes. Points that failed to project are NaN.
+
+    lons : np.array, float
+           1-D array of longitudes. Points that failed to project are NaN.
+
+    See Also
+    --------
+    autocnet.spatial.isis.batch_point_info
+    """
+    res = batch_point_info(cube_path, samples, lines, "image")
+    lats = np.full(len(res), np.nan)
+    lons = np.full(len(res), np.nan)
+    for i, r in enumerate(res):
+        if r is None:
+            continue
+        lats[i] = _quantity_value(r[lattype])
+        lons[i] = _quantity_value(r[lonttype])
+    return lats, lons
+
+
+def batch_ground_to_image(cube_path, lons, lats):
+    """
+    Convert many lat/lon points to line/sample in a single image using
+    one ISIS call.
+
+    Parameters
+    ----------
+    cube_path : str
+                path to the input cube
+
+    lons : iterable
+           of longitudes
+
+    lats : iterable
+           of latitudes
+
+    Returns
+    -------
+    lines : np.array, float
+            1-D array of lines. Points that failed to project are NaN.
+
+    samples : np.array, float
+              1-D array of samples. Points that failed to project are NaN.
+
+    See Also
+    --------
+    autocnet.spatial.isis.batch_point_info
+    """
+    res = batch_point_info(cube_path, lons, lats, "ground")
+    lines = np.full(len(res), np.nan)
+    samples = np.full(len(res), np.nan)
+    for i, r in enumerate(res):
+        if r is None:
+            continue
+        lines[i] = r["Line"]
+        samples[i] = r["Sample"]
+    return lines, samples
@@ -41,6 +41,38 @@ INSERT INTO overlay(intersections, geom) SELECT row.intersections, row.geom FROM
   FROM iid GROUP BY iid.geom) AS row WHERE array_length(intersections, 1) > 1;
 """
 
+def _ground_to_nodes(nodes, lons, lats):
+    """
+    Project a set of ground points into each of the nodes using a
+    single ISIS call per node.
+
+    Parameters
+    ----------
+    nodes : list
+            of autocnet.graph.node.NetworkNode objects
+
+    lons : iterable
+           of longitudes
+
+    lats : iterable
+           of latitudes
+
+    Returns
+    -------
+    lines : ndarray
+            (n nodes, n points) array of lines. Points that do not
+            project into a node are NaN.
+
+    samples : ndarray
+              (n nodes, n points) array of samples. Points that do not
+              project into a node are NaN.
+    """
+    lines = np.full((len(nodes), len(lons)), np.nan)
+    samples = np.full((len(nodes), len(lons)), np.nan)
+    for i, node in enumerate(nodes):
+        lines[i], samples[i] = isis.batch_ground_to_image(node["image_path"], lons, lats)
+    return lines, samples
+
 def place_points_in_overlaps(size_threshold=0.0007,
                              distribute_points_kwargs={},
                              cam_type='csm',
@@ -171,7 +203,14 @@ def place_points_in_overlap(overlap,
             nodes.append(nn)
     
     print(f'Attempting to place measures in {len(nodes)} images.')
-    for v in valid:
+
+    # Starting ISIS is expensive, so when using ISIS cameras every candidate
+    # point is projected into each image with a single call per image.
+    if cam_type == "isis":
+        apriori_lines, apriori_samples = _ground_to_nodes(nodes, valid[:,0], valid[:,1])
+
+    candidates = []
+    for i, v in enumerate(valid):
         lon = v[0]
         lat = v[1]
 
@@ -181,16 +220,17 @@ def place_points_in_overlap(overlap,
         height = ncg.dem.read_array(1, [px, py, 1, 1])[0][0]
 
         # Need to get the first node and then convert from lat/lon to image space
+        interesting = None
+        image_roi = None
         for reference_index, node in enumerate(nodes):  
             # reference_index is the index into the list of measures for the image that is not shifted and is set at the 
             # reference against which all other images are registered.
             if cam_type == "isis":
-                try:
-                    line, sample = isis.ground_to_image(node["image_path"], lon, lat)
-                except ProcessError as e:
-                    if 'Requested position does not project in camera model' in e.stderr:
-                        print(f'point ({lon}, {lat}) does not project to reference image {node["image_path"]}')
-                        continue
+                line = apriori_lines[reference_index, i]
+                sample = apriori_samples[reference_index, i]
+                if not np.isfinite([line, sample]).all():
+                    print(f'point ({lon}, {lat}) does not project to reference image {node["image_path"]}')
+                    continue
             if cam_type == "csm":
                 lon_og, lat_og = oc2og(lon, lat, semi_major, semi_minor)
                 x, y, z = reproject([lon_og, lat_og, height],
@@ -213,7 +253,11 @@ def place_points_in_overlap(overlap,
             if interesting is not None:
                 # We have found an interesting feature and have identified the reference point.
                 break
- 
+
+        if image_roi is None:
+            # The point did not project into any of the images
+            continue
+
         if interesting is None:
             warnings.warn('Unable to find an interesting point, falling back to the a priori pointing')
             newsample = sample
@@ -226,15 +270,36 @@ def place_points_in_overlap(overlap,
             newsample = left_x + interesting.x
             newline = top_y + interesting.y
 
-        # Get the updated lat/lon from the feature in the node
+        candidates.append({'lon':lon, 'lat':lat, 'height':height,
+                           'reference_index':reference_index,
+                           'newsample':newsample, 'newline':newline})
+
+    # Get the updated lat/lon from the feature in the reference node. With ISIS,
+    # the candidates are grouped by reference image and resolved in one call each.
+    if cam_type == "isis":
+        for reference_index, node in enumerate(nodes):
+            group = [c for c in candidates if c['reference_index'] == reference_index]
+            if not group:
+                continue
+            res = isis.batch_point_info(node["image_path"],
+                                        [c['newsample'] for c in group],
+                                        [c['newline'] for c in group],
+                                        point_type="image")
+            for c, p in zip(group, res):
+                c['point_info'] = p
+
+    updated = []
+    for c in candidates:
+        lon, lat, height = c['lon'], c['lat'], c['height']
+        newsample, newline = c['newsample'], c['newline']
+        node = nodes[c['reference_index']]
+
         if cam_type == "isis":
-            try:
-                p = isis.point_info(node["image_path"], newsample, newline, point_type="image")
-            except ProcessError as e:
-                if 'Requested position does not project in camera model' in e.stderr:
-                    print(node["image_path"])
-                    print(f'interesting point ({newsample}, {newline}) does not project back to ground')
-                    continue
+            p = c['point_info']
+            if p is None:
+                print(node["image_path"])
+                print(f'interesting point ({newsample}, {newline}) does not project back to ground')
+                continue
             try:
                 x, y, z = p["BodyFixedCoordinate"].value
             except:
@@ -274,6 +339,14 @@ def place_points_in_overlap(overlap,
                                                                  'geocent', 'latlon')
             updated_lon, updated_lat = og2oc(updated_lon_og, updated_lat_og, semi_major, semi_minor)
 
+        updated.append((c['reference_index'], x, y, z, updated_lon, updated_lat))
+
+    # Back project all of the updated ground points into every image at once
+    if cam_type == "isis" and updated:
+        updated_lonlat = np.array([u[4:] for u in updated])
+        measure_lines, measure_samples = _ground_to_nodes(nodes, updated_lonlat[:,0], updated_lonlat[:,1])
+
+    for i, (reference_index, x, y, z, updated_lon, updated_lat) in enumerate(updated):
         point_geom = shapely.geometry.Point(x, y, z)
         point = Points(identifier=identifier,
                        overlapid=overlap.id,
@@ -286,17 +359,16 @@ def place_points_in_overlap(overlap,
         # Compute ground point to back project into measurtes
         gnd = csmapi.EcefCoord(x, y, z)
 
-        for node in nodes:
+        for j, node in enumerate(nodes):
             if cam_type == "csm":
                 image_coord = node.camera.groundToImage(gnd)
                 sample, line = image_coord.samp, image_coord.line
             if cam_type == "isis":
-                try:
-                    line, sample = isis.ground_to_image(node["image_path"], updated_lon, updated_lat)
-                except ProcessError as e:
-                    if 'Requested position does not project in camera model' in e.stderr:
-                        print(f'interesting point ({updated_lon},{updated_lat}) does not project to image {node["image_path"]}')
-                        continue
+                line = measure_lines[j, i]
+                sample = measure_samples[j, i]
+                if not np.isfinite([line, sample]).all():
+                    print(f'interesting point ({updated_lon},{updated_lat}) does not project to image {node["image_path"]}')
+                    continue
 
             point.measures.append(Measures(sample=sample,
                                            line=line,
@@ -0,0 +1,82 @@
+from unittest.mock import patch
+
+import numpy as np
+import pytest
+from pysis.exceptions import ProcessError
+
+from autocnet.spatial import isis
+
+camera_cube = {"IsisCube": {"Core": {}}}
+projected_cube = {"IsisCube": {"Core": {}, "Mapping": {}}}
+
+def campt_results(samples, lines, errors=None):
+    if errors is None:
+        errors = [False] * len(samples)
+    groups = []
+    for s, l, e in zip(samples, lines, errors):
+        groups.append(f"""Group = GroundPoint
+  Sample = {s}
+  Line = {l}
+  PlanetocentricLatitude = {l * 2} <DEGREE>
+  PositiveEast360Longitude = {s * 2} <DEGREE>
+  Error = {'"Requested position does not project in camera model"' if e else 'Null'}
+End_Group""")
+    return "\n".join(groups) + "\nEnd"
+
+def read_coordlist(kwargs):
+    with open(kwargs['coordlist']) as f:
+        return np.array([[float(v) for v in line.split(',')] for line in f.read().splitlines()])
+
+@pytest.mark.parametrize("point_type", ["image", "ground"])
+def test_batch_point_info_single_campt_call(point_type):
+    def campt(**kwargs):
+        coords = read_coordlist(kwargs)
+        assert kwargs['usecoordlist']
+        assert kwargs['coordtype'] == point_type
+        return campt_results(coords[:,0], coords[:,1])
+
+    with patch('autocnet.spatial.isis.pvl.load', return_value=camera_cube), \
+         patch('autocnet.spatial.isis.isis.campt', side_effect=campt, create=True) as mock_campt:
+        res = isis.batch_point_info('foo.cub', [1, 2, 3], [4, 5, 6], point_type)
+    assert mock_campt.call_count == 1
+    assert len(res) == 3
+    if point_type == "image":
+        # ISIS pixels are offset by .5 and converted back
+        np.testing.assert_array_almost_equal([r['Sample'] for r in res], [1, 2, 3])
+        np.testing.assert_array_almost_equal([r['Line'] for r in res], [4, 5, 6])
+    else:
+        # campt wants lat, lon
+        np.testing.assert_array_almost_equal([r['Sample'] for r in res], [3.5, 4.5, 5.5])
+
+def test_batch_point_info_projected_uses_mappt():
+    def mappt(**kwargs):
+        coords = read_coordlist(kwargs)
+        assert kwargs['type_'] == 'coordlist'
+        return campt_results(coords[:,0], coords[:,1]).replace('GroundPoint', 'Results')
+
+    with patch('autocnet.spatial.isis.pvl.load', return_value=projected_cube), \
+         patch('autocnet.spatial.isis.isis.mappt', side_effect=mappt, create=True) as mock_mappt:
+        res = isis.batch_point_info('foo.cub', [1, 2], [4, 5], 'image')
+    assert mock_mappt.call_count == 1
+    np.testing.assert_array_almost_equal([r['Sample'] for r in res], [1, 2])
+
+def test_batch_image_to_ground_failed_points():
+    def campt(**kwargs):
+        coords = read_coordlist(kwargs)
+        # The NaN point is never sent to ISIS
+        assert len(coords) == 2
+        return campt_results(coords[:,0], coords[:,1], errors=[False, True])
+
+    with patch('autocnet.spatial.isis.pvl.load', return_value=camera_cube), \
+         patch('autocnet.spatial.isis.isis.campt', side_effect=campt, create=True):
+        lats, lons = isis.batch_image_to_ground('foo.cub', [1, np.nan, 3], [4, 5, 6])
+    np.testing.assert_array_almost_equal(lats, [9, np.nan, np.nan])
+    np.testing.assert_array_almost_equal(lons, [3, np.nan, np.nan])
+
+def test_batch_ground_to_image_process_error():
+    with patch('autocnet.spatial.isis.pvl.load', return_value=camera_cube), \
+         patch('autocnet.spatial.isis.isis.campt', side_effect=ProcessError(1, ['campt'], '', 'failed'), create=True):
+        with pytest.warns(UserWarning):
+            lines, samples = isis.batch_ground_to_image('foo.cub', [1, 2], [3, 4])
+    assert np.isnan(lines).all()
+    assert np.isnan(samples).all()
@@ -1,6 +1,8 @@
 from math import modf, floor
 import numpy as np
 
+from autocnet.io.tiles import tile_cache
+
 
 class Roi():
     """
@@ -166,7 +168,7 @@ class Roi():
         else:
             # Have to reformat to [xstart, ystart, xnumberpixels, ynumberpixels]
             pixels = [pixels[0], pixels[2], pixels[1]-pixels[0]+1, pixels[3]-pixels[2]+1]
-            data = self.data.read_array(pixels=pixels, dtype=self.dtype)
+            data = tile_cache.read_array(self.data, pixels=pixels, dtype=self.dtype)
         return data
 
     def clip(self, dtype=None):
@@ -0,0 +1,166 @@
+from collections import OrderedDict
+import threading
+
+
+class LRUCache(object):
+    """
+    A thread safe least recently used cache bounded by an (estimated)
+    memory budget and/or a number of entries. When adding an entry would
+    exceed either bound, the least recently used entries are evicted.
+    Entries larger than the memory budget are not cached.
+
+    This is the base of the process wide caches (e.g., of cameras, trained
+    matchers, image metadata, and image tiles). Subclasses define the keys,
+    how the entries are sized, and can release the resources of an entry
+    when it is removed by overriding _discard.
+
+    Attributes
+    ----------
+    max_bytes : int
+                The memory budget for the cache in bytes. If None, the
+                size of the entries is not bounded.
+
+    max_entries : int
+                  The maximum number of entries. If None, the number of
+                  entries is not bounded.
+
+    nbytes : int
+             The current estimated size of the cache in bytes
+
+    hits : int
+           The number of successful lookups
+
+    misses : int
+             The number of failed lookups
+
+    evictions : int
+                The number of entries that have been evicted
+    """
+    def __init__(self, max_bytes=None, max_entries=None):
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.RLock()
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def _discard(self, key, value):
+        """
+        Called with each entry that is removed from the cache, e.g., to
+        release the resources held by the value.
+        """
+        pass
+
+    def _get(self, key):
+        """
+        Get an entry and mark it as the most recently used without updating
+        the statistics.
+        """
+        with self._lock:
+            if key not in self._entries:
+                return
+            self._entries.move_to_end(key)
+            return self._entries[key][0]
+
+    def _pop(self, key):
+        with self._lock:
+            value, nbytes = self._entries.pop(key)
+            self.nbytes -= nbytes
+        self._discard(key, value)
+        return value
+
+    def _full(self):
+        return ((self.max_bytes is not None and self.nbytes > self.max_bytes) or
+                (self.max_entries is not None and len(self._entries) > self.max_entries))
+
+    def get(self, key):
+        """
+        Get an entry from the cache and mark it as the most recently used.
+
+        Parameters
+        ----------
+        key : hashable
+              The cache key
+
+        Returns
+        -------
+         : object
+           The cached value or None if the key is not in the cache
+        """
+        with self._lock:
+            if key not in self._entries:
+                self.misses += 1
+                return
+            self.hits += 1
+            return self._get(key)
+
+    def put(self, key, value, nbytes=0):
+        """
+        Add an entry to the cache, replacing any entry with the same key and
+        evicting the least recently used entries as needed to stay within
+        the bounds.
+
+        Parameters
+        ----------
+        key : hashable
+              The cache key
+
+        value : object
+                The value to cache
+
+        nbytes : int
+                 The estimated size of the value in bytes
+        """
+        if self.max_bytes is not None and nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            while self._full():
+                self._pop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, key):
+        """
+        Remove an entry from the cache, if present.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._pop(key)
+
+    def clear(self):
+        """
+        Remove all entries from the cache and reset the statistics.
+        """
+        with self._lock:
+            for key in list(self._entries):
+                self._pop(key)
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    @property
+    def stats(self):
+        """
+        A dict of cache statistics
+        """
+        lookups = self.hits + self.misses
+        return {'hits':self.hits,
+                'misses':self.misses,
+                'evictions':self.evictions,
+                'hit_rate':self.hits / lookups if lookups else 0.0,
+                'size':len(self),
+                'nbytes':self.nbytes,
+                'max_bytes':self.max_bytes,
+                'max_entries':self.max_entries}
@@ -1,5 +1,6 @@
 from base64 import encodebytes, decodebytes
 import datetime
+import hashlib
 import json
 
 import dill
@@ -33,4 +34,22 @@ def object_hook(dct):
             except: pass
             dct[k] = v
     return dct
-        
\ No newline at end of file
+        
+
+def config_hash(config):
+    """
+    Compute a stable, content based hash of a configuration dict. Dicts
+    with the same content hash to the same value regardless of key order.
+
+    Parameters
+    ----------
+    config : dict
+             The configuration to hash
+
+    Returns
+    -------
+     : str
+       The hex digest of the configuration
+    """
+    serialized = json.dumps(config, sort_keys=True, cls=JsonEncoder)
+    return hashlib.sha256(serialized.encode()).hexdigest()
@@ -0,0 +1,51 @@
+import pytest
+
+from autocnet.utils.lru import LRUCache
+
+
+class DiscardingCache(LRUCache):
+    def __init__(self, *args, **kwargs):
+        super(DiscardingCache, self).__init__(*args, **kwargs)
+        self.discarded = []
+
+    def _discard(self, key, value):
+        self.discarded.append(key)
+
+def test_max_entries():
+    cache = LRUCache(max_entries=2)
+    cache.put(1, 'a')
+    cache.put(2, 'b')
+    cache.get(1)
+    cache.put(3, 'c')
+    assert 2 not in cache
+    assert len(cache) == 2
+    assert cache.evictions == 1
+
+def test_max_bytes_and_entries():
+    cache = LRUCache(max_bytes=100, max_entries=3)
+    cache.put(1, 'a', nbytes=60)
+    cache.put(2, 'b', nbytes=60)
+    assert 1 not in cache
+    # Too large to cache
+    cache.put(3, 'c', nbytes=101)
+    assert 3 not in cache
+    assert cache.nbytes == 60
+
+def test_unbounded():
+    cache = LRUCache()
+    for i in range(100):
+        cache.put(i, i, nbytes=2**20)
+    assert len(cache) == 100
+    assert cache.evictions == 0
+
+@pytest.mark.parametrize("remove, expected", [
+    (lambda c: c.invalidate(1), [1]),
+    (lambda c: c.put(1, 'c', nbytes=10), [1]),
+    (lambda c: c.put(3, 'c', nbytes=50), [1]),
+    (lambda c: c.clear(), [1, 2])])
+def test_discard(remove, expected):
+    cache = DiscardingCache(max_bytes=100)
+    cache.put(1, 'a', nbytes=40)
+    cache.put(2, 'b', nbytes=40)
+    remove(cache)
+    assert cache.discarded == expected
@@ -1,6 +1,7 @@
 import unittest
 import numpy as np
 import pandas as pd
+import pytest
 
 from osgeo import ogr
 from .. import utils
@@ -184,3 +185,18 @@ class TestUtils(unittest.TestCase):
         wrapped_func = decorator(func_to_wrap)
 
         self.assertTrue(wrapped_func(1),2)
+
+@pytest.mark.parametrize("walltime, expected", [('30', 1800),
+                                                ('10:30', 630),
+                                                ('01:00:00', 3600),
+                                                ('1-02:00:00', 93600),
+                                                ('2-01', 176400)])
+def test_walltime_to_seconds(walltime, expected):
+    assert utils.walltime_to_seconds(walltime) == expected
+
+@pytest.mark.parametrize("seconds, expected", [(1800, '00:30:00'),
+                                               (630.5, '00:10:31'),
+                                               (93600, '1-02:00:00'),
+                                               (176400, '2-01:00:00')])
+def test_seconds_to_walltime(seconds, expected):
+    assert utils.seconds_to_walltime(seconds) == expected
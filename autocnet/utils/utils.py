@@ -1,6 +1,7 @@
 import importlib
 import itertools
 import json
+import math
 
 from functools import reduce, singledispatch, update_wrapper
 
@@ -603,6 +604,58 @@ def import_func(func):
     return func
 
 
+def walltime_to_seconds(walltime):
+    """
+    Convert a slurm walltime string into a number of seconds.
+
+    Parameters
+    ----------
+    walltime : str
+               In one of the slurm formats: 'MM', 'MM:SS', 'HH:MM:SS',
+               'D-HH', 'D-HH:MM', or 'D-HH:MM:SS'
+
+    Returns
+    -------
+     : int
+       The number of seconds
+    """
+    days = 0
+    if '-' in walltime:
+        days, walltime = walltime.split('-')
+        days = int(days)
+        # With days, the remaining fields start at hours
+        parts = [int(p) for p in walltime.split(':')]
+        hours, minutes, seconds = parts + [0] * (3 - len(parts))
+    else:
+        parts = [int(p) for p in walltime.split(':')]
+        # Without days, a single field is minutes and two fields are minutes:seconds
+        if len(parts) == 1:
+            parts = [0, parts[0], 0]
+        hours, minutes, seconds = [0] * (3 - len(parts)) + parts
+    return ((days * 24 + hours) * 60 + minutes) * 60 + seconds
+
+def seconds_to_walltime(seconds):
+    """
+    Convert a number of seconds into a slurm walltime string.
+
+    Parameters
+    ----------
+    seconds : int
+              The number of seconds. Partial seconds are rounded up.
+
+    Returns
+    -------
+     : str
+       In the slurm 'HH:MM:SS' format or, if longer than a day, 'D-HH:MM:SS'
+    """
+    seconds = int(math.ceil(seconds))
+    minutes, seconds = divmod(seconds, 60)
+    hours, minutes = divmod(minutes, 60)
+    days, hours = divmod(hours, 24)
+    if days:
+        return f'{days}-{hours:02d}:{minutes:02d}:{seconds:02d}'
+    return f'{hours:02d}:{minutes:02d}:{seconds:02d}'
+
 def compute_depression(input_dem, scale_factor=1, curvature_percentile=75):
     """
     Compute depressions and return a new image with larges depressions filled in. 
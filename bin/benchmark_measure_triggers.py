@@ -0,0 +1,136 @@
+"""
+Benchmark the statement level point validation and image ignore triggers
+against a large control network.
+
+This is not run as part of the test suite. It creates (or reuses) a
+database on a local PostgreSQL >= 10 / PostGIS server, e.g., the db
+service in services/docker-compose.yml, fills it with a synthetic network
+and times the bulk updates that fire the triggers. The points, measures,
+and images tables of the database are truncated, so do not point it at a
+project database.
+
+Example
+-------
+    docker run -d --name acn_bench -p 35432:5432 -e POSTGRES_PASSWORD=bench postgis/postgis:12-3.1-alpine
+    python bin/benchmark_measure_triggers.py --port 35432 --password bench
+"""
+import argparse
+import time
+
+import numpy as np
+import sqlalchemy
+from sqlalchemy import orm
+
+from autocnet.io.db.controlnetwork import copy_rows, MeasureUpdateSink
+from autocnet.io.db.model import try_db_creation
+from autocnet.io.db.triggers import upgrade_triggers
+
+
+def parse_arguments():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--host', default='localhost', help='The database host')
+    parser.add_argument('--port', default=5432, type=int, help='The database port')
+    parser.add_argument('--username', default='postgres', help='The database user')
+    parser.add_argument('--password', default='', help='The database password')
+    parser.add_argument('--name', default='autocnet_benchmark', help='The name of the database to create or reuse')
+    parser.add_argument('--measures', default=1000000, type=int, help='The total number of measures')
+    parser.add_argument('--measures_per_point', default=4, type=int, help='The number of measures in each point')
+    parser.add_argument('--images', default=1000, type=int, help='The number of images')
+    parser.add_argument('--fraction', default=0.1, type=float,
+                        help='The fraction of the measures (and images) updated by each benchmark')
+    parser.add_argument('--seed', default=42, type=int)
+    return parser.parse_args()
+
+def timed(label, func):
+    t0 = time.perf_counter()
+    res = func()
+    print(f'{label}: {time.perf_counter() - t0:.2f}s')
+    return res
+
+def populate(session, nimages, nmeasures, measures_per_point):
+    """
+    Write a synthetic network with nmeasures measures spread over
+    nmeasures / measures_per_point points. Each measure is on a random image.
+    """
+    session.execute('TRUNCATE TABLE measures, points, images RESTART IDENTITY CASCADE;')
+    cursor = session.connection().connection.cursor()
+
+    serials = [f'BENCH/{i}' for i in range(nimages)]
+    copy_rows(cursor, 'images', ['id', 'serial', 'ignore'],
+              ((i + 1, s, False) for i, s in enumerate(serials)))
+
+    npoints = nmeasures // measures_per_point
+    copy_rows(cursor, 'points', ['id', 'pointType', 'pointIgnore'],
+              ((i + 1, 2, False) for i in range(npoints)))
+
+    imageids = np.random.randint(0, nimages, size=npoints * measures_per_point)
+    rows = ((i + 1, i // measures_per_point + 1, imageid + 1, serials[imageid], 0, False, False, 0.0, 0.0)
+            for i, imageid in enumerate(imageids))
+    copy_rows(cursor, 'measures', ['id', 'pointid', 'imageid', 'serialnumber', 'measureType',
+                                   'measureIgnore', 'measureJigsawRejected', 'sample', 'line'], rows)
+    session.commit()
+    session.execute('ANALYZE images; ANALYZE points; ANALYZE measures;')
+    session.commit()
+    return npoints * measures_per_point
+
+def count_ignored_points(session):
+    return session.execute('SELECT COUNT(*) FROM points WHERE "pointIgnore";').scalar()
+
+def main(args):
+    np.random.seed(args.seed)
+    db_uri = 'postgresql://{}:{}@{}:{}/{}'.format(args.username, args.password,
+                                                  args.host, args.port, args.name)
+    engine = sqlalchemy.create_engine(db_uri, poolclass=sqlalchemy.pool.NullPool)
+    with engine.connect() as conn:
+        version = conn.execute('SHOW server_version_num;').scalar()
+    if int(version) < 100000:
+        raise Exception('The triggers use transition tables, which require PostgreSQL >= 10. '
+                        f'The server is version {version}.')
+
+    config = {'spatial': {'latitudinal_srid': 4326,
+                          'rectangular_srid': 4978,
+                          'semimajor_rad': 3396190,
+                          'semiminor_rad': 3376200}}
+    try_db_creation(engine, config)
+    # A reused database may have been created with older triggers
+    upgrade_triggers(engine)
+    Session = orm.sessionmaker(bind=engine, autocommit=False)
+    session = Session()
+
+    nmeasures = timed('Populate', lambda: populate(session, args.images, args.measures, args.measures_per_point))
+    print(f'{nmeasures} measures in {nmeasures // args.measures_per_point} points on {args.images} images')
+    nupdate = int(nmeasures * args.fraction)
+
+    # A mass update of the measures in a single statement
+    ids = np.random.choice(np.arange(1, nmeasures + 1), size=nupdate, replace=False).tolist()
+    def ignore_measures():
+        session.execute('UPDATE measures SET "measureIgnore" = True WHERE id = ANY(:ids);', {'ids':ids})
+        session.commit()
+    timed(f'UPDATE of {nupdate} measures', ignore_measures)
+    print(f'  {count_ignored_points(session)} points ignored')
+
+    # The same number of updates through the bulk sink, e.g., subpixel registration
+    ids = np.random.choice(np.arange(1, nmeasures + 1), size=nupdate, replace=False)
+    def flush_sink():
+        sink = MeasureUpdateSink(None, max_rows=None)
+        for i in ids:
+            sink.add(int(i), sample=1.5, line=2.5, ignore=bool(i % 2))
+        nupdated = sink.flush(session=session)
+        session.commit()
+        return nupdated
+    timed(f'MeasureUpdateSink flush of {nupdate} measures', flush_sink)
+    print(f'  {count_ignored_points(session)} points ignored')
+
+    # Ignoring images cascades to the measures and then to the points
+    nimages = max(1, int(args.images * args.fraction))
+    imageids = np.random.choice(np.arange(1, args.images + 1), size=nimages, replace=False).tolist()
+    def ignore_images():
+        session.execute('UPDATE images SET ignore = True WHERE id = ANY(:ids);', {'ids':imageids})
+        session.commit()
+    timed(f'UPDATE of {nimages} images', ignore_images)
+    print(f'  {count_ignored_points(session)} points ignored')
+
+    session.close()
+
+if __name__ == '__main__':
+    main(parse_arguments())